@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class DashboardConfig(AppConfig):
     name = 'backend.dashboard'
     verbose_name = 'Dashboard'
+
+    def ready(self):
+        from backend.dashboard import signals
@@ -0,0 +1,76 @@
+import hashlib
+import time
+
+from django.core.cache import cache
+from django.core.files.storage import get_storage_class
+from django.db import transaction
+
+from ..metrics import increment_counter
+
+USER_GENERATION_KEY = 'dashboard.generation:{user_id}'
+USER_FRAGMENT_KEY = 'dashboard.fragment:{user_id}:{generation}:{media_url_window}:{name}:{vary_on}'
+USER_FRAGMENT_TIMEOUT = 3600
+
+
+def get_media_url_window():
+    # The window the media urls rendered now are signed for (see MediaStorage.url), None when the storage urls never expire.
+    url_cache_window = getattr(get_storage_class(), 'url_cache_window', None)
+    if url_cache_window is None:
+        return None
+    return int(time.time()) // url_cache_window
+
+
+def get_media_url_window_timeout():
+    # Seconds left in the current window, None when the storage urls never expire.
+    url_cache_window = getattr(get_storage_class(), 'url_cache_window', None)
+    if url_cache_window is None:
+        return None
+    return url_cache_window - int(time.time()) % url_cache_window
+
+
+def get_user_generation(user_id):
+    # Every cached fragment of a user is keyed by the generation of the user, so bumping it drops all of them without looking a key up.
+    key = USER_GENERATION_KEY.format(user_id=user_id)
+    generation = cache.get(key)
+    if generation is None:
+        # A lost generation starts again from the clock, so it never goes back to the generation of a fragment still cached.
+        cache.add(key, time.time_ns(), timeout=None)
+        generation = cache.get(key)
+    return generation
+
+
+def bump_user_generation(user_id):
+    if user_id is None:
+        return
+    key = USER_GENERATION_KEY.format(user_id=user_id)
+    try:
+        cache.incr(key)
+        # The incr() of some backends is a get and a set with the default timeout.
+        cache.touch(key, timeout=None)
+    except ValueError:
+        cache.set(key, time.time_ns(), timeout=None)
+    increment_counter(name='dashboard.cache.bump')
+
+
+def bump_user_generation_on_commit(user_id):
+    # Bumped once the change is visible, so a render running in between cannot cache the old rows under the new generation.
+    transaction.on_commit(lambda: bump_user_generation(user_id=user_id))
+
+
+def get_user_fragment_key(user_id, name, vary_on):
+    vary_on = hashlib.md5(':'.join(str(value) for value in vary_on).encode('utf-8')).hexdigest()
+    return USER_FRAGMENT_KEY.format(user_id=user_id, generation=get_user_generation(user_id=user_id), media_url_window=get_media_url_window(), name=name, vary_on=vary_on)
+
+
+def get_user_fragment(user_id, name, vary_on, render):
+    key = get_user_fragment_key(user_id=user_id, name=name, vary_on=vary_on)
+    fragment = cache.get(key)
+    if fragment is not None:
+        increment_counter(name='dashboard.cache.hit')
+        return fragment
+    increment_counter(name='dashboard.cache.miss')
+    fragment = render()
+    # The fragments hold presigned media urls, so they are kept at most until the end of the window the urls were signed in.
+    media_url_window_timeout = get_media_url_window_timeout()
+    cache.set(key, fragment, timeout=USER_FRAGMENT_TIMEOUT if media_url_window_timeout is None else min(USER_FRAGMENT_TIMEOUT, media_url_window_timeout))
+    return fragment
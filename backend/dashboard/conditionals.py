@@ -0,0 +1,72 @@
+import hashlib
+
+from django.contrib.messages import get_messages
+from django.db.models import (
+    Count,
+    Max,
+)
+from django.utils.cache import (
+    get_conditional_response,
+    patch_cache_control,
+)
+from django.utils.http import (
+    http_date,
+    quote_etag,
+)
+
+from .caches import get_media_url_window
+
+
+def get_list_validators(key, querysets):
+    # One aggregate query per queryset: the newest updated_at catches the created and updated rows, the count catches the deleted ones.
+    parts = [key]
+    last_modified = None
+    for queryset in querysets:
+        aggregates = queryset.order_by().aggregate(count=Count('pk'), updated_at=Max('updated_at'))
+        updated_at = aggregates['updated_at']
+        parts.append('{count}:{updated_at}'.format(count=aggregates['count'], updated_at=updated_at.isoformat() if updated_at else ''))
+        if updated_at is not None and (last_modified is None or updated_at > last_modified):
+            last_modified = updated_at
+    etag = quote_etag(hashlib.md5('|'.join(parts).encode('utf-8')).hexdigest())
+    return etag, last_modified
+
+
+class ConditionalListMixin:
+    # Last-Modified only moves with the created and updated rows, the deleted ones change the ETag alone.
+    # A list showing presigned media urls also changes its ETag with their window.
+    list_media_urls = False
+
+    def has_list_media_urls(self):
+        return self.list_media_urls
+
+    def get_list_validator_key(self):
+        request = self.request
+        return '{user}:{session}:{accept}:{path}:{media_url_window}'.format(
+            user=request.user.pk,
+            session=request.session.session_key if hasattr(request, 'session') else '',
+            accept=request.META.get('HTTP_ACCEPT', ''),
+            path=request.get_full_path(),
+            media_url_window=get_media_url_window() if self.has_list_media_urls() else '',
+        )
+
+    def get_list_validator_querysets(self):
+        # Returns the querysets whose rows the response shows, or None when the response cannot be validated.
+        raise NotImplementedError('subclasses of ConditionalListMixin must provide a get_list_validator_querysets() method')
+
+    def get_conditional_list_response(self, request, get_response):
+        querysets = self.get_list_validator_querysets()
+        # A pending message is shown once by the next render, so that render is never skipped.
+        if querysets is None or request.method not in ('GET', 'HEAD', ) or len(get_messages(request)):
+            return get_response()
+        etag, last_modified = get_list_validators(key=self.get_list_validator_key(), querysets=querysets)
+        last_modified = int(last_modified.timestamp()) if last_modified else None
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = get_response()
+        if not response.has_header('ETag'):
+            response['ETag'] = etag
+        if last_modified and not response.has_header('Last-Modified'):
+            response['Last-Modified'] = http_date(last_modified)
+        # The lists belong to the user, and the browser asks again on every visit so a changed list is never served from its cache.
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
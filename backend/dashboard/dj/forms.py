@@ -1,7 +1,12 @@
+from django.core.exceptions import ValidationError
 from django.forms import (
     ModelForm,
 )
 
+from ...media.handlers import (
+    get_upload_error,
+    get_upload_sha256,
+)
 from ..models import (
     AlbumModel,
     ImageModel,
@@ -72,3 +77,13 @@ class ImageUpdateForm(ModelForm):
         super(ImageUpdateForm, self).__init__(*args, **kwargs)
         self.fields['title'].widget.attrs['autofocus'] = True
         self.fields['album'].queryset = AlbumModel.objects.all().filter(user__id=self.request.user.id)
+
+    def clean_image(self):
+        error = get_upload_error(request=self.request, field_name='image')
+        if error:
+            raise ValidationError(message=error)
+        image = self.cleaned_data.get('image')
+        sha256 = get_upload_sha256(request=self.request, field_name='image')
+        if image and sha256:
+            image.upload_sha256 = sha256
+        return image
@@ -5,6 +5,9 @@ from django.urls import (
 
 from .views import (
     DashboardView,
+    DashboardUserAlbumView,
+    DashboardUserImageView,
+    DashboardAlbumImageView,
     AlbumListView,
     AlbumCreateView,
     AlbumDetailView,
@@ -20,6 +23,15 @@ from .views import (
 app_name = 'dashboard.dj'
 urlpatterns = [
     path(route='', view=DashboardView.as_view(), name='index'),
+    path(route='tree/', view=include([
+        path(route='user/<int:pk>/', view=include([
+            path(route='album/', view=DashboardUserAlbumView.as_view(), name='tree-user-album'),
+            path(route='image/', view=DashboardUserImageView.as_view(), name='tree-user-image'),
+        ])),
+        path(route='album/<int:pk>/', view=include([
+            path(route='image/', view=DashboardAlbumImageView.as_view(), name='tree-album-image'),
+        ])),
+    ])),
     path(route='album/', view=include([
         path(route='', view=AlbumListView.as_view(), name='album-list'),
         path(route='create/', view=AlbumCreateView.as_view(), name='album-create'),
@@ -19,6 +19,12 @@ from .forms import (
     ImageCreateForm,
     ImageUpdateForm,
 )
+from ..conditionals import ConditionalListMixin
+from ..keysets import (
+    decode_keyset_cursor,
+    encode_keyset_cursor,
+    get_keyset_page,
+)
 from ..models import (
     AlbumModel,
     ImageModel,
@@ -30,20 +36,74 @@ class DashboardView(AuthLoginRequiredMixin, TemplateView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['users'] = get_user_model().objects.all()
-        context['albums'] = AlbumModel.objects.all()
-        context['images'] = ImageModel.objects.all()
+        # Only the users are paged here, their albums and images are loaded by the tree views.
+        after = self.request.GET.get('after')
+        users, next_after = get_keyset_page(
+            queryset=get_user_model().objects.all().only('id', 'username', 'first_name', 'last_name'),
+            ordering=('username', ),
+            after=[after] if after else None,
+        )
+        context['users'] = users
+        context['next_after'] = next_after[0] if next_after else None
+        return context
+
+
+class DashboardTreeView(AuthLoginRequiredMixin, TemplateView):
+    ordering = None
+
+    def get_queryset(self):
+        raise NotImplementedError('subclasses of DashboardTreeView must provide a get_queryset() method')
+
+    def get_context_data(self, **kwargs):
+        context = super(DashboardTreeView, self).get_context_data(**kwargs)
+        object_list, next_after = get_keyset_page(
+            queryset=self.get_queryset(),
+            ordering=self.ordering,
+            after=decode_keyset_cursor(cursor=self.request.GET.get('after'), length=len(self.ordering)),
+        )
+        context['object_list'] = object_list
+        context['next_cursor'] = encode_keyset_cursor(values=next_after) if next_after else None
         return context
 
 
-class AlbumListView(AuthLoginRequiredMixin, ListView):
+class DashboardUserAlbumView(DashboardTreeView):
+    template_name = 'mobelux/dashboard/index-album.html'
+    ordering = ('name', 'id', )
+
+    def get_queryset(self):
+        return AlbumModel.objects.all().filter(user__id=self.kwargs.get('pk')).only('id', 'name')
+
+
+class DashboardUserImageView(DashboardTreeView):
+    template_name = 'mobelux/dashboard/index-image.html'
+    ordering = ('title', 'id', )
+
+    def get_queryset(self):
+        return ImageModel.objects.all().filter(user__id=self.kwargs.get('pk'), album__isnull=True).only('id', 'title', 'image', 'image_derivatives_ready')
+
+
+class DashboardAlbumImageView(DashboardTreeView):
+    template_name = 'mobelux/dashboard/index-image.html'
+    ordering = ('title', 'id', )
+
+    def get_queryset(self):
+        return ImageModel.objects.all().filter(album__id=self.kwargs.get('pk')).only('id', 'title', 'image', 'image_derivatives_ready')
+
+
+class AlbumListView(AuthLoginRequiredMixin, ConditionalListMixin, ListView):
     model = AlbumModel
     template_name = 'mobelux/dashboard/album-list.html'
 
+    def get(self, request, *args, **kwargs):
+        return self.get_conditional_list_response(request=request, get_response=lambda: super(AlbumListView, self).get(request, *args, **kwargs))
+
     def get_queryset(self):
         self.queryset = self.model.objects.all().filter(user__id=self.request.user.id)
         return super(AlbumListView, self).get_queryset()
 
+    def get_list_validator_querysets(self):
+        return [self.get_queryset()]
+
 
 class AlbumCreateView(AuthLoginRequiredMixin, CreateView):
     model = AlbumModel
@@ -108,14 +168,22 @@ class AlbumDeleteView(AuthLoginRequiredMixin, DeleteView):
         return super(AlbumDeleteView, self).get_success_url()
 
 
-class ImageListView(AuthLoginRequiredMixin, ListView):
+class ImageListView(AuthLoginRequiredMixin, ConditionalListMixin, ListView):
     model = ImageModel
     template_name = 'mobelux/dashboard/image-list.html'
+    list_media_urls = True
+
+    def get(self, request, *args, **kwargs):
+        return self.get_conditional_list_response(request=request, get_response=lambda: super(ImageListView, self).get(request, *args, **kwargs))
 
     def get_queryset(self):
         self.queryset = self.model.objects.all().filter(user__id=self.request.user.id)
         return super(ImageListView, self).get_queryset()
 
+    def get_list_validator_querysets(self):
+        queryset = self.get_queryset()
+        return [queryset, AlbumModel.objects.filter(pk__in=queryset.values('album'))]
+
 
 class ImageCreateView(AuthLoginRequiredMixin, CreateView):
     model = ImageModel
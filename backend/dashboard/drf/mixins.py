@@ -0,0 +1,236 @@
+from collections import OrderedDict
+from contextlib import nullcontext
+
+from django.db import (
+    connection,
+    transaction,
+)
+from rest_framework.exceptions import ParseError
+from rest_framework.relations import RelatedField
+from rest_framework.response import Response
+from rest_framework.status import (
+    HTTP_200_OK,
+    HTTP_201_CREATED,
+    HTTP_204_NO_CONTENT,
+    HTTP_400_BAD_REQUEST,
+    HTTP_404_NOT_FOUND,
+    HTTP_424_FAILED_DEPENDENCY,
+)
+
+BULK_MAX_ITEMS = 500
+
+
+class SparseFieldsetViewMixin:
+    # Reads "?fields=id,name" and "?include=user" on the safe methods, the writes keep the whole serializer.
+    include_choices = ()
+
+    def get_sparse_fieldset(self):
+        if self.request.method not in ('GET', 'HEAD', 'OPTIONS', ):
+            return None, ()
+        fields = self.request.query_params.get('fields')
+        if fields is not None:
+            fields = [name.strip() for name in fields.split(',') if name.strip()]
+        include = [name.strip() for name in self.request.query_params.get('include', '').split(',') if name.strip()]
+        for name in include:
+            if name not in self.include_choices:
+                raise ParseError('Invalid include "{name}", the choices are: {choices}.'.format(name=name, choices=', '.join(self.include_choices)))
+        return fields, include
+
+    def get_serializer(self, *args, **kwargs):
+        fields, include = self.get_sparse_fieldset()
+        kwargs.setdefault('fields', fields)
+        kwargs.setdefault('include', include)
+        return super(SparseFieldsetViewMixin, self).get_serializer(*args, **kwargs)
+
+    def get_included_queryset(self, queryset):
+        fields, include = self.get_sparse_fieldset()
+        return self.include_queryset(queryset=queryset, include=include)
+
+    def include_queryset(self, queryset, include):
+        return queryset
+
+
+class ValuesListMixin:
+    # The included relations need the model instances, so those lists keep the serializer.
+    def list(self, request, *args, **kwargs):
+        fields, include = self.get_sparse_fieldset()
+        serializer_class = self.get_serializer_class()
+        if include or not hasattr(serializer_class, 'values_to_representation'):
+            return super(ValuesListMixin, self).list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset()).values(*serializer_class.Meta.values_fields)
+        page = self.paginate_queryset(queryset)
+        data = [serializer_class.values_to_representation(row=row) for row in (queryset if page is None else page)]
+        if fields is not None:
+            data = [OrderedDict((name, value) for name, value in row.items() if name in fields) for row in data]
+        if page is None:
+            return Response(data=data)
+        return self.get_paginated_response(data)
+
+
+class BulkModelMixin:
+    # Every write batch runs in one transaction, an invalid item writes nothing.
+    bulk_max_items = BULK_MAX_ITEMS
+
+    def get_bulk_queryset(self):
+        raise NotImplementedError('subclasses of BulkModelMixin must provide a get_bulk_queryset() method')
+
+    def bulk_changed(self, objects, created=False):
+        # Called with the rows written without sending the model signals, the updated ones still hold the values they were loaded with.
+        pass
+
+    def get_bulk_write_context(self):
+        # Wraps every write batch, inside its transaction.
+        return nullcontext()
+
+    def get_bulk_pks(self):
+        pks = [pk.strip() for pk in self.request.query_params.get('pk', '').split(',') if pk.strip()]
+        if not pks:
+            raise ParseError('Expected a list of primary keys in "?pk=".')
+        try:
+            pks = [int(pk) for pk in pks]
+        except ValueError:
+            raise ParseError('Invalid primary key in "?pk=", expected integers.')
+        return self.check_bulk_size(items=list(dict.fromkeys(pks)))
+
+    def get_bulk_items(self):
+        if not isinstance(self.request.data, list):
+            raise ParseError('Expected a list of items.')
+        return self.check_bulk_size(items=self.request.data)
+
+    def check_bulk_size(self, items):
+        if len(items) > self.bulk_max_items:
+            raise ParseError('A batch holds at most {max_items} items.'.format(max_items=self.bulk_max_items))
+        return items
+
+    def get_bulk_serializer_context(self, items):
+        # Loads the rows every item points to with one query per relation, the related fields of the serializer look them up in the context.
+        context = self.get_serializer_context()
+        related_objects = {}
+        for name, field in self.get_serializer().fields.items():
+            if not isinstance(field, RelatedField) or field.read_only:
+                continue
+            pks = set()
+            for item in items:
+                if isinstance(item, dict) and item.get(name) is not None:
+                    pks.add(str(item[name]))
+            queryset = field.get_queryset()
+            related_objects[queryset.model] = {
+                str(pk): obj for pk, obj in queryset.in_bulk([pk for pk in pks if pk.isdigit()]).items()
+            }
+        context['related_objects'] = related_objects
+        return context
+
+    def bulk_response(self, results, status=HTTP_200_OK):
+        return Response(data={'results': results}, status=status)
+
+    def bulk_invalid_response(self, results, pks=None):
+        # The valid items of an invalid batch are answered too, they were not written because of the others.
+        for index, result in enumerate(results):
+            if result is None:
+                results[index] = {'status': HTTP_424_FAILED_DEPENDENCY, 'errors': {'detail': 'Not written, another item of the batch is invalid.'}}
+                if pks is not None:
+                    results[index]['pk'] = pks[index]
+        return self.bulk_response(results=results, status=HTTP_400_BAD_REQUEST)
+
+    def bulk_retrieve(self, request, *args, **kwargs):
+        pks = self.get_bulk_pks()
+        objects = self.get_included_queryset(queryset=self.get_bulk_queryset()).in_bulk(pks)
+        results = []
+        for pk in pks:
+            if pk in objects:
+                results.append({'pk': pk, 'status': HTTP_200_OK, 'data': self.get_serializer(objects[pk]).data})
+            else:
+                results.append({'pk': pk, 'status': HTTP_404_NOT_FOUND, 'errors': {'detail': 'Not found.'}})
+        return self.bulk_response(results=results)
+
+    def bulk_create(self, request, *args, **kwargs):
+        items = self.get_bulk_items()
+        context = self.get_bulk_serializer_context(items=items)
+        serializers = [self.get_serializer_class()(data=item, context=context) for item in items]
+        results = [self.get_bulk_errors(serializer=serializer) for serializer in serializers]
+        if any(results):
+            return self.bulk_invalid_response(results=results)
+        model = self.get_bulk_queryset().model
+        objects = [model(**serializer.validated_data) for serializer in serializers]
+        with transaction.atomic(), self.get_bulk_write_context():
+            if connection.features.can_return_rows_from_bulk_insert:
+                model.objects.bulk_create(objects)
+                self.bulk_changed(objects=objects, created=True)
+            else:
+                # Without RETURNING the new primary keys are unknown after a bulk insert, so the rows are saved one by one.
+                for obj in objects:
+                    obj.save()
+        return self.bulk_response(results=[
+            {'pk': obj.pk, 'status': HTTP_201_CREATED, 'data': self.get_serializer(obj).data}
+            for obj in objects
+        ], status=HTTP_201_CREATED)
+
+    def bulk_partial_update(self, request, *args, **kwargs):
+        items = self.get_bulk_items()
+        pks = []
+        for item in items:
+            pk = item.get('id') if isinstance(item, dict) else None
+            pks.append(pk if isinstance(pk, int) and not isinstance(pk, bool) else None)
+        seen = set()
+        context = self.get_bulk_serializer_context(items=items)
+        objects = self.get_bulk_queryset().in_bulk([pk for pk in pks if pk is not None])
+        serializers = []
+        results = []
+        for pk, item in zip(pks, items):
+            if pk is None:
+                serializers.append(None)
+                results.append({'pk': None, 'status': HTTP_400_BAD_REQUEST, 'errors': {'id': ['Every item needs its integer "id".']}})
+                continue
+            if pk in seen:
+                serializers.append(None)
+                results.append({'pk': pk, 'status': HTTP_400_BAD_REQUEST, 'errors': {'id': ['Every item needs a different "id".']}})
+                continue
+            seen.add(pk)
+            if pk not in objects:
+                serializers.append(None)
+                results.append({'pk': pk, 'status': HTTP_404_NOT_FOUND, 'errors': {'detail': 'Not found.'}})
+                continue
+            serializer = self.get_serializer_class()(objects[pk], data=item, partial=True, context=context)
+            serializers.append(serializer)
+            results.append(self.get_bulk_errors(serializer=serializer, pk=pk))
+        if any(results):
+            return self.bulk_invalid_response(results=results, pks=pks)
+        fields = set()
+        for serializer in serializers:
+            for attr, value in serializer.validated_data.items():
+                setattr(serializer.instance, attr, value)
+                fields.add(attr)
+        # bulk_update() skips pre_save(), so the auto_now fields are moved forward here.
+        if fields:
+            for field in self.get_bulk_queryset().model._meta.concrete_fields:
+                if getattr(field, 'auto_now', False):
+                    for serializer in serializers:
+                        field.pre_save(serializer.instance, add=False)
+                    fields.add(field.name)
+        if fields:
+            with transaction.atomic(), self.get_bulk_write_context():
+                self.get_bulk_queryset().model.objects.bulk_update([serializer.instance for serializer in serializers], fields=sorted(fields))
+                self.bulk_changed(objects=[serializer.instance for serializer in serializers])
+        return self.bulk_response(results=[
+            {'pk': serializer.instance.pk, 'status': HTTP_200_OK, 'data': self.get_serializer(serializer.instance).data}
+            for serializer in serializers
+        ])
+
+    def bulk_destroy(self, request, *args, **kwargs):
+        pks = self.get_bulk_pks()
+        with transaction.atomic(), self.get_bulk_write_context():
+            found = set(self.get_bulk_queryset().filter(pk__in=pks).select_for_update().values_list('pk', flat=True))
+            # The delete sends the model signals.
+            self.get_bulk_queryset().filter(pk__in=found).delete()
+        return self.bulk_response(results=[
+            {'pk': pk, 'status': HTTP_204_NO_CONTENT} if pk in found else {'pk': pk, 'status': HTTP_404_NOT_FOUND, 'errors': {'detail': 'Not found.'}}
+            for pk in pks
+        ])
+
+    def get_bulk_errors(self, serializer, pk=None):
+        if serializer.is_valid():
+            return None
+        result = {'status': HTTP_400_BAD_REQUEST, 'errors': serializer.errors}
+        if pk is not None:
+            result['pk'] = pk
+        return result
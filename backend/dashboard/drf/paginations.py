@@ -0,0 +1,71 @@
+from collections import OrderedDict
+
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+from ..keysets import (
+    decode_keyset_cursor,
+    encode_keyset_cursor,
+    get_keyset_page,
+)
+
+
+class KeysetPagination(BasePagination):
+    # The last field of the ordering must be unique.
+    ordering = ('id', )
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        cursor = request.query_params.get(self.cursor_query_param)
+        after = decode_keyset_cursor(cursor=cursor, length=len(self.ordering))
+        if cursor and after is None:
+            raise NotFound(self.invalid_cursor_message)
+        page, next_after = get_keyset_page(queryset=queryset, ordering=self.ordering, after=after, size=self.get_page_size(request=request))
+        self.next_cursor = encode_keyset_cursor(values=next_after) if next_after else None
+        return page
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            return self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        return replace_query_param(url=self.request.build_absolute_uri(), key=self.cursor_query_param, val=self.next_cursor)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {
+                    'type': 'string',
+                    'nullable': True,
+                },
+                'results': schema,
+            },
+        }
+
+
+class AlbumPagination(KeysetPagination):
+    ordering = ('name', 'id', )
+
+
+class ImagePagination(KeysetPagination):
+    ordering = ('title', 'id', )
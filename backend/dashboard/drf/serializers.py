@@ -1,18 +1,102 @@
+from collections import OrderedDict
+
+from django.contrib.auth import get_user_model
 from rest_framework import serializers
 
+from ...media.derivatives import (
+    DERIVATIVE_THUMBNAIL,
+    DERIVATIVE_MEDIUM,
+)
 from ..models import (
     AlbumModel,
     ImageModel,
+    image_derivative_url,
 )
 
 
-class AlbumSerializer(serializers.ModelSerializer):
+class CachedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    # Looks the related row up in the rows a batch loaded at once into the context, instead of running one query per item.
+    def to_internal_value(self, data):
+        related_objects = self.context.get('related_objects', {}).get(self.get_queryset().model)
+        if related_objects is None:
+            return super(CachedPrimaryKeyRelatedField, self).to_internal_value(data)
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        obj = related_objects.get(str(data))
+        if obj is None:
+            self.fail('does_not_exist', pk_value=data)
+        return obj
+
+
+class SparseFieldsetSerializerMixin:
+    # The included relations are embedded in place of their id, and are always kept.
+    # The queryset must load them with select_related or prefetch_related.
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        include = kwargs.pop('include', None) or ()
+        super(SparseFieldsetSerializerMixin, self).__init__(*args, **kwargs)
+        for name in include:
+            self.fields[name] = self.get_include_field(name=name)
+        if fields is not None:
+            for name in set(self.fields) - set(fields) - set(include):
+                self.fields.pop(name)
+
+    def get_include_field(self, name):
+        raise NotImplementedError('subclasses of SparseFieldsetSerializerMixin must provide a get_include_field() method')
+
+
+class UserSerializer(serializers.ModelSerializer):
     class Meta:
-        model = AlbumModel
-        fields = ('id', 'name', 'is_public', 'user')
+        model = get_user_model()
+        fields = ('id', 'username', 'first_name', 'last_name')
+
 
+class ImageSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
+    serializer_related_field = CachedPrimaryKeyRelatedField
+    image_thumbnail = serializers.CharField(source='get_image_thumbnail_url', read_only=True)
+    image_medium = serializers.CharField(source='get_image_medium_url', read_only=True)
 
-class ImageSerializer(serializers.ModelSerializer):
     class Meta:
         model = ImageModel
-        fields = ('id', 'title', 'album', 'user')
+        fields = ('id', 'title', 'album', 'user', 'image_thumbnail', 'image_medium')
+        # values_to_representation() must give the same output as to_representation().
+        values_fields = ('id', 'title', 'album', 'user', 'image', 'image_derivatives_ready')
+
+    @classmethod
+    def values_to_representation(cls, row):
+        return OrderedDict((
+            ('id', row['id']),
+            ('title', row['title']),
+            ('album', row['album']),
+            ('user', row['user']),
+            ('image_thumbnail', image_derivative_url(name=row['image'], derivatives_ready=row['image_derivatives_ready'], derivative=DERIVATIVE_THUMBNAIL)),
+            ('image_medium', image_derivative_url(name=row['image'], derivatives_ready=row['image_derivatives_ready'], derivative=DERIVATIVE_MEDIUM)),
+        ))
+
+    def get_include_field(self, name):
+        if name == 'album':
+            return AlbumSerializer(read_only=True)
+        return UserSerializer(read_only=True)
+
+
+class AlbumSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
+    serializer_related_field = CachedPrimaryKeyRelatedField
+
+    class Meta:
+        model = AlbumModel
+        fields = ('id', 'name', 'is_public', 'user')
+        values_fields = ('id', 'name', 'is_public', 'user')
+
+    @classmethod
+    def values_to_representation(cls, row):
+        return OrderedDict((
+            ('id', row['id']),
+            ('name', row['name']),
+            ('is_public', row['is_public']),
+            ('user', row['user']),
+        ))
+
+    def get_include_field(self, name):
+        if name == 'images':
+            return ImageSerializer(source='images_album', many=True, read_only=True)
+        return UserSerializer(read_only=True)
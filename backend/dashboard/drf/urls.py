@@ -5,6 +5,7 @@ from django.urls import (
 
 from .views import (
     DashboardView,
+    SyncView,
     AlbumViewSet,
     ImageViewSet,
 )
@@ -12,6 +13,7 @@ from .views import (
 app_name = 'dashboard.drf'
 urlpatterns = [
     path(route='', view=DashboardView.as_view(), name='index'),
+    path(route='sync/', view=SyncView.as_view(), name='sync'),
 
     re_path(route='^album/$', view=AlbumViewSet.as_view({
         'get': 'retrieve',
@@ -23,6 +25,12 @@ urlpatterns = [
     re_path(route='^album/user/$', view=AlbumViewSet.as_view({
         'get': 'list',
     })),
+    re_path(route='^album/bulk/$', view=AlbumViewSet.as_view({
+        'get': 'bulk_retrieve',
+        'post': 'bulk_create',
+        'patch': 'bulk_partial_update',
+        'delete': 'bulk_destroy'
+    })),
 
     re_path(route='^image/$', view=ImageViewSet.as_view({
         'get': 'retrieve',
@@ -34,4 +42,16 @@ urlpatterns = [
     re_path(route='^image/album/$', view=ImageViewSet.as_view({
         'get': 'list',
     })),
+    re_path(route='^image/upload/$', view=ImageViewSet.as_view({
+        'post': 'upload',
+    })),
+    re_path(route='^image/upload/finalize/$', view=ImageViewSet.as_view({
+        'post': 'finalize_upload',
+    })),
+    re_path(route='^image/bulk/$', view=ImageViewSet.as_view({
+        'get': 'bulk_retrieve',
+        'post': 'bulk_create',
+        'patch': 'bulk_partial_update',
+        'delete': 'bulk_destroy'
+    })),
 ]
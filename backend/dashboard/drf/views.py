@@ -1,15 +1,62 @@
+import os
+import uuid
+
 from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.validators import get_available_image_extensions
+from django.db.models import Prefetch
 from django.shortcuts import get_object_or_404
+from django.utils.text import get_valid_filename
+from rest_framework.exceptions import (
+    NotFound,
+    ParseError,
+    ValidationError,
+)
+from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.status import (
-    HTTP_200_OK
+    HTTP_200_OK,
+    HTTP_201_CREATED,
+    HTTP_410_GONE,
 )
 from rest_framework.views import APIView
 from rest_framework.viewsets import ModelViewSet
 
+from ...media.uploads import (
+    create_presigned_post,
+    delete_presigned_upload,
+    get_upload_size,
+)
+from ..caches import bump_user_generation_on_commit
+from ..conditionals import ConditionalListMixin
+from ..keysets import (
+    decode_keyset_cursor,
+    encode_keyset_cursor,
+)
 from ..models import (
+    CHANGE_MODEL_ALBUM,
+    CHANGE_MODEL_IMAGE,
     AlbumModel,
     ImageModel,
+    batch_changes,
+    get_change_cursor,
+    get_count_deltas,
+    image_file_upload_name,
+    image_upload_check,
+    image_validate_upload,
+    is_change_cursor_expired,
+    read_changes,
+    record_changes,
+    record_counts,
+)
+from .mixins import (
+    BulkModelMixin,
+    SparseFieldsetViewMixin,
+    ValuesListMixin,
+)
+from .paginations import (
+    AlbumPagination,
+    ImagePagination,
 )
 from .serializers import (
     AlbumSerializer,
@@ -25,11 +72,72 @@ class DashboardView(APIView):
         return Response(data=data, status=HTTP_200_OK)
 
 
-class AlbumViewSet(ModelViewSet):
+class SyncView(APIView):
+    # Without a cursor, answers the cursor to start from, with one the rows changed after it and the ids of the deleted ones.
+    # With "?username=", a row given to another user is answered as deleted.
+    def get(self, request, *args, **kwargs):
+        user_id = None
+        username = request.query_params.get('username')
+        if username:
+            user = get_user_model().objects.filter(username=username).only('id').first()
+            if user is None:
+                raise NotFound('User not found.')
+            user_id = user.id
+        cursor = request.query_params.get('cursor')
+        if not cursor:
+            return Response(data={'cursor': encode_keyset_cursor(values=[get_change_cursor()]), 'has_more': False}, status=HTTP_200_OK)
+        after = decode_keyset_cursor(cursor=cursor, length=1)
+        if after is None or not isinstance(after[0], int):
+            raise ParseError('Invalid cursor.')
+        if is_change_cursor_expired(after=after[0]):
+            return Response(data={'detail': 'The cursor has expired, download the lists again.'}, status=HTTP_410_GONE)
+        current, deleted, last, has_more = read_changes(after=after[0], user_id=user_id)
+        data = {
+            'cursor': encode_keyset_cursor(values=[last]),
+            'has_more': has_more,
+            'albums': AlbumSerializer(current[CHANGE_MODEL_ALBUM], many=True, context={'request': request}).data,
+            'images': ImageSerializer(current[CHANGE_MODEL_IMAGE], many=True, context={'request': request}).data,
+            'deleted': {
+                'albums': deleted[CHANGE_MODEL_ALBUM],
+                'images': deleted[CHANGE_MODEL_IMAGE],
+            },
+        }
+        return Response(data=data, status=HTTP_200_OK)
+
+
+class DashboardBulkModelMixin(BulkModelMixin):
+    # The bulk writes record their changes for the sync, move the counters and drop the cached pages of their users, like the model signals do.
+    def get_bulk_write_context(self):
+        return batch_changes()
+
+    def bulk_changed(self, objects, created=False):
+        changes = set()
+        deltas = []
+        for obj in objects:
+            changes.add((obj.pk, obj.user_id, False, ))
+            if obj.get_tracked_value(name='user') is not None:
+                changes.add((obj.pk, obj.get_tracked_value(name='user'), False, ))
+            deltas.extend(get_count_deltas(instance=obj, created=created))
+        record_changes(model=self.get_bulk_queryset().model, changes=list(changes))
+        record_counts(deltas=deltas)
+        for user_id in set(user_id for pk, user_id, is_deleted in changes):
+            bump_user_generation_on_commit(user_id=user_id)
+
+
+class AlbumViewSet(SparseFieldsetViewMixin, ConditionalListMixin, ValuesListMixin, DashboardBulkModelMixin, ModelViewSet):
     serializer_class = AlbumSerializer
+    pagination_class = AlbumPagination
+    include_choices = ('images', 'user', )
 
     def get_object(self):
-        return get_object_or_404(AlbumModel, pk=self.request.query_params.get('pk'))
+        return get_object_or_404(self.get_included_queryset(queryset=AlbumModel.objects.all()), pk=self.request.query_params.get('pk'))
+
+    def has_list_media_urls(self):
+        fields, include = self.get_sparse_fieldset()
+        return 'images' in include
+
+    def get_bulk_queryset(self):
+        return AlbumModel.objects.all()
 
     def get_queryset(self):
         username = self.request.query_params.get('username')
@@ -37,25 +145,126 @@ class AlbumViewSet(ModelViewSet):
             try:
                 user = get_user_model().objects.get(username=username)
                 if user:
-                    return AlbumModel.objects.filter(user__id=user.id).order_by('name')
+                    return self.get_included_queryset(queryset=AlbumModel.objects.filter(user__id=user.id).order_by('name'))
             except get_user_model().DoesNotExist:
                 return AlbumModel.objects.none()
-        return AlbumModel.objects.all().order_by('name')
+        return self.get_included_queryset(queryset=AlbumModel.objects.all().order_by('name'))
+
+    def list(self, request, *args, **kwargs):
+        return self.get_conditional_list_response(request=request, get_response=lambda: super(AlbumViewSet, self).list(request, *args, **kwargs))
 
+    def get_list_validator_querysets(self):
+        # The users have no updated_at.
+        fields, include = self.get_sparse_fieldset()
+        if 'user' in include:
+            return None
+        queryset = self.filter_queryset(self.get_queryset())
+        if 'images' in include:
+            return [queryset, ImageModel.objects.filter(album__in=queryset.values('pk'))]
+        return [queryset]
 
-class ImageViewSet(ModelViewSet):
+    def include_queryset(self, queryset, include):
+        if 'images' in include:
+            queryset = queryset.prefetch_related(Prefetch('images_album', queryset=ImageModel.objects.order_by('title', 'id')))
+        if 'user' in include:
+            queryset = queryset.select_related('user')
+        return queryset
+
+
+class ImageViewSet(SparseFieldsetViewMixin, ConditionalListMixin, ValuesListMixin, DashboardBulkModelMixin, ModelViewSet):
     serializer_class = ImageSerializer
+    pagination_class = ImagePagination
+    include_choices = ('album', 'user', )
+    list_media_urls = True
 
     def get_object(self):
-        return get_object_or_404(ImageModel, pk=self.request.query_params.get('pk'))
+        return get_object_or_404(self.get_included_queryset(queryset=ImageModel.objects.all()), pk=self.request.query_params.get('pk'))
+
+    def get_upload_object(self):
+        pk = self.request.query_params.get('pk', '')
+        if not pk.isdigit():
+            raise NotFound('Image not found.')
+        return get_object_or_404(ImageModel.objects.filter(user__id=self.request.user.id), pk=int(pk))
+
+    def get_permissions(self):
+        if self.action in ('upload', 'finalize_upload', ):
+            return [IsAuthenticated(), ]
+        return super(ImageViewSet, self).get_permissions()
+
+    def get_bulk_queryset(self):
+        return ImageModel.objects.all()
 
     def get_queryset(self):
         name = self.request.query_params.get('name')
         if name:
-            try:
-                albums = AlbumModel.objects.filter(name=name)
-                if albums:
-                    return ImageModel.objects.filter(album__id=albums[0].id).order_by('title')
-            except AlbumModel.DoesNotExist:
-                return ImageModel.objects.none()
-        return ImageModel.objects.all().order_by('title')
+            queryset = ImageModel.objects.filter(album__name=name)
+            if self.request.query_params.get('mine') in ('1', 'true', ):
+                if not self.request.user.is_authenticated:
+                    return ImageModel.objects.none()
+                queryset = queryset.filter(album__user__id=self.request.user.id)
+            return self.get_included_queryset(queryset=queryset.order_by('title'))
+        return self.get_included_queryset(queryset=ImageModel.objects.all().order_by('title'))
+
+    def list(self, request, *args, **kwargs):
+        return self.get_conditional_list_response(request=request, get_response=lambda: super(ImageViewSet, self).list(request, *args, **kwargs))
+
+    def get_list_validator_querysets(self):
+        fields, include = self.get_sparse_fieldset()
+        if 'user' in include:
+            return None
+        queryset = self.filter_queryset(self.get_queryset())
+        if 'album' in include:
+            return [queryset, AlbumModel.objects.filter(pk__in=queryset.values('album'))]
+        return [queryset]
+
+    def upload(self, request, *args, **kwargs):
+        # The file is only set on the image by finalize_upload(), once it has been checked.
+        filename = get_valid_filename(os.path.basename(str(request.data.get('filename', ''))))
+        if os.path.splitext(filename)[1][1:].lower() not in get_available_image_extensions():
+            raise ValidationError({'filename': ['Expected the name of an image file.']})
+        if request.query_params.get('pk'):
+            instance = self.get_upload_object()
+            status = HTTP_200_OK
+        else:
+            data = request.data.copy()
+            data['user'] = request.user.pk
+            serializer = self.get_serializer(data=data)
+            serializer.is_valid(raise_exception=True)
+            instance = serializer.save()
+            status = HTTP_201_CREATED
+        try:
+            max_size = image_upload_check(user=request.user, arguments={'pk': instance.pk})
+        except DjangoValidationError:
+            raise NotFound('Image not found.')
+        if instance.image_upload_name:
+            delete_presigned_upload(name=instance.image_upload_name)
+        name = image_file_upload_name(filename='{uuid}-{filename}'.format(uuid=uuid.uuid4().hex, filename=filename))
+        ImageModel.objects.filter(pk=instance.pk).update(image_upload_name=name)
+        upload = create_presigned_post(name=name, max_size=max_size)
+        upload['url'] = request.build_absolute_uri(upload['url'])
+        return Response(data={'image': self.get_serializer(instance).data, 'upload': upload}, status=status)
+
+    def finalize_upload(self, request, *args, **kwargs):
+        instance = self.get_upload_object()
+        name = instance.image_upload_name
+        if not name:
+            raise ValidationError({'image': ['The image has no pending upload.']})
+        try:
+            metadata = image_validate_upload(name=name)
+        except DjangoValidationError as e:
+            # A file not uploaded yet can still be, an invalid one is deleted.
+            if get_upload_size(name=name) is not None:
+                delete_presigned_upload(name=name)
+                ImageModel.objects.filter(pk=instance.pk, image_upload_name=name).update(image_upload_name='')
+            raise ValidationError({'image': e.messages})
+        instance.image = name
+        instance.image_upload_name = ''
+        instance.set_image_metadata(metadata=metadata)
+        instance.save()
+        return Response(data=self.get_serializer(instance).data, status=HTTP_200_OK)
+
+    def include_queryset(self, queryset, include):
+        related = [name for name in ('album', 'user', ) if name in include]
+        if related:
+            queryset = queryset.select_related(*related)
+        return queryset
@@ -0,0 +1,107 @@
+"""Query plans of the album and image lists, a plan that scans a whole dashboard table or sorts its rows fails the tests and the dashboard_explain command."""
+import re
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.client import RequestFactory
+from rest_framework.request import Request
+
+from .drf.paginations import (
+    AlbumPagination,
+    ImagePagination,
+)
+from .drf.views import (
+    AlbumViewSet,
+    ImageViewSet,
+)
+from .dj.views import (
+    AlbumListView,
+    ImageListView,
+    DashboardUserAlbumView,
+    DashboardUserImageView,
+    DashboardAlbumImageView,
+)
+from .keysets import filter_keyset_queryset
+from .models import (
+    AlbumModel,
+    ImageModel,
+)
+
+EXPLAIN_USERNAME = 'dashboard-explain'
+EXPLAIN_ALBUM_NAME = 'dashboard-explain'
+EXPLAIN_VENDORS = ('sqlite', 'postgresql', 'mysql', )
+
+
+def is_full_scan(plan, allow_sort=False):
+    # The rows of several albums cannot be read in the order of one index, so their lists may sort the rows they found through it.
+    for line in plan.splitlines():
+        # SQLite prefixes every step with its id, its parent id and an unused column.
+        line = re.sub(r'^\d+ \d+ \d+ ', '', line.strip()).strip(' -|`>')
+        if connection.vendor == 'sqlite':
+            if line.startswith('USE TEMP B-TREE FOR ORDER BY') and not allow_sort:
+                return True
+            if line.startswith('SCAN') and 'mobelux_dashboard_' in line and 'USING' not in line:
+                return True
+        elif connection.vendor == 'postgresql':
+            if line.startswith('Seq Scan on mobelux_dashboard_') or (line.startswith('Sort ') and not allow_sort):
+                return True
+        elif connection.vendor == 'mysql':
+            if ('Using filesort' in line and not allow_sort) or '"access_type": "ALL"' in line:
+                return True
+    return False
+
+
+def prepare_explain():
+    # The tables are small here, so PostgreSQL is told to prefer the indexes as it would with the real number of rows.
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+
+
+def explain_queryset(queryset):
+    return queryset.explain(format='JSON') if connection.vendor == 'mysql' else queryset.explain()
+
+
+def create_explain_rows():
+    # Some views look up the user or the album before building their queryset.
+    user = get_user_model().objects.create(username=EXPLAIN_USERNAME)
+    album = AlbumModel.objects.create(name=EXPLAIN_ALBUM_NAME, user=user)
+    ImageModel.objects.create(title=EXPLAIN_ALBUM_NAME, album=album, user=user)
+    return user, album
+
+
+def get_view(view_class, request, user, kwargs):
+    request.user = user
+    view = view_class()
+    view.setup(request, **kwargs)
+    return view
+
+
+def get_explain_querysets(user, album):
+    # Yields (label, queryset, allow_sort) for the first and the next pages of every list.
+    factory = RequestFactory()
+    for view_class, kwargs in (
+        (DashboardUserAlbumView, {'pk': user.pk}),
+        (DashboardUserImageView, {'pk': user.pk}),
+        (DashboardAlbumImageView, {'pk': album.pk}),
+    ):
+        view = get_view(view_class=view_class, request=factory.get(path='/'), user=user, kwargs=kwargs)
+        yield view_class.__name__, filter_keyset_queryset(queryset=view.get_queryset(), ordering=view.ordering), False
+        yield '{name} (next page)'.format(name=view_class.__name__), filter_keyset_queryset(queryset=view.get_queryset(), ordering=view.ordering, after=['', 0]), False
+    for view_class in (AlbumListView, ImageListView, ):
+        yield view_class.__name__, get_view(view_class=view_class, request=factory.get(path='/'), user=user, kwargs={}).get_queryset(), False
+    for view_class, pagination_class, params, allow_sort in (
+        (AlbumViewSet, AlbumPagination, {}, False),
+        (AlbumViewSet, AlbumPagination, {'username': user.username}, False),
+        (ImageViewSet, ImagePagination, {}, False),
+        (ImageViewSet, ImagePagination, {'name': album.name}, True),
+        (ImageViewSet, ImagePagination, {'name': album.name, 'mine': 'true'}, True),
+    ):
+        view = view_class()
+        view.request = Request(factory.get(path='/', data=params))
+        view.request.user = user
+        view.kwargs = {}
+        view.format_kwarg = None
+        label = '{name} {params}'.format(name=view_class.__name__, params=params) if params else view_class.__name__
+        yield label, filter_keyset_queryset(queryset=view.get_queryset(), ordering=pagination_class.ordering), allow_sort
+        yield '{label} (next page)'.format(label=label), filter_keyset_queryset(queryset=view.get_queryset(), ordering=pagination_class.ordering, after=['', 0]), allow_sort
@@ -0,0 +1,51 @@
+import base64
+import binascii
+import json
+
+from django.db.models import Q
+
+KEYSET_PAGE_SIZE = 25
+
+
+def encode_keyset_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(list(values)).encode('utf-8')).decode('ascii')
+
+
+def decode_keyset_cursor(cursor, length):
+    # A missing or malformed cursor means the first page.
+    if not cursor:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+    except (binascii.Error, UnicodeError, ValueError):
+        return None
+    if not isinstance(values, list) or len(values) != length:
+        return None
+    return values
+
+
+def filter_keyset_queryset(queryset, ordering, after=None):
+    # The leading range on the first field lets the database seek into the index.
+    if after is not None:
+        condition = Q()
+        for index, field in enumerate(ordering):
+            lookups = {ordering[previous]: after[previous] for previous in range(index)}
+            lookups['{field}__gt'.format(field=field)] = after[index]
+            condition |= Q(**lookups)
+        if len(ordering) > 1:
+            condition &= Q(**{'{field}__gte'.format(field=ordering[0]): after[0]})
+        queryset = queryset.filter(condition)
+    return queryset.order_by(*ordering)
+
+
+def get_keyset_page(queryset, ordering, after=None, size=KEYSET_PAGE_SIZE):
+    # Returns a page of rows after the "after" values and the values to continue from.
+    # The last field of the ordering must be unique, or rows are skipped or repeated.
+    # The rows are either model instances or the dictionaries of a values() queryset.
+    rows = list(filter_keyset_queryset(queryset=queryset, ordering=ordering, after=after)[:size + 1])
+    if len(rows) > size:
+        rows = rows[:size]
+        if isinstance(rows[-1], dict):
+            return rows, [rows[-1][field] for field in ordering]
+        return rows, [getattr(rows[-1], field) for field in ordering]
+    return rows, None
@@ -0,0 +1,101 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import (
+    connection,
+    transaction,
+)
+from django.test.client import RequestFactory
+from django.test.utils import CaptureQueriesContext
+
+from ...dj.views import (
+    DashboardView,
+    DashboardUserAlbumView,
+    DashboardUserImageView,
+    DashboardAlbumImageView,
+)
+from ...models import (
+    AlbumModel,
+    ImageModel,
+)
+
+BENCHMARK_USERNAME_PREFIX = 'dashboard-benchmark-'
+BENCHMARK_IMAGES_PER_ALBUM = 10
+BENCHMARK_ALBUMS_PER_USER = 10
+
+
+class BenchmarkRollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Renders the dashboard page and its tree fragments with a growing number of rows and reports the queries and the render time per row of each. All the rows are rolled back.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int, default=[1000, 2000, 4000, 8000], help='Number of images of every run.')
+        parser.add_argument('--repeat', type=int, default=3, help='Number of renders of every run, the best one is reported.')
+
+    def handle(self, *args, **options):
+        self.stdout.write('{view:<12} {images:>10} {rows:>10} {queries:>8} {seconds:>10} {per_row:>12}'.format(view='view', images='images', rows='rows', queries='queries', seconds='seconds', per_row='us/row'))
+        for size in options['sizes']:
+            try:
+                with transaction.atomic():
+                    rows = self.create_rows(size=size)
+                    results = self.render(repeat=options['repeat'])
+                    raise BenchmarkRollback()
+            except BenchmarkRollback:
+                pass
+            for label, queries, seconds in results:
+                self.stdout.write('{view:<12} {images:>10} {rows:>10} {queries:>8} {seconds:>10.4f} {per_row:>12.4f}'.format(view=label, images=size, rows=rows, queries=queries, seconds=seconds, per_row=seconds * 1000000 / rows))
+
+    def create_rows(self, size):
+        # The rows are created with bulk_create, so no signal (and no storage folder) is involved.
+        albums_count = max(size // BENCHMARK_IMAGES_PER_ALBUM, 1)
+        users_count = max(albums_count // BENCHMARK_ALBUMS_PER_USER, 1)
+        get_user_model().objects.bulk_create([
+            get_user_model()(username='{prefix}{index}'.format(prefix=BENCHMARK_USERNAME_PREFIX, index=index))
+            for index in range(users_count)
+        ])
+        users = list(get_user_model().objects.filter(username__startswith=BENCHMARK_USERNAME_PREFIX))
+        AlbumModel.objects.bulk_create([
+            AlbumModel(name='album-{index}'.format(index=index), user=users[index % users_count])
+            for index in range(albums_count)
+        ])
+        albums = list(AlbumModel.objects.filter(user__username__startswith=BENCHMARK_USERNAME_PREFIX))
+        ImageModel.objects.bulk_create([
+            ImageModel(
+                title='image-{index}'.format(index=index),
+                album=albums[index % albums_count] if index % BENCHMARK_IMAGES_PER_ALBUM else None,
+                user=users[index % users_count],
+            )
+            for index in range(size)
+        ])
+        return get_user_model().objects.count() + AlbumModel.objects.count() + ImageModel.objects.count()
+
+    def render(self, repeat):
+        factory = RequestFactory()
+        user = get_user_model().objects.filter(username__startswith=BENCHMARK_USERNAME_PREFIX).first()
+        album = AlbumModel.objects.filter(user__id=user.id).first()
+        views = [
+            ('page', DashboardView.as_view(), {}),
+            ('user-album', DashboardUserAlbumView.as_view(), {'pk': user.pk}),
+            ('user-image', DashboardUserImageView.as_view(), {'pk': user.pk}),
+            ('album-image', DashboardAlbumImageView.as_view(), {'pk': album.pk}),
+        ]
+        results = []
+        for label, view, kwargs in views:
+            best_seconds = None
+            queries = 0
+            for _ in range(repeat):
+                request = factory.get(path='/dashboard/')
+                request.user = user
+                with CaptureQueriesContext(connection=connection) as context:
+                    start = time.perf_counter()
+                    view(request, **kwargs).render()
+                    seconds = time.perf_counter() - start
+                queries = len(context.captured_queries)
+                if best_seconds is None or seconds < best_seconds:
+                    best_seconds = seconds
+            results.append((label, queries, best_seconds))
+        return results
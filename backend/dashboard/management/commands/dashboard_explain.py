@@ -0,0 +1,87 @@
+from django.core.management.base import (
+    BaseCommand,
+    CommandError,
+)
+from django.db import (
+    connection,
+    transaction,
+)
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import (
+    APIRequestFactory,
+    force_authenticate,
+)
+
+from ...drf.views import (
+    AlbumViewSet,
+    ImageViewSet,
+)
+from ...explain import (
+    EXPLAIN_ALBUM_NAME,
+    EXPLAIN_USERNAME,
+    EXPLAIN_VENDORS,
+    create_explain_rows,
+    explain_queryset,
+    get_explain_querysets,
+    is_full_scan,
+    prepare_explain,
+)
+
+# The API lists and the number of queries they may run, the keyset pagination needs no count query and the included relations are loaded with the page.
+# The lists that can answer 304 run one more query for their ETag, the lists including the users cannot.
+EXPLAIN_MAX_QUERIES = (
+    (AlbumViewSet, {'username': EXPLAIN_USERNAME, 'include': 'images,user'}, 3),
+    (ImageViewSet, {'name': EXPLAIN_ALBUM_NAME}, 2),
+    (ImageViewSet, {'name': EXPLAIN_ALBUM_NAME, 'mine': 'true'}, 2),
+    (ImageViewSet, {'name': EXPLAIN_ALBUM_NAME, 'include': 'album,user'}, 1),
+)
+
+
+class ExplainRollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Prints the query plan of the album and image lists of every view and fails if one of them scans a whole table or sorts its rows, or if an API list runs more queries than expected. The same checks run with the tests of the dashboard, this prints the plans against any database.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verbose-plans', action='store_true', help='Prints the plans that pass too.')
+
+    def handle(self, *args, **options):
+        if connection.vendor not in EXPLAIN_VENDORS:
+            raise CommandError('The query plans of the {vendor} database are not supported.'.format(vendor=connection.vendor))
+        failures = []
+        try:
+            with transaction.atomic():
+                prepare_explain()
+                # The rows are rolled back at the end.
+                user, album = create_explain_rows()
+                for label, queryset, allow_sort in get_explain_querysets(user=user, album=album):
+                    plan = explain_queryset(queryset=queryset)
+                    full_scan = is_full_scan(plan=plan, allow_sort=allow_sort)
+                    if full_scan:
+                        failures.append(label)
+                    self.stdout.write('{status:<6} {label}'.format(status='FAIL' if full_scan else 'OK', label=label))
+                    if full_scan or options['verbose_plans']:
+                        self.stdout.write('{plan}\n'.format(plan=plan))
+                for label, queries, max_queries in self.count_queries(user=user):
+                    if queries > max_queries:
+                        failures.append(label)
+                    self.stdout.write('{status:<6} {label}: {queries} query(ies), at most {max_queries}'.format(status='FAIL' if queries > max_queries else 'OK', label=label, queries=queries, max_queries=max_queries))
+                raise ExplainRollback()
+        except ExplainRollback:
+            pass
+        if failures:
+            raise CommandError('{count} check(s) failed: {labels}.'.format(count=len(failures), labels=', '.join(failures)))
+
+    def count_queries(self, user):
+        factory = APIRequestFactory()
+        for view_class, params, max_queries in EXPLAIN_MAX_QUERIES:
+            request = factory.get(path='/', data=params)
+            force_authenticate(request=request, user=user)
+            with CaptureQueriesContext(connection=connection) as context:
+                response = view_class.as_view({'get': 'list'})(request)
+                response.render()
+            if len(response.data['results']) != 1:
+                raise CommandError('{name} {params} did not return the row of the check.'.format(name=view_class.__name__, params=params))
+            yield '{name} {params}'.format(name=view_class.__name__, params=params), len(context.captured_queries), max_queries
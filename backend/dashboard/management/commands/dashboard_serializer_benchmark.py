@@ -0,0 +1,79 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import (
+    BaseCommand,
+    CommandError,
+)
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+
+from ...drf.serializers import (
+    AlbumSerializer,
+    ImageSerializer,
+)
+from ...models import (
+    AlbumModel,
+    ImageModel,
+)
+
+BENCHMARK_USERNAME = 'dashboard-serializer-benchmark'
+
+
+class BenchmarkRollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Compares the rows per second of the album and image serializers with the values() fast path of the lists, and checks both render the same bytes. All the rows are rolled back.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', nargs='+', type=int, default=[500, 5000], help='Number of albums and of images of every run.')
+        parser.add_argument('--repeat', type=int, default=3, help='Number of renders of every path, the best one is reported.')
+
+    def handle(self, *args, **options):
+        self.stdout.write('{serializer:>16} {rows:>8} {path:>12} {rows_per_second:>14}'.format(serializer='serializer', rows='rows', path='path', rows_per_second='rows/s'))
+        for rows in options['rows']:
+            try:
+                with transaction.atomic():
+                    self.create_rows(rows=rows)
+                    for serializer_class, model in ((AlbumSerializer, AlbumModel, ), (ImageSerializer, ImageModel, ), ):
+                        self.run(serializer_class=serializer_class, queryset=model.objects.order_by('id'), rows=rows, repeat=options['repeat'])
+                    raise BenchmarkRollback()
+            except BenchmarkRollback:
+                pass
+
+    def create_rows(self, rows):
+        user = get_user_model().objects.create(username=BENCHMARK_USERNAME)
+        AlbumModel.objects.bulk_create([AlbumModel(name='album-{index}'.format(index=index), user=user) for index in range(rows)])
+        album = AlbumModel.objects.filter(user__id=user.id).first()
+        ImageModel.objects.bulk_create([
+            ImageModel(
+                title='image-{index}'.format(index=index),
+                image='images/image-{index}.png'.format(index=index),
+                image_derivatives_ready=bool(index % 2),
+                album=album,
+                user=user,
+            )
+            for index in range(rows)
+        ])
+
+    def run(self, serializer_class, queryset, rows, repeat):
+        renderer = JSONRenderer()
+        paths = (
+            ('serializer', lambda: renderer.render(serializer_class(queryset, many=True).data)),
+            ('values', lambda: renderer.render([serializer_class.values_to_representation(row=row) for row in queryset.values(*serializer_class.Meta.values_fields)])),
+        )
+        contents = []
+        for path, render in paths:
+            best_seconds = None
+            for _ in range(repeat):
+                start = time.perf_counter()
+                content = render()
+                seconds = time.perf_counter() - start
+                if best_seconds is None or seconds < best_seconds:
+                    best_seconds = seconds
+            contents.append(content)
+            self.stdout.write('{serializer:>16} {rows:>8} {path:>12} {rows_per_second:>14.0f}'.format(serializer=serializer_class.__name__, rows=rows, path=path, rows_per_second=rows / best_seconds))
+        if contents[0] != contents[1]:
+            raise CommandError('The values() fast path of {serializer} does not render the same bytes as the serializer.'.format(serializer=serializer_class.__name__))
@@ -0,0 +1,22 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from ...models import ChangeModel
+
+
+class Command(BaseCommand):
+    help = 'Deletes the sync changes older than the given number of days, the clients with an older cursor download the lists again.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30, help='Number of days of changes to keep.')
+
+    def handle(self, *args, **options):
+        # The last change is always kept, it tells the expired cursors from the current ones once the older changes are gone.
+        queryset = ChangeModel.objects.filter(created_at__lt=timezone.now() - timedelta(days=options['days']))
+        last = ChangeModel.objects.order_by('-id').only('id').first()
+        if last is not None:
+            queryset = queryset.exclude(pk=last.pk)
+        deleted, _ = queryset.delete()
+        self.stdout.write('Deleted {deleted} change(s).'.format(deleted=deleted))
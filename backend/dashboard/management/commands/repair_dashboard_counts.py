@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand
+from django.db.models import (
+    Count,
+    F,
+    OuterRef,
+    Subquery,
+)
+from django.db.models.functions import Coalesce
+
+from ...models import (
+    AlbumModel,
+    ImageModel,
+    get_counters,
+)
+
+
+def get_actual_count(counted_model, name, key):
+    return Coalesce(Subquery(
+        counted_model.objects.filter(**{name: OuterRef(key)}).order_by().values(name).annotate(count=Count('pk')).values('count')
+    ), 0)
+
+
+class Command(BaseCommand):
+    help = 'Counts the images of every album and the albums and images of every user again, and repairs the counters that drifted with one query per batch.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Reports the wrong counters without repairing them.')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Number of counters repaired by every query.')
+
+    def handle(self, *args, **options):
+        batch_size = max(options['batch_size'], 1)
+        for counted_model in (AlbumModel, ImageModel, ):
+            for name, model, field, key in get_counters(model=counted_model):
+                actual_count = get_actual_count(counted_model=counted_model, name=name, key=key)
+                wrong = list(
+                    model.objects.annotate(actual_count=actual_count).exclude(**{field: F('actual_count')}).order_by('pk').values_list('pk', field, 'actual_count')
+                )
+                if options['verbosity'] > 1:
+                    for pk, count, actual in wrong:
+                        self.stdout.write('{model} {pk}: {field} is {count}, counted {actual}.'.format(model=model._meta.verbose_name, pk=pk, field=field, count=count, actual=actual))
+                if not options['dry_run']:
+                    # The counts are taken again by the update itself, so the rows written since they were read are counted too.
+                    for index in range(0, len(wrong), batch_size):
+                        model.objects.filter(pk__in=[pk for pk, count, actual in wrong[index:index + batch_size]]).update(**{field: actual_count})
+                self.stdout.write('{model} {field}: {wrong} wrong counter(s){repaired}.'.format(
+                    model=model._meta.verbose_name,
+                    field=field,
+                    wrong=len(wrong),
+                    repaired='' if options['dry_run'] else ' repaired',
+                ))
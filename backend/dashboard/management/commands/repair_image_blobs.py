@@ -0,0 +1,61 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import (
+    Count,
+    Max,
+)
+from django.utils import timezone
+
+from ...models import (
+    IMAGE_BLOB_DELETE_JOB,
+    ImageBlobModel,
+    ImageModel,
+)
+from ....media.models import enqueue_job
+
+
+class Command(BaseCommand):
+    help = 'Counts the images pointing to every stored image file again, repairs the reference counts that drifted, creates the blobs of the files stored before them, and deletes the files no image points to.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Reports the wrong blobs without repairing them.')
+        parser.add_argument('--seconds', type=int, default=3600, help='Seconds since its last change after which a blob is repaired, so the uploads being saved are left alone.')
+
+    def handle(self, *args, **options):
+        updated_before = timezone.now() - timedelta(seconds=options['seconds'])
+        references = {
+            name: (count, sha256)
+            for name, count, sha256 in ImageModel.objects.exclude(image='').exclude(image__isnull=True).order_by().values('image').annotate(count=Count('pk'), sha256=Max('image_sha256')).values_list('image', 'count', 'sha256').iterator()
+        }
+        created = 0
+        repaired = 0
+        deleted = 0
+        for blob_id, name, ref_count, updated_at in ImageBlobModel.objects.order_by('id').values_list('id', 'name', 'ref_count', 'updated_at').iterator():
+            count, sha256 = references.pop(name, (0, ''))
+            if count == ref_count or updated_at > updated_before:
+                continue
+            if options['verbosity'] > 1:
+                self.stdout.write('{name}: {ref_count} reference(s), counted {count}.'.format(name=name, ref_count=ref_count, count=count))
+            if count:
+                repaired += 1
+                if not options['dry_run']:
+                    ImageBlobModel.objects.filter(pk=blob_id, ref_count=ref_count).update(ref_count=count, updated_at=timezone.now())
+            else:
+                # A reference taken by a save that failed afterwards, the file is deleted like the one of a released blob.
+                deleted += 1
+                if not options['dry_run'] and ImageBlobModel.objects.filter(pk=blob_id, ref_count=ref_count).delete()[0]:
+                    enqueue_job(name=IMAGE_BLOB_DELETE_JOB, image_name=name)
+        # The names left are the files stored before the blobs, or by a save whose reference was lost.
+        for name, (count, sha256) in references.items():
+            if options['verbosity'] > 1:
+                self.stdout.write('{name}: no blob, counted {count}.'.format(name=name, count=count))
+            created += 1
+            if not options['dry_run']:
+                ImageBlobModel.objects.get_or_create(name=name, defaults={'sha256': sha256, 'ref_count': count})
+        self.stdout.write('{created} blob(s) created, {repaired} reference count(s) repaired, {deleted} unreferenced blob(s) deleted{dry_run}.'.format(
+            created=created,
+            repaired=repaired,
+            deleted=deleted,
+            dry_run=' (dry run)' if options['dry_run'] else '',
+        ))
@@ -1,23 +1,77 @@
+import os
+import threading
+from contextlib import contextmanager
+
 from django.core.exceptions import ValidationError
-from datetime import datetime
+from datetime import (
+    datetime,
+    timedelta,
+)
+from django.db import (
+    IntegrityError,
+    transaction,
+)
 from django.db.models import (
+    F,
     Manager,
     Model,
     ForeignKey,
     BigAutoField,
+    BigIntegerField,
     BooleanField,
     CharField,
+    DateTimeField,
     ImageField,
-    SET_NULL,
+    Index,
+    PositiveIntegerField,
+    DO_NOTHING,
 )
 from django.conf import settings
+from django.utils import timezone
+
+from ..media.derivatives import (
+    DERIVATIVE_THUMBNAIL,
+    DERIVATIVE_MEDIUM,
+    create_derivatives,
+    delete_derivatives,
+    get_derivative_name,
+)
+from ..counters import (
+    CounterFieldsMixin,
+    update_counter,
+)
+from ..media.handlers import register_image_upload_limits
+from ..media.models import enqueue_job
+from ..media.metadata import (
+    get_empty_image_metadata,
+    get_image_metadata_fields,
+    get_stored_image_metadata,
+    read_image_metadata,
+)
+from ..media.uploads import (
+    get_upload_size,
+    read_upload_header,
+)
+from ..security.models import ProfileModel
+from ..tracking import TrackedFieldsMixin
+from .caches import bump_user_generation_on_commit
+
+
+def set_null_and_touch(collector, field, sub_objs, using):
+    # Like SET_NULL, and also moves the updated_at of the rows forward and records their change, so the lists and the sync see it.
+    # The counters need nothing here, the album or the profile the rows were counted in is deleted with them.
+    collector.add_field_update(field, None, sub_objs)
+    collector.add_field_update(field.model._meta.get_field('updated_at'), timezone.now(), sub_objs)
+    record_changes(model=field.model, changes=[
+        (pk, user_id, False, ) for pk, user_id in sub_objs.values_list('pk', 'user_id')
+    ])
 
 
 class AlbumManager(Manager):
     pass
 
 
-class AlbumModel(Model):
+class AlbumModel(CounterFieldsMixin, TrackedFieldsMixin, Model):
     id = BigAutoField(
         verbose_name='ID',
         primary_key=True,
@@ -43,13 +97,27 @@ class AlbumModel(Model):
         null=True,
         blank=True,
         default=None,
-        on_delete=SET_NULL,
+        on_delete=set_null_and_touch,
+        db_index=False,
         related_name='albums_user',
         related_query_name='album_user',
         help_text='Users.',
     )
+    updated_at = DateTimeField(
+        verbose_name='updated at',
+        auto_now=True,
+    )
+    image_count = PositiveIntegerField(
+        verbose_name='image count',
+        default=0,
+        null=False,
+        blank=False,
+        help_text='Number of images of the album.',
+    )
 
     objects = AlbumManager()
+    tracked_fields = ('user', )
+    counter_fields = ('image_count', )
 
     class Meta:
         db_table = 'mobelux_dashboard_album'
@@ -57,10 +125,25 @@ class AlbumModel(Model):
         verbose_name_plural = 'albums'
         verbose_name = 'album'
         default_permissions = []
+        # The lists filter by user (or by name) and page by (name, id), the user foreign key is covered by the first index.
+        indexes = [
+            Index(fields=['user', 'name', 'id', ], name='mobelux_dashboard_album_user'),
+            Index(fields=['name', 'id', ], name='mobelux_dashboard_album_name'),
+        ]
 
     def __str__(self):
         return '{name}'.format(name=self.name)
 
+    def signal_albummodel_post_save(self, created=False):
+        record_instance_changes(instance=self)
+        record_counts(deltas=get_count_deltas(instance=self, created=created))
+        bump_user_generation_on_commit(user_id=self.user_id)
+
+    def signal_albummodel_post_delete(self):
+        record_instance_changes(instance=self, is_deleted=True)
+        record_counts(deltas=get_count_deltas(instance=self, is_deleted=True))
+        bump_user_generation_on_commit(user_id=self.user_id)
+
 
 class ImageManager(Manager):
     pass
@@ -70,27 +153,114 @@ IMAGES_FOLDER_NAME = 'images'
 IMAGE_MAX_WIDTH = 960
 IMAGE_MAX_HEIGHT = 960
 IMAGE_MAX_SIZE = 1048576 // 1024  # 1048576bytes==1mb, 102400bytes==100kb
+register_image_upload_limits(field_name='image', max_size=IMAGE_MAX_SIZE, max_width=IMAGE_MAX_WIDTH, max_height=IMAGE_MAX_HEIGHT)
+# Hex characters of the SHA-256 used as the folder of a stored image, 256 folders.
+IMAGE_BLOB_PREFIX_LENGTH = 2
+
+
+def image_file_upload_name(filename):
+    file_upload_name = '{folder_name}/{current_time}-{filename}'.format(folder_name=IMAGES_FOLDER_NAME, current_time=datetime.now().strftime("%Y%m%d%H%M%S"), filename=filename)
+    return file_upload_name
+
+
+def image_blob_name(sha256, filename):
+    return '{folder_name}/{prefix}/{sha256}{ext}'.format(folder_name=IMAGES_FOLDER_NAME, prefix=sha256[:IMAGE_BLOB_PREFIX_LENGTH], sha256=sha256, ext=os.path.splitext(filename)[1].lower())
 
 
 def image_file_upload_to(instance, filename):
-    file_upload_to = '{folder_name}/{current_time}-{filename}'.format(folder_name=IMAGES_FOLDER_NAME, current_time=datetime.now().strftime("%Y%m%d%H%M%S"), filename=filename)
-    return file_upload_to
+    # A new upload is stored under the SHA-256 of its content, read by the pre_save of the image before the file is saved.
+    if instance.image_sha256:
+        return image_blob_name(sha256=instance.image_sha256, filename=filename)
+    return image_file_upload_name(filename=filename)
 
 
 def image_validate_size(avatar):
-    size = avatar.size // 1024
+    size = get_stored_image_metadata(file=avatar, name='size')
+    size = (avatar.size if size is None else size) // 1024
     if size > IMAGE_MAX_SIZE:
         raise ValidationError('Maximum file size that can be uploaded is {max_size} KB.'.format(max_size=IMAGE_MAX_SIZE))
 
 
 def image_validate_dimension(avatar):
-    width = avatar.width
-    height = avatar.height
+    width = get_stored_image_metadata(file=avatar, name='width')
+    height = get_stored_image_metadata(file=avatar, name='height')
+    if width is None or height is None:
+        width = avatar.width
+        height = avatar.height
     if width > IMAGE_MAX_WIDTH or height > IMAGE_MAX_HEIGHT:
         raise ValidationError('Dimensions are larger than what is allowed: {max_width}x{max_height} pixels.'.format(max_width=IMAGE_MAX_WIDTH, max_height=IMAGE_MAX_HEIGHT))
 
 
-class ImageModel(Model):
+def image_validate_upload(name):
+    # The same checks as the validators of the image field, for a file uploaded straight to the storage: its size from a HEAD request, its dimensions from its first bytes.
+    # Returns the metadata found on the way, its SHA-256 is left to the derivatives job which reads the whole file anyway.
+    size = get_upload_size(name=name)
+    if size is None:
+        raise ValidationError('The file has not been uploaded yet.')
+    if size // 1024 > IMAGE_MAX_SIZE:
+        raise ValidationError('Maximum file size that can be uploaded is {max_size} KB.'.format(max_size=IMAGE_MAX_SIZE))
+    header = read_upload_header(name=name)
+    if header['width'] is None or header['height'] is None:
+        raise ValidationError('Upload a valid image. The file you uploaded was either not an image or a corrupted image.')
+    if header['width'] > IMAGE_MAX_WIDTH or header['height'] > IMAGE_MAX_HEIGHT:
+        raise ValidationError('Dimensions are larger than what is allowed: {max_width}x{max_height} pixels.'.format(max_width=IMAGE_MAX_WIDTH, max_height=IMAGE_MAX_HEIGHT))
+    return dict(get_empty_image_metadata(), size=size, **header)
+
+
+def image_upload_check(user, arguments):
+    # Called when an upload of an image file starts, resumable or presigned, returns the maximum size of the file. Only the owner of the image uploads its file.
+    if not isinstance(arguments.get('pk'), int) or not ImageModel.objects.filter(pk=arguments['pk'], user__id=user.id).exists():
+        raise ValidationError('Image not found.')
+    return IMAGE_MAX_SIZE * 1024
+
+
+def image_upload_finish(user, arguments, file):
+    # Called with the complete file of a resumable upload, which goes through the validators of the image field like a form upload.
+    image = ImageModel.objects.filter(pk=arguments['pk'], user__id=user.id).first()
+    if image is None:
+        raise ValidationError('Image not found.')
+    image_validate_size(file)
+    image_validate_dimension(file)
+    image.image = file
+    image.save()
+
+
+def image_create_derivatives_job(image_id, image_name):
+    # An image uploaded again since has its own job.
+    image = ImageModel.objects.filter(pk=image_id, image=image_name).first()
+    if image is None:
+        return
+    metadata = create_derivatives(field_file=image.image)
+    # A file uploaded straight to the storage is only hashed here, the image is then moved to the same content if it is already stored.
+    blob_name = take_image_blob_duplicate(name=image_name, sha256=metadata['sha256'])
+    if blob_name is not None:
+        derivatives_ready = ImageModel.objects.filter(image=blob_name, image_derivatives_ready=True).exists()
+        if not ImageModel.objects.filter(pk=image_id, image=image_name).update(image=blob_name, image_derivatives_ready=derivatives_ready, updated_at=timezone.now(), **get_image_metadata_fields(prefix='image', metadata=metadata)):
+            release_image_blob(name=blob_name)
+            return
+        release_image_blob(name=image_name)
+        if not derivatives_ready:
+            enqueue_job(name=IMAGE_CREATE_DERIVATIVES_JOB, image_id=image_id, image_name=blob_name)
+    elif not ImageModel.objects.filter(pk=image_id, image=image_name).update(image_derivatives_ready=True, updated_at=timezone.now(), **get_image_metadata_fields(prefix='image', metadata=metadata)):
+        return
+    record_changes(model=ImageModel, changes=[(image.pk, image.user_id, False, )])
+    bump_user_generation_on_commit(user_id=image.user_id)
+
+
+IMAGE_CREATE_DERIVATIVES_JOB = 'backend.dashboard.models.image_create_derivatives_job'
+
+
+def image_derivative_url(name, derivatives_ready, derivative):
+    # Takes the stored name instead of the field file, so the lists read from values() build the same urls as the model.
+    if not name:
+        return None
+    storage = ImageModel._meta.get_field('image').storage
+    if not derivatives_ready:
+        return storage.url(name)
+    return storage.url(get_derivative_name(name=name, derivative=derivative))
+
+
+class ImageModel(TrackedFieldsMixin, Model):
     id = BigAutoField(
         verbose_name='ID',
         primary_key=True,
@@ -113,13 +283,65 @@ class ImageModel(Model):
         ],
         help_text='Maximum file size that can be uploaded is {max_size} KB. Maximum dimensions: {max_width}x{max_height} pixels.'.format(max_size=IMAGE_MAX_SIZE, max_width=IMAGE_MAX_WIDTH, max_height=IMAGE_MAX_HEIGHT),
     )
+    image_derivatives_ready = BooleanField(
+        verbose_name='image derivatives ready',
+        default=False,
+        null=False,
+        blank=False,
+        help_text='Designates whether the thumbnail and medium derivatives of the image have been created.',
+    )
+    image_width = PositiveIntegerField(
+        verbose_name='image width',
+        null=True,
+        blank=True,
+        default=None,
+        help_text='Width of the image in pixels, stored when the image is uploaded.',
+    )
+    image_height = PositiveIntegerField(
+        verbose_name='image height',
+        null=True,
+        blank=True,
+        default=None,
+        help_text='Height of the image in pixels, stored when the image is uploaded.',
+    )
+    image_size = PositiveIntegerField(
+        verbose_name='image size',
+        null=True,
+        blank=True,
+        default=None,
+        help_text='Size of the image in bytes, stored when the image is uploaded.',
+    )
+    image_mime_type = CharField(
+        verbose_name='image MIME type',
+        max_length=64,
+        null=False,
+        blank=True,
+        default='',
+    )
+    image_sha256 = CharField(
+        verbose_name='image SHA-256',
+        max_length=64,
+        null=False,
+        blank=True,
+        default='',
+        help_text='SHA-256 of the content of the image, in hex.',
+    )
+    image_upload_name = CharField(
+        verbose_name='image upload name',
+        max_length=255,
+        null=False,
+        blank=True,
+        default='',
+        help_text='Name of the file uploaded straight to the storage, until the upload is finalized.',
+    )
     album = ForeignKey(
         to=AlbumModel,
         verbose_name='album',
         null=True,
         blank=True,
         default=None,
-        on_delete=SET_NULL,
+        on_delete=set_null_and_touch,
+        db_index=False,
         related_name='images_album',
         related_query_name='image_album',
         help_text='Select an album.',
@@ -130,13 +352,19 @@ class ImageModel(Model):
         null=True,
         blank=True,
         default=None,
-        on_delete=SET_NULL,
+        on_delete=set_null_and_touch,
+        db_index=False,
         related_name='images_user',
         related_query_name='image_user',
         help_text='Users.',
     )
+    updated_at = DateTimeField(
+        verbose_name='updated at',
+        auto_now=True,
+    )
 
     objects = ImageManager()
+    tracked_fields = ('user', 'album', 'image', )
 
     class Meta:
         db_table = 'mobelux_dashboard_image'
@@ -144,6 +372,386 @@ class ImageModel(Model):
         verbose_name_plural = 'images'
         verbose_name = 'image'
         default_permissions = []
+        # The lists filter by user or by album and page by (title, id), the foreign keys are covered by the first two indexes.
+        indexes = [
+            Index(fields=['user', 'title', 'id', ], name='mobelux_dashboard_image_user'),
+            Index(fields=['album', 'title', 'id', ], name='mobelux_dashboard_image_album'),
+            Index(fields=['title', 'id', ], name='mobelux_dashboard_image_title'),
+        ]
 
     def __str__(self):
         return '{title}'.format(title=self.title)
+
+    def get_image_thumbnail_url(self):
+        return image_derivative_url(name=self.image.name, derivatives_ready=self.image_derivatives_ready, derivative=DERIVATIVE_THUMBNAIL)
+
+    def get_image_medium_url(self):
+        return image_derivative_url(name=self.image.name, derivatives_ready=self.image_derivatives_ready, derivative=DERIVATIVE_MEDIUM)
+
+    def get_image_previous_name(self):
+        if self._state.adding:
+            return ''
+        if self.is_tracked(name='image'):
+            return self.get_tracked_value(name='image')
+        return ImageModel.objects.filter(pk=self.pk).values_list('image', flat=True).first() or ''
+
+    def signal_imagemodel_pre_save(self):
+        self.image_previous_name = self.get_image_previous_name()
+        self.image_blob_taken = False
+        # The metadata of a new upload is read from the file in hand, the one of a file already in the storage is set by whoever set its name.
+        if self.image and not self.image._committed:
+            self.set_image_metadata(metadata=read_image_metadata(file=self.image, sha256=getattr(self.image.file, 'upload_sha256', None)))
+            # The same content already stored is shared: the image points to it and the save writes nothing to the storage.
+            blob_name = take_image_blob(sha256=self.image_sha256)
+            if blob_name is not None:
+                self.image.name = blob_name
+                self.image._committed = True
+                self.image_blob_taken = True
+        elif not self.image:
+            self.set_image_metadata(metadata=get_empty_image_metadata())
+        # A new upload is only committed to the storage by the save itself, its derivatives are created by the media worker afterwards.
+        # A finalized direct upload is already in the storage, only its name changes.
+        self.image_derivatives_pending = bool(self.image) and (not self.image._committed or self.image.name != self.image_previous_name)
+        if self.image_derivatives_pending or not self.image:
+            self.image_derivatives_ready = False
+        if self.image_derivatives_pending and self.image_blob_taken and ImageModel.objects.filter(image=self.image.name, image_derivatives_ready=True).exists():
+            # The derivatives are stored next to the file, so they are shared too.
+            self.image_derivatives_pending = False
+            self.image_derivatives_ready = True
+
+    def set_image_metadata(self, metadata):
+        for name, value in get_image_metadata_fields(prefix='image', metadata=metadata).items():
+            setattr(self, name, value)
+
+    def signal_imagemodel_post_save(self, created=False):
+        if getattr(self, 'image_derivatives_pending', False):
+            enqueue_job(name=IMAGE_CREATE_DERIVATIVES_JOB, image_id=self.pk, image_name=self.image.name)
+        self.image_derivatives_pending = False
+        image_name = self.image.name if self.image else ''
+        previous_name = getattr(self, 'image_previous_name', image_name)
+        if image_name != previous_name:
+            if not getattr(self, 'image_blob_taken', False):
+                take_image_blob_name(name=image_name, sha256=self.image_sha256)
+            release_image_blob(name=previous_name)
+        elif getattr(self, 'image_blob_taken', False):
+            # The same content uploaded again on the same image.
+            release_image_blob(name=image_name)
+        self.image_previous_name = image_name
+        self.image_blob_taken = False
+        record_instance_changes(instance=self)
+        record_counts(deltas=get_count_deltas(instance=self, created=created))
+        bump_user_generation_on_commit(user_id=self.user_id)
+
+    def signal_imagemodel_post_delete(self):
+        release_image_blob(name=self.image.name if self.image else '')
+        record_instance_changes(instance=self, is_deleted=True)
+        record_counts(deltas=get_count_deltas(instance=self, is_deleted=True))
+        bump_user_generation_on_commit(user_id=self.user_id)
+
+
+class ImageBlobManager(Manager):
+    pass
+
+
+class ImageBlobModel(Model):
+    # A stored image file with the number of images pointing to it, the file and its derivatives are deleted with the last one.
+    id = BigAutoField(
+        verbose_name='ID',
+        primary_key=True,
+    )
+    name = CharField(
+        verbose_name='name',
+        max_length=255,
+        unique=True,
+        null=False,
+        blank=False,
+        help_text='Name of the file in the storage.',
+    )
+    sha256 = CharField(
+        verbose_name='SHA-256',
+        max_length=64,
+        db_index=True,
+        null=False,
+        blank=True,
+        default='',
+        help_text='SHA-256 of the content of the file, in hex. Empty for a direct upload until its derivatives are created.',
+    )
+    ref_count = PositiveIntegerField(
+        verbose_name='reference count',
+        default=0,
+        null=False,
+        blank=False,
+    )
+    updated_at = DateTimeField(
+        verbose_name='updated at',
+        default=timezone.now,
+    )
+
+    objects = ImageBlobManager()
+
+    class Meta:
+        db_table = 'mobelux_dashboard_image_blob'
+        ordering = ['id', ]
+        verbose_name_plural = 'image blobs'
+        verbose_name = 'image blob'
+        default_permissions = []
+
+    def __str__(self):
+        return '{name}'.format(name=self.name)
+
+
+def take_image_blob(sha256):
+    # Adds a reference to the stored file with this content and returns its name, or None when there is none.
+    # A blob down to zero is being deleted and is never taken back, the content is then stored again under a new name.
+    for blob_id, name in ImageBlobModel.objects.filter(sha256=sha256, ref_count__gt=0).values_list('id', 'name')[:1]:
+        if ImageBlobModel.objects.filter(pk=blob_id, ref_count__gt=0).update(ref_count=F('ref_count') + 1, updated_at=timezone.now()):
+            return name
+    return None
+
+
+def take_image_blob_duplicate(name, sha256):
+    # Records the SHA-256 of a file stored under another name, and takes the file already stored with the same content if there is one.
+    ImageBlobModel.objects.filter(name=name, sha256='').update(sha256=sha256, updated_at=timezone.now())
+    for blob_id, blob_name in ImageBlobModel.objects.filter(sha256=sha256, ref_count__gt=0).exclude(name=name).values_list('id', 'name')[:1]:
+        if ImageBlobModel.objects.filter(pk=blob_id, ref_count__gt=0).update(ref_count=F('ref_count') + 1, updated_at=timezone.now()):
+            return blob_name
+    return None
+
+
+def take_image_blob_name(name, sha256=''):
+    # Adds a reference to the file of that name, its blob is created with the first one.
+    if not name:
+        return
+    if ImageBlobModel.objects.filter(name=name).update(ref_count=F('ref_count') + 1, updated_at=timezone.now()):
+        return
+    try:
+        with transaction.atomic():
+            ImageBlobModel.objects.create(name=name, sha256=sha256, ref_count=1)
+    except IntegrityError:
+        ImageBlobModel.objects.filter(name=name).update(ref_count=F('ref_count') + 1, updated_at=timezone.now())
+
+
+def release_image_blob(name):
+    # Removes a reference to the file of that name, the media worker deletes the file once the last one is gone.
+    # A file without a blob (stored before the blobs) is never deleted here, see repair_image_blobs.
+    if not name:
+        return
+    ImageBlobModel.objects.filter(name=name, ref_count__gt=0).update(ref_count=F('ref_count') - 1, updated_at=timezone.now())
+    if ImageBlobModel.objects.filter(name=name, ref_count=0).delete()[0]:
+        enqueue_job(name=IMAGE_BLOB_DELETE_JOB, image_name=name)
+
+
+def image_blob_delete_job(image_name):
+    # A file taken again since, by an image set to its name, has a new blob and is kept.
+    if ImageBlobModel.objects.filter(name=image_name).exists():
+        return
+    storage = ImageModel._meta.get_field('image').storage
+    storage.delete(image_name)
+    delete_derivatives(storage=storage, name=image_name)
+
+
+IMAGE_BLOB_DELETE_JOB = 'backend.dashboard.models.image_blob_delete_job'
+
+
+class ChangeManager(Manager):
+    pass
+
+
+CHANGE_MODEL_ALBUM = 'album'
+CHANGE_MODEL_IMAGE = 'image'
+CHANGE_MODEL_CHOICES = (
+    (CHANGE_MODEL_ALBUM, 'Album', ),
+    (CHANGE_MODEL_IMAGE, 'Image', ),
+)
+# The changes of the last seconds are not read yet, so a change written by a transaction committed late is not skipped by a cursor already past it.
+# A transaction committing later than that can be missed by a cursor already past its changes.
+# The writes recording changes are short requests and bulk batches, after a longer transaction (a migration, a shell session) the clients have to download the lists again.
+CHANGE_SETTLE_SECONDS = 2
+CHANGE_PAGE_SIZE = 500
+
+
+class ChangeModel(Model):
+    # The change log of the albums and images read by the sync, a deleted row leaves a tombstone.
+    # A change is recorded for the owner of the row before and after it, so a row given to another user is removed from the sync of the previous one.
+    id = BigAutoField(
+        verbose_name='ID',
+        primary_key=True,
+    )
+    model = CharField(
+        verbose_name='model',
+        max_length=16,
+        choices=CHANGE_MODEL_CHOICES,
+        null=False,
+        blank=False,
+    )
+    object_id = BigIntegerField(
+        verbose_name='object ID',
+        null=False,
+        blank=False,
+    )
+    is_deleted = BooleanField(
+        verbose_name='is deleted',
+        default=False,
+        null=False,
+        blank=False,
+        help_text='Designates whether this change is the tombstone of a deleted row.',
+    )
+    user = ForeignKey(
+        to=settings.AUTH_USER_MODEL,
+        verbose_name='user',
+        null=True,
+        blank=True,
+        default=None,
+        on_delete=DO_NOTHING,
+        db_constraint=False,
+        db_index=False,
+        related_name='changes_user',
+        related_query_name='change_user',
+        help_text='Owner of the row, the changes of a deleted user are kept for the sync of all the users.',
+    )
+    created_at = DateTimeField(
+        verbose_name='created at',
+        auto_now_add=True,
+    )
+
+    objects = ChangeManager()
+
+    class Meta:
+        db_table = 'mobelux_dashboard_change'
+        ordering = ['id', ]
+        indexes = [
+            Index(fields=['user', 'id', ], name='mobelux_dashboard_change_user'),
+            Index(fields=['created_at', ], name='mobelux_dashboard_change_time'),
+        ]
+        verbose_name_plural = 'changes'
+        verbose_name = 'change'
+        default_permissions = []
+
+
+_change_batch = threading.local()
+
+
+def get_change_model_name(model):
+    return CHANGE_MODEL_ALBUM if model is AlbumModel else CHANGE_MODEL_IMAGE
+
+
+def record_changes(model, changes):
+    # Takes (object id, user id, is deleted) tuples and writes them with a single query, or at the end of the batch_changes() block.
+    if not changes:
+        return
+    model_name = get_change_model_name(model=model)
+    objects = [
+        ChangeModel(model=model_name, object_id=object_id, user_id=user_id, is_deleted=is_deleted)
+        for object_id, user_id, is_deleted in changes
+    ]
+    batch = getattr(_change_batch, 'objects', None)
+    if batch is not None:
+        batch.extend(objects)
+        return
+    ChangeModel.objects.bulk_create(objects)
+
+
+@contextmanager
+def batch_changes():
+    # The model signals of a bulk write record one change and one count per row, inside this block they are written with one query per table at the end.
+    if getattr(_change_batch, 'objects', None) is not None:
+        yield
+        return
+    _change_batch.objects = []
+    _change_batch.counts = {}
+    try:
+        yield
+        objects = _change_batch.objects
+        counts = _change_batch.counts
+    finally:
+        _change_batch.objects = None
+        _change_batch.counts = None
+    if objects:
+        ChangeModel.objects.bulk_create(objects)
+    write_counts(counts=counts)
+
+
+def record_instance_changes(instance, is_deleted=False):
+    user_ids = {instance.user_id}
+    if instance.get_tracked_value(name='user') is not None:
+        user_ids.add(instance.get_tracked_value(name='user'))
+    record_changes(model=type(instance), changes=[(instance.pk, user_id, is_deleted, ) for user_id in user_ids])
+
+
+def get_counters(model):
+    # The counters a row of the model is counted in: (field of the row, model of the counter, counter field, field of the counter model holding the value of the row).
+    if model is AlbumModel:
+        return (('user', ProfileModel, 'album_count', 'user', ), )
+    return (
+        ('album', AlbumModel, 'image_count', 'pk', ),
+        ('user', ProfileModel, 'image_count', 'user', ),
+    )
+
+
+def get_count_deltas(instance, created=False, is_deleted=False):
+    deltas = []
+    for name, model, field, key in get_counters(model=type(instance)):
+        value = getattr(instance, instance._meta.get_field(name).attname)
+        if created or is_deleted:
+            deltas.append(((model, field, key, ), value, -1 if is_deleted else 1, ))
+        elif instance.is_tracked(name=name) and instance.has_changed(name):
+            deltas.append(((model, field, key, ), instance.get_tracked_value(name=name), -1, ))
+            deltas.append(((model, field, key, ), value, 1, ))
+    return deltas
+
+
+def record_counts(deltas):
+    # Takes (counter, value, delta) tuples and adds them with one query per counter, or at the end of the batch_changes() block.
+    batch = getattr(_change_batch, 'counts', None)
+    counts = batch if batch is not None else {}
+    for counter, value, delta in deltas:
+        if value is None:
+            continue
+        counts.setdefault(counter, {})
+        counts[counter][value] = counts[counter].get(value, 0) + delta
+    if batch is None:
+        write_counts(counts=counts)
+
+
+def write_counts(counts):
+    for (model, field, key, ), deltas in counts.items():
+        update_counter(model=model, field=field, key=key, deltas=deltas)
+
+
+def get_change_cursor():
+    change = ChangeModel.objects.filter(created_at__lte=timezone.now() - timedelta(seconds=CHANGE_SETTLE_SECONDS)).order_by('-id').only('id').first()
+    return change.id if change else 0
+
+
+def is_change_cursor_expired(after):
+    first = ChangeModel.objects.order_by('id').only('id').first()
+    return first is not None and after < first.id - 1
+
+
+def read_changes(after, user_id=None, size=CHANGE_PAGE_SIZE):
+    # Returns the rows changed after the cursor as they are now and the ids of the deleted ones, of all the users when user_id is None.
+    # The cost depends on the number of changes, the rows are read by primary key.
+    queryset = ChangeModel.objects.filter(id__gt=after, created_at__lte=timezone.now() - timedelta(seconds=CHANGE_SETTLE_SECONDS))
+    if user_id is not None:
+        queryset = queryset.filter(user__id=user_id)
+    changes = list(queryset.order_by('id').only('id', 'model', 'object_id', 'is_deleted')[:size + 1])
+    has_more = len(changes) > size
+    changes = changes[:size]
+    # Only the last change of a row counts, the row is read as it is now.
+    latest = {}
+    for change in changes:
+        latest.pop((change.model, change.object_id), None)
+        latest[(change.model, change.object_id)] = change
+    objects = {}
+    for model_name, model in ((CHANGE_MODEL_ALBUM, AlbumModel, ), (CHANGE_MODEL_IMAGE, ImageModel, ), ):
+        object_ids = [object_id for (name, object_id), change in latest.items() if name == model_name and not change.is_deleted]
+        objects[model_name] = model.objects.in_bulk(object_ids) if object_ids else {}
+    current = {CHANGE_MODEL_ALBUM: [], CHANGE_MODEL_IMAGE: []}
+    deleted = {CHANGE_MODEL_ALBUM: [], CHANGE_MODEL_IMAGE: []}
+    for (model_name, object_id), change in latest.items():
+        obj = objects[model_name].get(object_id)
+        if obj is None or (user_id is not None and obj.user_id != user_id):
+            deleted[model_name].append(object_id)
+        else:
+            current[model_name].append(obj)
+    return current, deleted, changes[-1].id if changes else after, has_more
@@ -0,0 +1,35 @@
+from django.db.models.signals import (
+    post_delete,
+    post_save,
+    pre_save,
+)
+from django.dispatch import receiver
+from .models import (
+    AlbumModel,
+    ImageModel,
+)
+
+
+@receiver(signal=post_save, sender=AlbumModel)
+def signal_albummodel_post_save(sender, instance, created, **kwargs):
+    instance.signal_albummodel_post_save(created=created)
+
+
+@receiver(signal=post_delete, sender=AlbumModel)
+def signal_albummodel_post_delete(sender, instance, **kwargs):
+    instance.signal_albummodel_post_delete()
+
+
+@receiver(signal=pre_save, sender=ImageModel)
+def signal_imagemodel_pre_save(sender, instance, **kwargs):
+    instance.signal_imagemodel_pre_save()
+
+
+@receiver(signal=post_save, sender=ImageModel)
+def signal_imagemodel_post_save(sender, instance, created, **kwargs):
+    instance.signal_imagemodel_post_save(created=created)
+
+
+@receiver(signal=post_delete, sender=ImageModel)
+def signal_imagemodel_post_delete(sender, instance, **kwargs):
+    instance.signal_imagemodel_post_delete()
@@ -0,0 +1,41 @@
+from django import template
+
+from ..caches import get_user_fragment
+
+register = template.Library()
+
+
+class UserCacheNode(template.Node):
+    def __init__(self, nodelist, name, vary_on):
+        self.nodelist = nodelist
+        self.name = name
+        self.vary_on = vary_on
+
+    def render(self, context):
+        user = context['request'].user
+        if not user.is_authenticated:
+            return self.nodelist.render(context)
+        return get_user_fragment(
+            user_id=user.pk,
+            name=self.name,
+            vary_on=[value.resolve(context) for value in self.vary_on],
+            render=lambda: self.nodelist.render(context),
+        )
+
+
+@register.tag(name='usercache')
+def do_usercache(parser, token):
+    """
+    Caches the content of the tag for the user of the request until an album or an image of the user changes.
+
+        {% load dashboard_cache %}
+        {% usercache "image-detail" object.pk %}
+            ...
+        {% endusercache %}
+    """
+    nodelist = parser.parse(('endusercache', ))
+    parser.delete_first_token()
+    bits = token.split_contents()
+    if len(bits) < 2:
+        raise template.TemplateSyntaxError('"{tag}" tag requires at least 1 argument.'.format(tag=bits[0]))
+    return UserCacheNode(nodelist=nodelist, name=bits[1].strip('"\''), vary_on=[parser.compile_filter(bit) for bit in bits[2:]])
@@ -1,3 +1,641 @@
+import base64
+import hashlib
+from unittest import (
+    mock,
+    skipUnless,
+)
+
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.core.files.storage import (
+    FileSystemStorage,
+    default_storage,
+)
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import (
+    DatabaseError,
+    connection,
+    transaction,
+)
+from django.db.models import Model
+from django.http import UnreadablePostError
 from django.test import TestCase
+from django.urls import reverse
+from rest_framework.test import (
+    APIClient,
+    APIRequestFactory,
+    force_authenticate,
+)
+
+from ..testing import (
+    TemporaryMediaMixin,
+    create_test_image,
+    create_test_png,
+    create_test_user,
+)
+from .caches import get_user_fragment
+from .drf.serializers import (
+    AlbumSerializer,
+    ImageSerializer,
+)
+from .drf.views import ImageViewSet
+from .explain import (
+    EXPLAIN_VENDORS,
+    create_explain_rows,
+    explain_queryset,
+    get_explain_querysets,
+    is_full_scan,
+    prepare_explain,
+)
+from .keysets import KEYSET_PAGE_SIZE
+from ..media.models import (
+    JOB_STATUS_DONE,
+    JOB_STATUS_PENDING,
+    JobModel,
+    UploadModel,
+    append_upload,
+    create_upload,
+    run_job,
+)
+from ..security.models import ProfileModel
+from .models import (
+    IMAGE_BLOB_DELETE_JOB,
+    AlbumModel,
+    ImageBlobModel,
+    ImageModel,
+    image_upload_finish,
+)
+
+
+class BulkPartialUpdateTests(TemporaryMediaMixin, TestCase):
+    def setUp(self):
+        super(BulkPartialUpdateTests, self).setUp()
+        self.user = create_test_user(username='bulk')
+        self.album = AlbumModel.objects.create(name='a', user=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_missing_and_duplicate_ids_are_reported_per_item(self):
+        response = self.client.patch('/api/dashboard/album/bulk/', [
+            {'id': self.album.pk, 'name': 'b'},
+            {'name': 'c'},
+            {'id': self.album.pk, 'name': 'd'},
+        ], format='json')
+        self.assertEqual(response.status_code, 400)
+        results = response.json()['results']
+        self.assertEqual([result['status'] for result in results], [424, 400, 400])
+        self.assertIn('id', results[1]['errors'])
+        self.assertIn('id', results[2]['errors'])
+        self.assertEqual(results[2]['pk'], self.album.pk)
+        self.album.refresh_from_db()
+        self.assertEqual(self.album.name, 'a')
+
+
+@skipUnless(connection.vendor in EXPLAIN_VENDORS, 'The query plans of this database are not read.')
+class QueryPlanTests(TemporaryMediaMixin, TestCase):
+    # Every list reads its rows through an index, in the order of the index: no sequential scan of a dashboard table and no filesort.
+    def test_lists_use_their_indexes(self):
+        prepare_explain()
+        user, album = create_explain_rows()
+        for label, queryset, allow_sort in get_explain_querysets(user=user, album=album):
+            with self.subTest(label=label):
+                plan = explain_queryset(queryset=queryset)
+                self.assertFalse(is_full_scan(plan=plan, allow_sort=allow_sort), msg=plan)
+
+
+class ImageListQueryTests(TemporaryMediaMixin, TestCase):
+    # The images of the albums with a name are read with one joined query, whatever the number of albums, plus the query of the ETag.
+    def setUp(self):
+        super(ImageListQueryTests, self).setUp()
+        self.users = [create_test_user(username=username) for username in ('first', 'second', 'third', )]
+        for user in self.users:
+            album = AlbumModel.objects.create(name='shared', user=user)
+            for index in range(3):
+                create_test_image(user=user, title='{username} {index}'.format(username=user.username, index=index), album=album)
+        AlbumModel.objects.create(name='other', user=self.users[0])
+
+    def list_images(self, params):
+        request = APIRequestFactory().get(path='/', data=params)
+        force_authenticate(request=request, user=self.users[0])
+        response = ImageViewSet.as_view({'get': 'list'})(request)
+        response.render()
+        return response
+
+    def test_name(self):
+        with self.assertNumQueries(2):
+            response = self.list_images(params={'name': 'shared'})
+        self.assertEqual(len(response.data['results']), 9)
+
+    def test_name_mine(self):
+        with self.assertNumQueries(2):
+            response = self.list_images(params={'name': 'shared', 'mine': 'true'})
+        self.assertEqual({row['user'] for row in response.data['results']}, {self.users[0].pk})
+
+    def test_albums_sharing_a_name(self):
+        with self.assertNumQueries(2):
+            self.list_images(params={'name': 'shared'})
+        for user in self.users:
+            AlbumModel.objects.create(name='shared', user=user)
+        with self.assertNumQueries(2):
+            response = self.list_images(params={'name': 'shared'})
+        self.assertEqual(len(response.data['results']), 9)
+
+
+class DashboardQueryTests(TemporaryMediaMixin, TestCase):
+    def setUp(self):
+        super(DashboardQueryTests, self).setUp()
+        self.user = create_test_user(username='dashboard')
+        self.album = AlbumModel.objects.create(name='dashboard', user=self.user)
+        self.client.force_login(user=self.user)
+
+    def add_rows(self, count):
+        for index in range(count):
+            user = create_test_user(username='dashboard {index:02d}'.format(index=index))
+            AlbumModel.objects.create(name='dashboard {index:02d}'.format(index=index), user=self.user)
+            create_test_image(user=self.user, title='dashboard {index:02d}'.format(index=index), album=self.album)
+            create_test_image(user=user, title='dashboard {index:02d}'.format(index=index))
+
+    def assertPageQueries(self, num):
+        urls = [
+            reverse('dashboard.dj:index'),
+            reverse('dashboard.dj:tree-user-album', kwargs={'pk': self.user.pk}),
+            reverse('dashboard.dj:tree-user-image', kwargs={'pk': self.user.pk}),
+            reverse('dashboard.dj:tree-album-image', kwargs={'pk': self.album.pk}),
+        ]
+        for url in urls:
+            with self.subTest(url=url), self.assertNumQueries(num):
+                self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_query_count_does_not_grow_with_the_rows(self):
+        self.assertPageQueries(num=3)
+        self.add_rows(count=KEYSET_PAGE_SIZE + 5)
+        self.assertPageQueries(num=3)
+
+
+class DashboardTreeTests(TemporaryMediaMixin, TestCase):
+    # The names repeat, so the pages only line up if the cursor carries the id as well.
+    def setUp(self):
+        super(DashboardTreeTests, self).setUp()
+        self.user = create_test_user(username='tree')
+        for index in range(KEYSET_PAGE_SIZE + 5):
+            AlbumModel.objects.create(name='album {index}'.format(index=index % 5), user=self.user)
+            create_test_image(user=self.user, title='image {index}'.format(index=index % 5))
+        self.client.force_login(user=self.user)
+
+    def read_pages(self, url):
+        rows = []
+        after = None
+        while True:
+            with self.assertNumQueries(3):
+                response = self.client.get(url, {'after': after} if after else {})
+            rows.extend(row.pk for row in response.context['object_list'])
+            after = response.context['next_cursor']
+            if after is None:
+                self.assertNotContains(response, 'Load more')
+                return rows
+            self.assertContains(response, 'data-fragment-more-url="{path}?after='.format(path=url))
+
+    def test_user_albums(self):
+        rows = self.read_pages(url=reverse('dashboard.dj:tree-user-album', kwargs={'pk': self.user.pk}))
+        self.assertEqual(rows, list(AlbumModel.objects.filter(user=self.user).order_by('name', 'id').values_list('id', flat=True)))
+
+    def test_user_images(self):
+        rows = self.read_pages(url=reverse('dashboard.dj:tree-user-image', kwargs={'pk': self.user.pk}))
+        self.assertEqual(rows, list(ImageModel.objects.filter(user=self.user).order_by('title', 'id').values_list('id', flat=True)))
+
+    def test_single_page_has_no_load_more(self):
+        album = AlbumModel.objects.create(name='single', user=self.user)
+        create_test_image(user=self.user, title='single', album=album)
+        response = self.client.get(reverse('dashboard.dj:tree-album-image', kwargs={'pk': album.pk}))
+        self.assertEqual([row.title for row in response.context['object_list']], ['single'])
+        self.assertIsNone(response.context['next_cursor'])
+        self.assertNotContains(response, 'Load more')
+
+    def test_invalid_cursor_starts_over(self):
+        url = reverse('dashboard.dj:tree-user-album', kwargs={'pk': self.user.pk})
+        self.assertEqual(self.client.get(url, {'after': 'invalid'}).context['object_list'], self.client.get(url).context['object_list'])
+
+
+class ConditionalListTests(TemporaryMediaMixin, TestCase):
+    def setUp(self):
+        super(ConditionalListTests, self).setUp()
+        self.user = create_test_user(username='etag')
+        create_test_image(user=self.user, title='etag', album=AlbumModel.objects.create(name='etag', user=self.user))
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_media_url_window_changes_the_etag(self):
+        with mock.patch('backend.dashboard.conditionals.get_media_url_window', return_value=1):
+            etag = self.client.get('/api/dashboard/image/album/', {'name': 'etag'})['ETag']
+            self.assertEqual(self.client.get('/api/dashboard/image/album/', {'name': 'etag'}, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        with mock.patch('backend.dashboard.conditionals.get_media_url_window', return_value=2):
+            response = self.client.get('/api/dashboard/image/album/', {'name': 'etag'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_album_list_without_media_urls_keeps_its_etag(self):
+        with mock.patch('backend.dashboard.conditionals.get_media_url_window', return_value=1):
+            etag = self.client.get('/api/dashboard/album/user/', {'username': 'etag'})['ETag']
+        with mock.patch('backend.dashboard.conditionals.get_media_url_window', return_value=2):
+            self.assertEqual(self.client.get('/api/dashboard/album/user/', {'username': 'etag'}, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+            self.assertNotEqual(self.client.get('/api/dashboard/album/user/', {'username': 'etag', 'include': 'images'}, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+
+class UserFragmentTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_fragments_follow_the_media_url_window(self):
+        render = mock.Mock(side_effect=['first', 'second', 'third'])
+        with mock.patch('backend.dashboard.caches.get_media_url_window', return_value=1), mock.patch('backend.dashboard.caches.get_media_url_window_timeout', return_value=10), mock.patch('backend.dashboard.caches.cache.set') as cache_set:
+            self.assertEqual(get_user_fragment(user_id=1, name='image-list', vary_on=[], render=render), 'first')
+        self.assertEqual(cache_set.call_args[1]['timeout'], 10)
+        with mock.patch('backend.dashboard.caches.get_media_url_window', return_value=1):
+            self.assertEqual(get_user_fragment(user_id=1, name='image-list', vary_on=[], render=render), 'second')
+            self.assertEqual(get_user_fragment(user_id=1, name='image-list', vary_on=[], render=render), 'second')
+        with mock.patch('backend.dashboard.caches.get_media_url_window', return_value=2):
+            self.assertEqual(get_user_fragment(user_id=1, name='image-list', vary_on=[], render=render), 'third')
+
+
+@mock.patch('backend.dashboard.models.CHANGE_SETTLE_SECONDS', 0)
+class SyncTests(TemporaryMediaMixin, TestCase):
+    def setUp(self):
+        super(SyncTests, self).setUp()
+        self.users = [create_test_user(username=username) for username in ('sync-a', 'sync-b', )]
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.users[0])
+
+    def sync(self, cursor, username=None):
+        params = {'cursor': cursor}
+        if username:
+            params['username'] = username
+        response = self.client.get('/api/dashboard/sync/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def start(self):
+        return self.client.get('/api/dashboard/sync/').json()['cursor']
+
+    def test_cursor_moves_past_the_changes(self):
+        cursor = self.start()
+        album = AlbumModel.objects.create(name='sync', user=self.users[0])
+        data = self.sync(cursor=cursor)
+        self.assertEqual([row['id'] for row in data['albums']], [album.pk])
+        self.assertFalse(data['has_more'])
+        data = self.sync(cursor=data['cursor'])
+        self.assertEqual(data['albums'], [])
+        album.name = 'renamed'
+        album.save()
+        data = self.sync(cursor=data['cursor'])
+        self.assertEqual([row['name'] for row in data['albums']], ['renamed'])
+
+    def test_deleted_rows_leave_tombstones(self):
+        image = ImageModel.objects.create(title='sync', user=self.users[0])
+        cursor = self.start()
+        image_id = image.pk
+        image.delete()
+        data = self.sync(cursor=cursor)
+        self.assertEqual(data['images'], [])
+        self.assertEqual(data['deleted']['images'], [image_id])
+
+    def test_row_given_to_another_user(self):
+        image = ImageModel.objects.create(title='sync', user=self.users[0])
+        cursor = self.start()
+        image.user = self.users[1]
+        image.save()
+        data = self.sync(cursor=cursor, username='sync-a')
+        self.assertEqual(data['images'], [])
+        self.assertEqual(data['deleted']['images'], [image.pk])
+        data = self.sync(cursor=cursor, username='sync-b')
+        self.assertEqual([row['id'] for row in data['images']], [image.pk])
+        self.assertEqual(data['deleted']['images'], [])
+
+
+class CounterTests(TemporaryMediaMixin, TestCase):
+    def setUp(self):
+        super(CounterTests, self).setUp()
+        self.user = create_test_user(username='count')
+        self.first = AlbumModel.objects.create(name='first', user=self.user)
+        self.second = AlbumModel.objects.create(name='second', user=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def assertCounts(self, first, second, albums, images):
+        self.assertEqual(AlbumModel.objects.get(pk=self.first.pk).image_count, first)
+        self.assertEqual(AlbumModel.objects.get(pk=self.second.pk).image_count, second)
+        profile = ProfileModel.objects.get(user=self.user)
+        self.assertEqual((profile.album_count, profile.image_count, ), (albums, images, ))
+
+    def test_profile_counts(self):
+        self.assertCounts(first=0, second=0, albums=2, images=0)
+        image = ImageModel.objects.create(title='a', album=self.first, user=self.user)
+        self.assertCounts(first=1, second=0, albums=2, images=1)
+        image.delete()
+        self.assertCounts(first=0, second=0, albums=2, images=0)
+
+    def test_image_given_to_another_album(self):
+        image = ImageModel.objects.create(title='a', album=self.first, user=self.user)
+        image.album = self.second
+        image.save()
+        self.assertCounts(first=0, second=1, albums=2, images=1)
+        image.album = None
+        image.save()
+        self.assertCounts(first=0, second=0, albums=2, images=1)
+
+    def test_deleted_album_sets_its_images_to_null(self):
+        image = ImageModel.objects.create(title='a', album=self.first, user=self.user)
+        self.first.delete()
+        self.assertIsNone(ImageModel.objects.get(pk=image.pk).album_id)
+        self.assertEqual(AlbumModel.objects.get(pk=self.second.pk).image_count, 0)
+        profile = ProfileModel.objects.get(user=self.user)
+        self.assertEqual((profile.album_count, profile.image_count, ), (1, 1, ))
+
+    def test_bulk_create_and_delete(self):
+        response = self.client.post('/api/dashboard/image/bulk/', [
+            {'title': 'a', 'album': self.first.pk, 'user': self.user.pk},
+            {'title': 'b', 'album': self.first.pk, 'user': self.user.pk},
+            {'title': 'c', 'album': self.second.pk, 'user': self.user.pk},
+        ], format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertCounts(first=2, second=1, albums=2, images=3)
+        pks = [result['pk'] for result in response.json()['results']]
+        response = self.client.delete('/api/dashboard/image/bulk/?pk={pks}'.format(pks=','.join(str(pk) for pk in pks[:2])))
+        self.assertEqual(response.status_code, 200)
+        self.assertCounts(first=0, second=1, albums=2, images=1)
+
+    def test_stale_save_keeps_the_counters(self):
+        stale = AlbumModel.objects.get(pk=self.first.pk)
+        ImageModel.objects.create(title='a', album=self.first, user=self.user)
+        stale.name = 'renamed'
+        stale.save()
+        self.assertEqual(AlbumModel.objects.get(pk=self.first.pk).name, 'renamed')
+        self.assertCounts(first=1, second=0, albums=2, images=1)
+
+    def test_save_goes_through_the_update_hook(self):
+        do_update = Model._do_update
+        with mock.patch.object(Model, '_do_update', autospec=True, side_effect=do_update) as hook:
+            AlbumModel.objects.get(pk=self.first.pk).save()
+        self.assertEqual(hook.call_count, 1)
+        self.assertNotIn('image_count', [value[0].name for value in hook.call_args[0][4]])
+
+    def test_save_of_a_deleted_row_inserts_it(self):
+        album = AlbumModel.objects.get(pk=self.second.pk)
+        AlbumModel.objects.filter(pk=album.pk).delete()
+        album.save()
+        self.assertTrue(AlbumModel.objects.filter(pk=album.pk).exists())
+        with self.assertRaises(DatabaseError):
+            AlbumModel(pk=album.pk + 100, name='missing', user=self.user).save(update_fields=['name'])
+
+
+class ImageUploadTests(TemporaryMediaMixin, TestCase):
+    def setUp(self):
+        super(ImageUploadTests, self).setUp()
+        self.users = [create_test_user(username=username) for username in ('owner', 'other', )]
+        self.image = create_test_image(user=self.users[0], title='owned')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.users[1])
+
+    def test_image_of_another_user_is_not_found(self):
+        metadata = 'filename {filename},target {target},pk {pk}'.format(
+            filename=base64.b64encode(b'image.png').decode('ascii'),
+            target=base64.b64encode(b'image').decode('ascii'),
+            pk=base64.b64encode(str(self.image.pk).encode('ascii')).decode('ascii'),
+        )
+        response = self.client.post('/api/media/uploads/', HTTP_TUS_RESUMABLE='1.0.0', HTTP_UPLOAD_LENGTH='100', HTTP_UPLOAD_METADATA=metadata)
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(UploadModel.objects.exists())
+        with self.assertRaises(ValidationError):
+            image_upload_finish(user=self.users[1], arguments={'pk': self.image.pk}, file=ContentFile(b'', name='image.png'))
+
+    def test_chunk_of_a_dropped_connection_is_kept(self):
+        upload = create_upload(target='image', arguments={'pk': self.image.pk}, user=self.users[0], filename='image.png', length=10)
+        stream = mock.Mock()
+        stream.read.side_effect = [b'12345', UnreadablePostError('Connection reset by peer')]
+        self.assertEqual(append_upload(upload=upload, offset=0, stream=stream), 5)
+        self.assertEqual(UploadModel.objects.get(pk=upload.pk).offset, 5)
+
+    def test_io_error_is_a_server_error(self):
+        upload = create_upload(target='image', arguments={'pk': self.image.pk}, user=self.users[0], filename='image.png', length=10)
+        self.client.force_authenticate(user=self.users[0])
+        stream = mock.Mock()
+        stream.read.side_effect = OSError(28, 'No space left on device')
+        with mock.patch('rest_framework.request.Request.stream', new_callable=mock.PropertyMock, return_value=stream):
+            with self.assertLogs('backend.media.views', level='ERROR'):
+                response = self.client.patch('/api/media/uploads/{pk}/'.format(pk=upload.pk), b'12345', content_type='application/offset+octet-stream', HTTP_TUS_RESUMABLE='1.0.0', HTTP_UPLOAD_OFFSET='0')
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(UploadModel.objects.get(pk=upload.pk).offset, 0)
+
+
+class ImageFormUploadTests(TemporaryMediaMixin, TestCase):
+    def setUp(self):
+        super(ImageFormUploadTests, self).setUp()
+        self.user = create_test_user(username='form')
+        self.image = create_test_image(user=self.user, title='form')
+        self.client.force_login(user=self.user)
+
+    def test_sha256_of_the_upload_handler_is_reused(self):
+        content = create_test_png(color='red')
+        with mock.patch('backend.media.metadata.hashlib') as metadata_hashlib:
+            response = self.client.post(reverse(viewname='dashboard.dj:image-update', kwargs={'pk': self.image.pk}), {
+                'title': 'form',
+                'image': SimpleUploadedFile(name='form.png', content=content, content_type='image/png'),
+            })
+        self.assertEqual(response.status_code, 302)
+        metadata_hashlib.sha256.assert_not_called()
+        self.image.refresh_from_db()
+        self.assertEqual(self.image.image_sha256, hashlib.sha256(content).hexdigest())
+        self.assertEqual(self.image.image_size, len(content))
+        self.assertEqual((self.image.image_width, self.image.image_height), (2, 2))
+
+
+class ImageBlobTests(TemporaryMediaMixin, TestCase):
+    def setUp(self):
+        super(ImageBlobTests, self).setUp()
+        self.user = create_test_user(username='blob')
+        self.storage = ImageModel._meta.get_field('image').storage
+
+    def create_image(self, title, content):
+        return create_test_image(user=self.user, title=title, content=content)
+
+    def get_ref_count(self, name):
+        return ImageBlobModel.objects.filter(name=name).values_list('ref_count', flat=True).first()
+
+    def run_blob_delete_jobs(self):
+        for job_id in JobModel.objects.filter(name=IMAGE_BLOB_DELETE_JOB, status=JOB_STATUS_PENDING).values_list('id', flat=True):
+            self.assertEqual(run_job(job_id=job_id), JOB_STATUS_DONE)
+
+    def test_same_content_shares_one_file(self):
+        content = create_test_png(color='red')
+        first = self.create_image(title='first', content=content)
+        with mock.patch.object(FileSystemStorage, 'save', autospec=True, side_effect=FileSystemStorage.save) as storage_save:
+            second = self.create_image(title='second', content=content)
+        storage_save.assert_not_called()
+        self.assertEqual(second.image.name, first.image.name)
+        self.assertEqual(ImageBlobModel.objects.count(), 1)
+        self.assertEqual(self.get_ref_count(name=first.image.name), 2)
+        self.assertEqual(second.image_sha256, hashlib.sha256(content).hexdigest())
+
+    def test_last_release_deletes_the_file(self):
+        content = create_test_png(color='red')
+        first = self.create_image(title='first', content=content)
+        second = self.create_image(title='second', content=content)
+        name = first.image.name
+        first.delete()
+        self.run_blob_delete_jobs()
+        self.assertEqual(self.get_ref_count(name=name), 1)
+        self.assertTrue(self.storage.exists(name))
+        second.delete()
+        self.assertIsNone(self.get_ref_count(name=name))
+        self.assertTrue(self.storage.exists(name))
+        self.run_blob_delete_jobs()
+        self.assertFalse(self.storage.exists(name))
+
+    def test_replaced_file_releases_the_previous_one(self):
+        red = create_test_png(color='red')
+        first = self.create_image(title='first', content=red)
+        second = self.create_image(title='second', content=red)
+        red_name = first.image.name
+        first.image = ContentFile(create_test_png(color='blue'), name='first.png')
+        first.save()
+        blue_name = first.image.name
+        self.assertNotEqual(blue_name, red_name)
+        self.assertEqual(self.get_ref_count(name=red_name), 1)
+        self.assertEqual(self.get_ref_count(name=blue_name), 1)
+        second = ImageModel.objects.get(pk=second.pk)
+        second.image = ContentFile(create_test_png(color='blue'), name='second.png')
+        second.save()
+        self.assertEqual(second.image.name, blue_name)
+        self.assertEqual(self.get_ref_count(name=blue_name), 2)
+        self.assertIsNone(self.get_ref_count(name=red_name))
+        self.run_blob_delete_jobs()
+        self.assertFalse(self.storage.exists(red_name))
+        self.assertTrue(self.storage.exists(blue_name))
+
+    def test_rollback_keeps_the_reference_counts(self):
+        content = create_test_png(color='red')
+        first = self.create_image(title='first', content=content)
+        with self.assertRaises(DatabaseError):
+            with transaction.atomic():
+                self.create_image(title='second', content=content)
+                self.create_image(title='third', content=create_test_png(color='blue'))
+                self.assertEqual(self.get_ref_count(name=first.image.name), 2)
+                raise DatabaseError('Rolled back.')
+        self.assertEqual(ImageModel.objects.count(), 1)
+        self.assertEqual(list(ImageBlobModel.objects.values_list('name', 'ref_count')), [(first.image.name, 1)])
+
+
+class PresignedUploadTests(TemporaryMediaMixin, TestCase):
+    def setUp(self):
+        super(PresignedUploadTests, self).setUp()
+        self.users = [create_test_user(username=username) for username in ('owner', 'other', )]
+        self.image = create_test_image(user=self.users[0], title='owned')
+        self.client = APIClient()
+
+    def test_image_of_another_user_is_not_found(self):
+        self.client.force_authenticate(user=self.users[1])
+        response = self.client.post('/api/dashboard/image/upload/?pk={pk}'.format(pk=self.image.pk), {'filename': 'image.png'}, format='json')
+        self.assertEqual(response.status_code, 404)
+        response = self.client.post('/api/dashboard/image/upload/finalize/?pk={pk}'.format(pk=self.image.pk))
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(ImageModel.objects.get(pk=self.image.pk).image_upload_name, '')
+
+    def test_new_image_belongs_to_the_requesting_user(self):
+        self.client.force_authenticate(user=self.users[1])
+        response = self.client.post('/api/dashboard/image/upload/', {'filename': 'image.png', 'title': 'new', 'user': self.users[0].pk}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(ImageModel.objects.get(pk=response.json()['image']['id']).user_id, self.users[1].pk)
+
+    def test_anonymous_user_is_rejected(self):
+        for path in ('/api/dashboard/image/upload/', '/api/dashboard/image/upload/?pk={pk}'.format(pk=self.image.pk), '/api/dashboard/image/upload/finalize/?pk={pk}'.format(pk=self.image.pk), ):
+            with self.subTest(path=path):
+                response = self.client.post(path, {'filename': 'image.png', 'title': 'new'}, format='json')
+                self.assertIn(response.status_code, (401, 403, ))
+        self.assertEqual(ImageModel.objects.count(), 1)
+
+    def request_upload(self, pk=None):
+        path = '/api/dashboard/image/upload/'
+        if pk is not None:
+            path = '{path}?pk={pk}'.format(path=path, pk=pk)
+        response = self.client.post(path, {'filename': 'image.png', 'title': 'new'}, format='json')
+        self.assertEqual(response.status_code, 200 if pk is not None else 201)
+        return response.json()
+
+    def send_file(self, upload, content):
+        data = dict(upload['fields'], **{'Content-Type': 'image/png', 'file': SimpleUploadedFile(name='image.png', content=content, content_type='image/png')})
+        self.assertEqual(self.client.post(upload['url'], data).status_code, 204)
+
+    def finalize(self, pk):
+        return self.client.post('/api/dashboard/image/upload/finalize/?pk={pk}'.format(pk=pk))
+
+    def test_create_then_finalize(self):
+        self.client.force_authenticate(user=self.users[0])
+        data = self.request_upload()
+        name = data['upload']['fields']['key']
+        self.assertEqual(ImageModel.objects.get(pk=data['image']['id']).image_upload_name, name)
+        content = create_test_png(color='red')
+        self.send_file(upload=data['upload'], content=content)
+        response = self.finalize(pk=data['image']['id'])
+        self.assertEqual(response.status_code, 200)
+        image = ImageModel.objects.get(pk=data['image']['id'])
+        self.assertEqual((image.image.name, image.image_upload_name, ), (name, '', ))
+        self.assertEqual((image.image_size, image.image_width, image.image_height, ), (len(content), 2, 2, ))
+
+    def test_finalize_without_upload(self):
+        self.client.force_authenticate(user=self.users[0])
+        self.assertEqual(self.finalize(pk=self.image.pk).status_code, 400)
+        name = self.request_upload(pk=self.image.pk)['upload']['fields']['key']
+        response = self.finalize(pk=self.image.pk)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(ImageModel.objects.get(pk=self.image.pk).image_upload_name, name)
+
+    def test_invalid_file_is_deleted(self):
+        self.client.force_authenticate(user=self.users[0])
+        upload = self.request_upload(pk=self.image.pk)['upload']
+        self.send_file(upload=upload, content=b'not an image')
+        self.assertEqual(self.finalize(pk=self.image.pk).status_code, 400)
+        self.assertFalse(default_storage.exists(upload['fields']['key']))
+        self.assertEqual(ImageModel.objects.get(pk=self.image.pk).image_upload_name, '')
+
+    def test_oversized_file_is_deleted(self):
+        self.client.force_authenticate(user=self.users[0])
+        upload = self.request_upload(pk=self.image.pk)['upload']
+        self.send_file(upload=upload, content=create_test_png(color='red') + b'\0' * 2048)
+        with mock.patch('backend.dashboard.models.IMAGE_MAX_SIZE', 1):
+            response = self.finalize(pk=self.image.pk)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Maximum file size', response.json()['image'][0])
+        self.assertFalse(default_storage.exists(upload['fields']['key']))
+        self.assertEqual(ImageModel.objects.get(pk=self.image.pk).image_upload_name, '')
+
+    def test_upload_again_on_an_existing_image(self):
+        self.client.force_authenticate(user=self.users[0])
+        first = self.request_upload(pk=self.image.pk)['upload']
+        self.send_file(upload=first, content=create_test_png(color='red'))
+        second = self.request_upload(pk=self.image.pk)['upload']
+        self.assertNotEqual(second['fields']['key'], first['fields']['key'])
+        self.assertFalse(default_storage.exists(first['fields']['key']))
+        self.send_file(upload=second, content=create_test_png(color='blue'))
+        self.assertEqual(self.finalize(pk=self.image.pk).status_code, 200)
+        self.assertEqual(ImageModel.objects.get(pk=self.image.pk).image.name, second['fields']['key'])
+
+
+class ValuesRepresentationTests(TemporaryMediaMixin, TestCase):
+    def setUp(self):
+        super(ValuesRepresentationTests, self).setUp()
+        self.user = create_test_user(username='values')
+        self.album = AlbumModel.objects.create(name='values', user=self.user)
+        create_test_image(user=self.user, title='file', album=self.album, content=create_test_png(color='red'))
+        ImageModel.objects.filter(title='file').update(image_derivatives_ready=True)
+        create_test_image(user=self.user, title='pending', album=self.album, content=create_test_png(color='blue'))
+        create_test_image(user=self.user, title='empty')
+
+    def assertSameRepresentation(self, serializer_class, instance):
+        row = serializer_class.Meta.model.objects.values(*serializer_class.Meta.values_fields).get(pk=instance.pk)
+        self.assertEqual(serializer_class.values_to_representation(row=row), serializer_class(instance).data)
 
-# Create your tests here.
+    def test_rows_match_the_serializers(self):
+        for image in ImageModel.objects.all():
+            with self.subTest(image=image.title):
+                self.assertSameRepresentation(serializer_class=ImageSerializer, instance=image)
+        self.assertSameRepresentation(serializer_class=AlbumSerializer, instance=self.album)
@@ -0,0 +1,57 @@
+"""Fixed-size derivatives (thumbnail and medium preview) stored next to the original image."""
+import os
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from PIL import Image
+
+from .metadata import read_image_metadata
+
+DERIVATIVE_THUMBNAIL = 'thumbnail'
+DERIVATIVE_MEDIUM = 'medium'
+# Twice the 32x32 and 160x160 they are shown at, for high density screens.
+DERIVATIVE_SIZES = {
+    DERIVATIVE_THUMBNAIL: (64, 64),
+    DERIVATIVE_MEDIUM: (320, 320),
+}
+
+
+def get_derivative_name(name, derivative):
+    root, ext = os.path.splitext(name)
+    return '{root}.{derivative}{ext}'.format(root=root, derivative=derivative, ext=ext)
+
+
+def get_derivative_url(field_file, derivative):
+    if not field_file:
+        return None
+    return field_file.storage.url(get_derivative_name(name=field_file.name, derivative=derivative))
+
+
+def create_derivatives(field_file):
+    # Returns the metadata of the original, read from the same bytes.
+    storage = field_file.storage
+    with storage.open(field_file.name, 'rb') as file:
+        original_content = file.read()
+    original = Image.open(BytesIO(original_content))
+    original.load()
+    for derivative, size in DERIVATIVE_SIZES.items():
+        name = get_derivative_name(name=field_file.name, derivative=derivative)
+        image_format = Image.registered_extensions().get(os.path.splitext(name)[1].lower(), 'PNG')
+        image = original.copy()
+        image.thumbnail(size=size)
+        if image_format == 'JPEG' and image.mode not in ('RGB', 'L', ):
+            image = image.convert('RGB')
+        elif image.mode == 'CMYK':
+            image = image.convert('RGB')
+        content = BytesIO()
+        image.save(content, format=image_format)
+        # Neither storage overwrites an existing file, it would save the derivative under another name.
+        if storage.exists(name):
+            storage.delete(name)
+        storage.save(name, ContentFile(content.getvalue()))
+    return read_image_metadata(file=ContentFile(original_content, name=field_file.name))
+
+
+def delete_derivatives(storage, name):
+    for derivative in DERIVATIVE_SIZES:
+        storage.delete(get_derivative_name(name=name, derivative=derivative))
@@ -0,0 +1,115 @@
+"""Upload handler that rejects an image while it is received, as soon as its size or the dimensions in its header are over the limits of its field."""
+import hashlib
+import struct
+
+from django.core.files.uploadhandler import (
+    FileUploadHandler,
+    SkipFile,
+)
+
+# The headers of PNG, GIF and WebP need a few dozen bytes, the ones of JPEG fit in the first segments.
+IMAGE_HEADER_MAX_SIZE = 65536
+# The JPEG start of frame markers, which hold the dimensions (the others in 0xc0-0xcf are tables).
+JPEG_SOF_MARKERS = set(range(0xc0, 0xd0)) - {0xc4, 0xc8, 0xcc}
+
+# Keyed by form field name: (max size in KB, max width, max height).
+_image_upload_limits = {}
+
+
+def register_image_upload_limits(field_name, max_size, max_width, max_height):
+    _image_upload_limits[field_name] = (max_size, max_width, max_height)
+
+
+def get_image_header_dimensions(head):
+    # Returns the (width, height) of a PNG, GIF, JPEG or WebP file from its first bytes, or None while they are not enough or for another format.
+    if head[:8] == b'\x89PNG\r\n\x1a\n':
+        if len(head) >= 24 and head[12:16] == b'IHDR':
+            return struct.unpack('>II', head[16:24])
+        return None
+    if head[:6] in (b'GIF87a', b'GIF89a', ):
+        if len(head) >= 10:
+            return struct.unpack('<HH', head[6:10])
+        return None
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        chunk = head[12:16]
+        if chunk == b'VP8 ' and len(head) >= 30:
+            width, height = struct.unpack('<HH', head[26:30])
+            return width & 0x3fff, height & 0x3fff
+        if chunk == b'VP8L' and len(head) >= 25:
+            bits = int.from_bytes(head[21:25], 'little')
+            return (bits & 0x3fff) + 1, ((bits >> 14) & 0x3fff) + 1
+        if chunk == b'VP8X' and len(head) >= 30:
+            return int.from_bytes(head[24:27], 'little') + 1, int.from_bytes(head[27:30], 'little') + 1
+        return None
+    if head[:2] == b'\xff\xd8':
+        offset = 2
+        while offset + 4 <= len(head):
+            if head[offset] != 0xff:
+                return None
+            marker = head[offset + 1]
+            if marker == 0xff:
+                offset += 1
+            elif marker == 0x01 or 0xd0 <= marker <= 0xd8:
+                offset += 2
+            elif marker in JPEG_SOF_MARKERS:
+                if offset + 9 > len(head):
+                    return None
+                height, width = struct.unpack('>HH', head[offset + 5:offset + 9])
+                return width, height
+            else:
+                offset += 2 + struct.unpack('>H', head[offset + 2:offset + 4])[0]
+        return None
+    return None
+
+
+def get_upload_error(request, field_name):
+    # Why the file was skipped, the forms report it since the file is missing from request.FILES.
+    return getattr(request, 'upload_errors', {}).get(field_name)
+
+
+def get_upload_sha256(request, field_name):
+    # Handed to the metadata of the save so the file is not hashed again.
+    return getattr(request, 'upload_sha256', {}).get(field_name)
+
+
+class ImageUploadLimitHandler(FileUploadHandler):
+    # A file over the limits is neither kept nor opened with Pillow, the rest of it is still read from the request.
+    def new_file(self, field_name, *args, **kwargs):
+        super(ImageUploadLimitHandler, self).new_file(field_name, *args, **kwargs)
+        self.limits = _image_upload_limits.get(field_name)
+        self.received = 0
+        self.head = bytearray() if self.limits is not None else None
+        self.sha256 = hashlib.sha256() if self.limits is not None else None
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.limits is None:
+            return raw_data
+        max_size, max_width, max_height = self.limits
+        self.received += len(raw_data)
+        if self.received // 1024 > max_size:
+            self.reject(message='Maximum file size that can be uploaded is {max_size} KB.'.format(max_size=max_size))
+        if self.head is not None:
+            self.head.extend(raw_data[:IMAGE_HEADER_MAX_SIZE - len(self.head)])
+            dimensions = get_image_header_dimensions(head=bytes(self.head))
+            if dimensions is not None:
+                self.head = None
+                if dimensions[0] > max_width or dimensions[1] > max_height:
+                    self.reject(message='Dimensions are larger than what is allowed: {max_width}x{max_height} pixels.'.format(max_width=max_width, max_height=max_height))
+            elif len(self.head) >= IMAGE_HEADER_MAX_SIZE:
+                # Not one of the formats read here, the validators of the field check it once it is received.
+                self.head = None
+        self.sha256.update(raw_data)
+        return raw_data
+
+    def reject(self, message):
+        if not hasattr(self.request, 'upload_errors'):
+            self.request.upload_errors = {}
+        self.request.upload_errors[self.field_name] = message
+        raise SkipFile(message)
+
+    def file_complete(self, file_size):
+        if self.limits is not None:
+            if not hasattr(self.request, 'upload_sha256'):
+                self.request.upload_sha256 = {}
+            self.request.upload_sha256[self.field_name] = self.sha256.hexdigest()
+        return None
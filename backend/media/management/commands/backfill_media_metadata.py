@@ -0,0 +1,85 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from django.apps import apps
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from ...metadata import (
+    get_image_metadata_fields,
+    read_image_metadata,
+)
+
+# The image fields which keep their metadata on their row: (app label, model name, field name).
+MEDIA_METADATA_FIELDS = (
+    ('dashboard', 'ImageModel', 'image', ),
+    ('security', 'ProfileModel', 'avatar', ),
+)
+
+
+def read_stored_metadata(storage, name):
+    # None for a missing file or one that is not an image.
+    try:
+        with storage.open(name, 'rb') as file:
+            return read_image_metadata(file=file)
+    except Exception:
+        return None
+
+
+class Command(BaseCommand):
+    help = 'Stores the dimensions, size, content type and SHA-256 of the images and avatars uploaded before they were kept on their rows, reading the files in parallel.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None, help='Number of files read at the same time, the size of the S3 connection pool by default.')
+        parser.add_argument('--batch-size', type=int, default=500, help='Number of rows read from the database at a time.')
+        parser.add_argument('--force', action='store_true', help='Reads the metadata of every file again, not only the missing ones.')
+
+    def handle(self, *args, **options):
+        if settings.LOCAL is True:
+            workers = options['workers'] or os.cpu_count() or 1
+        else:
+            workers = options['workers'] or settings.AWS_S3_MAX_POOL_CONNECTIONS
+        self.verbosity = options['verbosity']
+        batch_size = max(options['batch_size'], 1)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for app_label, model_name, field_name in MEDIA_METADATA_FIELDS:
+                model = apps.get_model(app_label=app_label, model_name=model_name)
+                storage = model._meta.get_field(field_name).storage
+                queryset = model.objects.exclude(**{field_name: ''}).exclude(**{'{field}__isnull'.format(field=field_name): True})
+                if not options['force']:
+                    queryset = queryset.filter(**{'{field}_sha256'.format(field=field_name): ''})
+                rows = queryset.order_by('pk').values_list('pk', field_name)
+                updated = 0
+                failed = 0
+                batch = []
+                for row in rows.iterator(chunk_size=batch_size):
+                    batch.append(row)
+                    if len(batch) >= batch_size:
+                        batch_updated, batch_failed = self.backfill_batch(executor=executor, model=model, storage=storage, field_name=field_name, batch=batch)
+                        updated += batch_updated
+                        failed += batch_failed
+                        batch = []
+                if batch:
+                    batch_updated, batch_failed = self.backfill_batch(executor=executor, model=model, storage=storage, field_name=field_name, batch=batch)
+                    updated += batch_updated
+                    failed += batch_failed
+                self.stdout.write('{model} {field}: {updated} row(s) updated, {failed} file(s) missing or unreadable.'.format(
+                    model=model._meta.verbose_name,
+                    field=field_name,
+                    updated=updated,
+                    failed=failed,
+                ))
+
+    def backfill_batch(self, executor, model, storage, field_name, batch):
+        # The files of the batch are read by the workers, the rows are updated from this thread only if they still point to the same file.
+        updated = 0
+        failed = 0
+        results = executor.map(lambda row: read_stored_metadata(storage=storage, name=row[1]), batch)
+        for (pk, name), metadata in zip(batch, results):
+            if metadata is None:
+                failed += 1
+                if self.verbosity > 1:
+                    self.stdout.write('{model} {pk}: {name} cannot be read.'.format(model=model._meta.verbose_name, pk=pk, name=name))
+                continue
+            updated += model.objects.filter(**{'pk': pk, field_name: name}).update(**get_image_metadata_fields(prefix=field_name, metadata=metadata))
+        return updated, failed
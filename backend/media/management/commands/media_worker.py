@@ -0,0 +1,60 @@
+import multiprocessing
+import os
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from ...models import (
+    claim_jobs,
+    release_stale_jobs,
+    run_job,
+)
+
+
+class Command(BaseCommand):
+    help = 'Runs the pending media jobs (image derivatives) on a pool of processes sized to the cores.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=os.cpu_count() or 1, help='Number of processes of the pool, the number of cores by default.')
+        parser.add_argument('--poll', type=float, default=1.0, help='Seconds to wait when there is no pending job.')
+        parser.add_argument('--once', action='store_true', help='Exits once there is no pending job left.')
+
+    def handle(self, *args, **options):
+        processes = max(options['processes'], 1)
+        released = release_stale_jobs()
+        if released:
+            self.stdout.write('Released {released} stale job(s).'.format(released=released))
+        # The pool forks this process, every child opens its own connections.
+        connections.close_all()
+        in_flight_lock = threading.Lock()
+        in_flight = [0]
+
+        def job_finished(result):
+            with in_flight_lock:
+                in_flight[0] -= 1
+
+        with multiprocessing.Pool(processes=processes) as pool:
+            self.stdout.write('Running media jobs on {processes} process(es).'.format(processes=processes))
+            try:
+                while True:
+                    with in_flight_lock:
+                        free = processes - in_flight[0]
+                    job_ids = claim_jobs(limit=free) if free > 0 else []
+                    connections.close_all()
+                    for job_id in job_ids:
+                        with in_flight_lock:
+                            in_flight[0] += 1
+                        pool.apply_async(func=run_job, kwds={'job_id': job_id}, callback=job_finished, error_callback=job_finished)
+                    if job_ids:
+                        continue
+                    with in_flight_lock:
+                        idle = in_flight[0] == 0
+                    if options['once'] and idle:
+                        break
+                    time.sleep(options['poll'])
+            except KeyboardInterrupt:
+                self.stdout.write('Stopping, waiting for the running jobs.')
+            pool.close()
+            pool.join()
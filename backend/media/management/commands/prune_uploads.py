@@ -0,0 +1,41 @@
+import os
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from ...models import (
+    UPLOAD_EXPIRES,
+    UploadModel,
+    delete_upload,
+)
+
+
+class Command(BaseCommand):
+    help = 'Deletes the resumable uploads without a new chunk for longer than their expiry, with their partial files, and the partial files left without an upload.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seconds', type=int, default=UPLOAD_EXPIRES, help='Seconds without a new chunk after which an upload is deleted.')
+
+    def handle(self, *args, **options):
+        expired_at = timezone.now() - timedelta(seconds=options['seconds'])
+        deleted = 0
+        for upload in UploadModel.objects.filter(updated_at__lt=expired_at).iterator():
+            delete_upload(upload=upload)
+            deleted += 1
+        self.stdout.write('Deleted {deleted} expired upload(s).'.format(deleted=deleted))
+        # Only the old orphans are removed, an upload being created already has its file.
+        orphans = 0
+        if os.path.isdir(settings.UPLOAD_SPOOL_ROOT):
+            upload_ids = set(UploadModel.objects.values_list('id', flat=True))
+            for entry in os.scandir(settings.UPLOAD_SPOOL_ROOT):
+                upload_id = entry.name[:-len('.part')]
+                if not entry.name.endswith('.part') or not upload_id.isdigit() or int(upload_id) in upload_ids:
+                    continue
+                if entry.stat().st_mtime > time.time() - options['seconds']:
+                    continue
+                os.remove(entry.path)
+                orphans += 1
+        self.stdout.write('Deleted {orphans} orphan partial file(s).'.format(orphans=orphans))
@@ -0,0 +1,52 @@
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import (
+    BaseCommand,
+    CommandError,
+)
+
+from ...s3 import (
+    delete_s3_prefix,
+    get_s3_client,
+)
+
+
+def delete_s3_prefix_one_by_one(bucket_name, prefix):
+    # The previous path: one DELETE request per listed object.
+    s3_client = get_s3_client()
+    for page in s3_client.get_paginator('list_objects_v2').paginate(Bucket=bucket_name, Prefix=prefix):
+        for obj in page.get('Contents', []):
+            s3_client.delete_object(Bucket=bucket_name, Key=obj['Key'])
+    return []
+
+
+class Command(BaseCommand):
+    help = 'Compares deleting a prefix one object at a time with batched multi-object deletes. Point DJANGO_SETTINGS_AWS_S3_ENDPOINT_URL to a local S3 stand-in.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--objects', nargs='+', type=int, default=[100, 1000, 2500], help='Number of objects under the prefix of every run.')
+
+    def handle(self, *args, **options):
+        if settings.LOCAL is True:
+            raise CommandError('The benchmark needs the S3 settings, it cannot run with DJANGO_SETTINGS_LOCAL=True.')
+        bucket_name = settings.AWS_STORAGE_BUCKET_NAME
+        self.stdout.write('{objects:>10} {path:>12} {seconds:>10} {errors:>8}'.format(objects='objects', path='path', seconds='seconds', errors='errors'))
+        for objects in options['objects']:
+            for path, delete in (('one-by-one', delete_s3_prefix_one_by_one), ('batched', delete_s3_prefix), ):
+                prefix = 'benchmark/{uuid}/'.format(uuid=uuid.uuid4().hex)
+                self.create_objects(bucket_name=bucket_name, prefix=prefix, objects=objects)
+                start = time.perf_counter()
+                errors = delete(bucket_name=bucket_name, prefix=prefix)
+                seconds = time.perf_counter() - start
+                self.stdout.write('{objects:>10} {path:>12} {seconds:>10.4f} {errors:>8}'.format(objects=objects, path=path, seconds=seconds, errors=len(errors)))
+
+    def create_objects(self, bucket_name, prefix, objects):
+        s3_client = get_s3_client()
+        with ThreadPoolExecutor(max_workers=settings.AWS_S3_MAX_POOL_CONNECTIONS) as executor:
+            list(executor.map(
+                lambda index: s3_client.put_object(Bucket=bucket_name, Key='{prefix}{index}.png'.format(prefix=prefix, index=index), Body=b''),
+                range(objects),
+            ))
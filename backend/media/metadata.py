@@ -0,0 +1,66 @@
+"""Metadata of the image files (dimensions, size, content type and SHA-256), read once when a file is stored and kept on its row."""
+import hashlib
+import mimetypes
+
+from django.core.files.images import get_image_dimensions
+
+from .handlers import (
+    IMAGE_HEADER_MAX_SIZE,
+    get_image_header_dimensions,
+)
+
+IMAGE_MIME_TYPES = (
+    (b'\x89PNG\r\n\x1a\n', 'image/png', ),
+    (b'GIF8', 'image/gif', ),
+    (b'\xff\xd8', 'image/jpeg', ),
+)
+
+
+def get_image_header_mime_type(head):
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'image/webp'
+    for signature, mime_type in IMAGE_MIME_TYPES:
+        if head.startswith(signature):
+            return mime_type
+    return None
+
+
+def read_image_metadata(file, sha256=None):
+    # The SHA-256 computed by the upload handler while the file was received is passed in, only the header of the file is read then.
+    digest = hashlib.sha256() if sha256 is None else None
+    size = 0
+    head = b''
+    for chunk in file.chunks():
+        if len(head) < IMAGE_HEADER_MAX_SIZE:
+            head += chunk[:IMAGE_HEADER_MAX_SIZE - len(head)]
+        if digest is None:
+            if len(head) >= IMAGE_HEADER_MAX_SIZE:
+                break
+            continue
+        digest.update(chunk)
+        size += len(chunk)
+    width, height = get_image_header_dimensions(head=head) or get_image_dimensions(file)
+    return {
+        'width': width,
+        'height': height,
+        'size': size if digest is not None else file.size,
+        'mime_type': get_image_header_mime_type(head=head) or mimetypes.guess_type(file.name or '')[0] or '',
+        'sha256': digest.hexdigest() if digest is not None else sha256,
+    }
+
+
+def get_image_metadata_fields(prefix, metadata):
+    return {'{prefix}_{name}'.format(prefix=prefix, name=name): value for name, value in metadata.items()}
+
+
+def get_empty_image_metadata():
+    return {'width': None, 'height': None, 'size': None, 'mime_type': '', 'sha256': ''}
+
+
+def get_stored_image_metadata(file, name):
+    # The value kept on the row for a file already in the storage, so the validators of a row saved again never read the file.
+    # None for a new upload, or for a row not backfilled yet.
+    instance = getattr(file, 'instance', None)
+    if instance is None or not getattr(file, '_committed', False):
+        return None
+    return getattr(instance, '{prefix}_{name}'.format(prefix=file.field.name, name=name), None)
@@ -0,0 +1,327 @@
+import fcntl
+import os
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.images import ImageFile
+from django.core.validators import get_available_image_extensions
+from django.db.models import (
+    Manager,
+    Model,
+    BigAutoField,
+    CharField,
+    DateTimeField,
+    ForeignKey,
+    Index,
+    JSONField,
+    PositiveIntegerField,
+    PositiveSmallIntegerField,
+    TextField,
+    CASCADE,
+    F,
+)
+from django.http import UnreadablePostError
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+JOB_STATUS_PENDING = 'pending'
+JOB_STATUS_RUNNING = 'running'
+JOB_STATUS_DONE = 'done'
+JOB_STATUS_FAILED = 'failed'
+JOB_STATUS_CHOICES = [
+    (JOB_STATUS_PENDING, 'pending'),
+    (JOB_STATUS_RUNNING, 'running'),
+    (JOB_STATUS_DONE, 'done'),
+    (JOB_STATUS_FAILED, 'failed'),
+]
+JOB_MAX_ATTEMPTS = 3
+JOB_RETRY_DELAY = 30  # seconds, doubled on every attempt.
+JOB_RUNNING_TIMEOUT = 600  # seconds, a job running for longer belongs to a dead worker and is run again.
+
+
+class JobManager(Manager):
+    pass
+
+
+class JobModel(Model):
+    id = BigAutoField(
+        verbose_name='ID',
+        primary_key=True,
+    )
+    name = CharField(
+        verbose_name='name',
+        max_length=255,
+        null=False,
+        blank=False,
+        help_text='Dotted path of the function that runs the job.',
+    )
+    arguments = JSONField(
+        verbose_name='arguments',
+        default=dict,
+        null=False,
+        blank=True,
+        help_text='Keyword arguments of the function.',
+    )
+    status = CharField(
+        verbose_name='status',
+        max_length=16,
+        choices=JOB_STATUS_CHOICES,
+        default=JOB_STATUS_PENDING,
+        null=False,
+        blank=False,
+    )
+    attempts = PositiveSmallIntegerField(
+        verbose_name='attempts',
+        default=0,
+        null=False,
+        blank=False,
+    )
+    max_attempts = PositiveSmallIntegerField(
+        verbose_name='max attempts',
+        default=JOB_MAX_ATTEMPTS,
+        null=False,
+        blank=False,
+    )
+    run_at = DateTimeField(
+        verbose_name='run at',
+        default=timezone.now,
+        null=False,
+        blank=False,
+        help_text='The job is not run before this time.',
+    )
+    error = TextField(
+        verbose_name='error',
+        default='',
+        null=False,
+        blank=True,
+        help_text='Traceback of the last failed attempt.',
+    )
+    created_at = DateTimeField(
+        verbose_name='created at',
+        auto_now_add=True,
+    )
+    updated_at = DateTimeField(
+        verbose_name='updated at',
+        auto_now=True,
+    )
+
+    objects = JobManager()
+
+    class Meta:
+        db_table = 'mobelux_media_job'
+        ordering = ['run_at', 'id', ]
+        indexes = [
+            Index(fields=['status', 'run_at', ], name='mobelux_media_job_status'),
+        ]
+        verbose_name_plural = 'jobs'
+        verbose_name = 'job'
+        default_permissions = []
+
+    def __str__(self):
+        return '<{name}> <{status}>'.format(name=self.name, status=self.status)
+
+
+def enqueue_job(name, **arguments):
+    return JobModel.objects.create(name=name, arguments=arguments)
+
+
+def claim_jobs(limit):
+    # A job is claimed by a conditional update, so several workers never run the same job.
+    now = timezone.now()
+    job_ids = JobModel.objects.filter(status=JOB_STATUS_PENDING, run_at__lte=now).order_by('run_at', 'id').values_list('id', flat=True)[:limit]
+    claimed_job_ids = []
+    for job_id in list(job_ids):
+        if JobModel.objects.filter(pk=job_id, status=JOB_STATUS_PENDING).update(status=JOB_STATUS_RUNNING, attempts=F('attempts') + 1, updated_at=now):
+            claimed_job_ids.append(job_id)
+    return claimed_job_ids
+
+
+def release_stale_jobs():
+    return JobModel.objects.filter(
+        status=JOB_STATUS_RUNNING,
+        updated_at__lt=timezone.now() - timedelta(seconds=JOB_RUNNING_TIMEOUT),
+    ).update(status=JOB_STATUS_PENDING, updated_at=timezone.now())
+
+
+def run_job(job_id):
+    job = JobModel.objects.get(pk=job_id)
+    try:
+        import_string(job.name)(**job.arguments)
+    except Exception:
+        if job.attempts < job.max_attempts:
+            status = JOB_STATUS_PENDING
+            run_at = timezone.now() + timedelta(seconds=JOB_RETRY_DELAY * 2 ** (job.attempts - 1))
+        else:
+            status = JOB_STATUS_FAILED
+            run_at = job.run_at
+        JobModel.objects.filter(pk=job.pk).update(status=status, run_at=run_at, error=traceback.format_exc(), updated_at=timezone.now())
+        return status
+    JobModel.objects.filter(pk=job.pk).update(status=JOB_STATUS_DONE, error='', updated_at=timezone.now())
+    return JOB_STATUS_DONE
+
+
+class UploadManager(Manager):
+    pass
+
+
+# target: (dotted path of the check that returns the maximum size, dotted path of the function receiving the file).
+UPLOAD_TARGETS = {
+    'image': ('backend.dashboard.models.image_upload_check', 'backend.dashboard.models.image_upload_finish', ),
+    'avatar': ('backend.security.models.profile_avatar_upload_check', 'backend.security.models.profile_avatar_upload_finish', ),
+}
+UPLOAD_TARGET_CHOICES = [(target, target) for target in UPLOAD_TARGETS]
+UPLOAD_EXPIRES = 86400  # seconds, an upload without a new chunk for longer is garbage-collected with its partial file.
+UPLOAD_CHUNK_SIZE = 65536
+
+
+class UploadConflict(Exception):
+    pass
+
+
+class UploadModel(Model):
+    id = BigAutoField(
+        verbose_name='ID',
+        primary_key=True,
+    )
+    target = CharField(
+        verbose_name='target',
+        max_length=32,
+        choices=UPLOAD_TARGET_CHOICES,
+        null=False,
+        blank=False,
+        help_text='What the file is uploaded for.',
+    )
+    arguments = JSONField(
+        verbose_name='arguments',
+        default=dict,
+        null=False,
+        blank=True,
+        help_text='Keyword arguments of the target, the row the file is for.',
+    )
+    filename = CharField(
+        verbose_name='filename',
+        max_length=255,
+        null=False,
+        blank=False,
+    )
+    length = PositiveIntegerField(
+        verbose_name='length',
+        null=False,
+        blank=False,
+        help_text='Size of the complete file, in bytes.',
+    )
+    offset = PositiveIntegerField(
+        verbose_name='offset',
+        default=0,
+        null=False,
+        blank=False,
+        help_text='Number of bytes received so far.',
+    )
+    user = ForeignKey(
+        to=settings.AUTH_USER_MODEL,
+        verbose_name='user',
+        on_delete=CASCADE,
+        related_name='uploads_user',
+        related_query_name='upload_user',
+    )
+    created_at = DateTimeField(
+        verbose_name='created at',
+        auto_now_add=True,
+    )
+    updated_at = DateTimeField(
+        verbose_name='updated at',
+        auto_now=True,
+    )
+
+    objects = UploadManager()
+
+    class Meta:
+        db_table = 'mobelux_media_upload'
+        ordering = ['id', ]
+        indexes = [
+            Index(fields=['updated_at', ], name='mobelux_media_upload_time'),
+        ]
+        verbose_name_plural = 'uploads'
+        verbose_name = 'upload'
+        default_permissions = []
+
+    def __str__(self):
+        return '<{target}> <{offset}/{length}>'.format(target=self.target, offset=self.offset, length=self.length)
+
+    def get_spool_path(self):
+        return get_upload_spool_path(upload_id=self.pk)
+
+    def get_expires_at(self):
+        return self.updated_at + timedelta(seconds=UPLOAD_EXPIRES)
+
+
+def get_upload_spool_path(upload_id):
+    return os.path.join(settings.UPLOAD_SPOOL_ROOT, '{upload_id}.part'.format(upload_id=upload_id))
+
+
+def create_upload(target, arguments, user, filename, length):
+    if target not in UPLOAD_TARGETS:
+        raise ValidationError('Unknown upload target "{target}".'.format(target=target))
+    if os.path.splitext(filename)[1][1:].lower() not in get_available_image_extensions():
+        raise ValidationError('Expected the name of an image file.')
+    max_size = import_string(UPLOAD_TARGETS[target][0])(user=user, arguments=arguments)
+    if not 0 < length <= max_size:
+        raise ValidationError('Maximum file size that can be uploaded is {max_size} KB.'.format(max_size=max_size // 1024))
+    upload = UploadModel.objects.create(target=target, arguments=arguments, user=user, filename=filename, length=length)
+    os.makedirs(settings.UPLOAD_SPOOL_ROOT, exist_ok=True)
+    open(upload.get_spool_path(), 'wb').close()
+    return upload
+
+
+def append_upload(upload, offset, stream):
+    # The bytes received before a dropped connection are kept, so the client resumes from them.
+    if offset != upload.offset:
+        raise UploadConflict('Expected the offset {offset}.'.format(offset=upload.offset))
+    with open(upload.get_spool_path(), 'r+b') as file:
+        try:
+            fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise UploadConflict('Another chunk of the upload is being written.')
+        file.seek(offset)
+        file.truncate()
+        written = 0
+        try:
+            while True:
+                chunk = stream.read(min(UPLOAD_CHUNK_SIZE, upload.length - offset - written + 1))
+                if not chunk:
+                    break
+                if written + len(chunk) > upload.length - offset:
+                    raise ValidationError('The chunk goes past the length of the upload.')
+                file.write(chunk)
+                written += len(chunk)
+        except UnreadablePostError:
+            # The client disconnected, the chunk ends with the bytes written so far.
+            pass
+        finally:
+            file.flush()
+            updated_at = timezone.now()
+            if not UploadModel.objects.filter(pk=upload.pk, offset=offset).update(offset=offset + written, updated_at=updated_at):
+                file.truncate(offset)
+                raise UploadConflict('The upload has been written by another request.')
+    upload.offset = offset + written
+    upload.updated_at = updated_at
+    return upload.offset
+
+
+def finish_upload(upload):
+    # The upload is gone afterwards, an invalid file is uploaded again.
+    try:
+        with open(upload.get_spool_path(), 'rb') as file:
+            import_string(UPLOAD_TARGETS[upload.target][1])(user=upload.user, arguments=upload.arguments, file=ImageFile(file, name=upload.filename))
+    finally:
+        delete_upload(upload=upload)
+
+
+def delete_upload(upload):
+    try:
+        os.remove(upload.get_spool_path())
+    except FileNotFoundError:
+        pass
+    upload.delete()
@@ -0,0 +1,111 @@
+"""Process-wide boto3 session and S3 client shared by the storage helpers, and a short-lived cache of object metadata."""
+import os
+import threading
+import time
+
+import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from django.conf import settings
+
+from ..metrics import increment_counter
+
+# boto3 clients are thread-safe once created, unlike sessions, so the threads of a process share one.
+_s3_lock = threading.Lock()
+_s3_client = None
+_s3_client_pid = None
+
+# Existence and size of the objects, per key, as {key: (expires_at, size or None when missing)}.
+# The writes of this process invalidate their keys, the timeout covers the other processes.
+S3_METADATA_CACHE_TIMEOUT = 5  # seconds.
+S3_METADATA_CACHE_MAX_ENTRIES = 10000
+S3_DELETE_BATCH_SIZE = 1000
+_s3_metadata_lock = threading.Lock()
+_s3_metadata = {}
+
+
+def _reset_s3_client():
+    # A forked process must not use the connections of its parent.
+    global _s3_client, _s3_client_pid
+    _s3_client = None
+    _s3_client_pid = None
+    with _s3_metadata_lock:
+        _s3_metadata.clear()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_s3_client)
+
+
+def get_s3_client():
+    global _s3_client, _s3_client_pid
+    pid = os.getpid()
+    client = _s3_client
+    if client is not None and _s3_client_pid == pid:
+        increment_counter(name='s3.client.reused')
+        return client
+    with _s3_lock:
+        if _s3_client is None or _s3_client_pid != pid:
+            session = boto3.session.Session(
+                aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+                aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+            )
+            _s3_client = session.client(
+                service_name='s3',
+                endpoint_url=settings.AWS_S3_ENDPOINT_URL,
+                config=Config(max_pool_connections=settings.AWS_S3_MAX_POOL_CONNECTIONS),
+            )
+            _s3_client_pid = pid
+            increment_counter(name='s3.client.created')
+        else:
+            increment_counter(name='s3.client.reused')
+        return _s3_client
+
+
+def head_s3_object(bucket_name, key):
+    now = time.monotonic()
+    with _s3_metadata_lock:
+        metadata = _s3_metadata.get(key)
+    if metadata is not None and metadata[0] > now:
+        increment_counter(name='s3.metadata.hit')
+        return metadata[1]
+    increment_counter(name='s3.metadata.miss')
+    try:
+        response = get_s3_client().head_object(Bucket=bucket_name, Key=key)
+    except ClientError as e:
+        if e.response['Error']['Code'] not in ('404', 'NoSuchKey', 'NotFound', ):
+            raise
+        size = None
+    else:
+        size = response['ContentLength']
+    with _s3_metadata_lock:
+        if len(_s3_metadata) >= S3_METADATA_CACHE_MAX_ENTRIES:
+            for expired_key in [expired_key for expired_key, expired_metadata in _s3_metadata.items() if expired_metadata[0] <= now]:
+                del _s3_metadata[expired_key]
+            if len(_s3_metadata) >= S3_METADATA_CACHE_MAX_ENTRIES:
+                _s3_metadata.clear()
+        _s3_metadata[key] = (now + S3_METADATA_CACHE_TIMEOUT, size)
+    return size
+
+
+def invalidate_s3_metadata(prefix):
+    with _s3_metadata_lock:
+        for key in [key for key in _s3_metadata if key.startswith(prefix)]:
+            del _s3_metadata[key]
+
+
+def delete_s3_prefix(bucket_name, prefix):
+    # A listed page and a DeleteObjects request both hold up to 1000 keys.
+    # Returns the keys that could not be deleted, as [{'Key': ..., 'Code': ..., 'Message': ...}, ...].
+    s3_client = get_s3_client()
+    errors = []
+    for page in s3_client.get_paginator('list_objects_v2').paginate(Bucket=bucket_name, Prefix=prefix, PaginationConfig={'PageSize': S3_DELETE_BATCH_SIZE}):
+        keys = [obj['Key'] for obj in page.get('Contents', [])]
+        if not keys:
+            continue
+        response = s3_client.delete_objects(Bucket=bucket_name, Delete={'Objects': [{'Key': key} for key in keys], 'Quiet': True})
+        increment_counter(name='s3.delete.batch')
+        for error in response.get('Errors', []):
+            errors.append({'Key': error.get('Key'), 'Code': error.get('Code'), 'Message': error.get('Message')})
+    invalidate_s3_metadata(prefix=prefix)
+    return errors
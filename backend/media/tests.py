@@ -0,0 +1,236 @@
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from botocore.exceptions import ClientError
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from ..dashboard.models import ImageModel
+from ..metrics import (
+    get_counter,
+    reset_counters,
+)
+from ..testing import (
+    S3StubMixin,
+    TemporaryMediaMixin,
+    create_test_image,
+    create_test_png,
+    create_test_user,
+)
+from . import s3
+from .models import (
+    JOB_MAX_ATTEMPTS,
+    JOB_RETRY_DELAY,
+    JOB_RUNNING_TIMEOUT,
+    JOB_STATUS_DONE,
+    JOB_STATUS_FAILED,
+    JOB_STATUS_PENDING,
+    JOB_STATUS_RUNNING,
+    JobModel,
+    claim_jobs,
+    enqueue_job,
+    release_stale_jobs,
+    run_job,
+)
+
+job_calls = []
+
+
+def record_job(value):
+    job_calls.append(value)
+
+
+def fail_job():
+    raise ValueError('The job failed.')
+
+
+class MediaStorageTests(S3StubMixin, TestCase):
+    def setUp(self):
+        super(MediaStorageTests, self).setUp()
+        cache.clear()
+        reset_counters(prefix='storages.media.url')
+        # The storage classes read the S3 settings when they are imported.
+        from ..storages import MediaStorage
+        self.storage = MediaStorage()
+
+    def test_urls_of_a_window_are_cached(self):
+        with mock.patch('backend.storages.time.time', return_value=7210.0):
+            first = self.storage.url('images/a.png')
+        with mock.patch('backend.storages.time.time', return_value=10000.0):
+            self.assertEqual(self.storage.url('images/a.png'), first)
+        self.assertEqual((get_counter(name='storages.media.url.miss'), get_counter(name='storages.media.url.hit'), ), (1, 1, ))
+        self.assertIn('Expires={expires}'.format(expires=2 * 3600 + 3600 + 300), first)
+        with mock.patch('backend.storages.time.time', return_value=10810.0):
+            self.assertNotEqual(self.storage.url('images/a.png'), first)
+
+    def test_explicit_parameters_bypass_the_cache(self):
+        with mock.patch('backend.storages.time.time', return_value=7210.0):
+            cached = self.storage.url('images/a.png')
+            with mock.patch('backend.storages.cache') as storage_cache:
+                url = self.storage.url('images/a.png', parameters={'ResponseContentDisposition': 'attachment'})
+                self.storage.url('images/a.png', expire=60)
+        storage_cache.get.assert_not_called()
+        storage_cache.set.assert_not_called()
+        self.assertNotEqual(url, cached)
+        self.assertIn('response-content-disposition=attachment', url)
+        self.assertEqual(get_counter(name='storages.media.url.miss'), 1)
+
+
+class S3ClientTests(S3StubMixin, TestCase):
+    def test_client_is_shared_by_the_threads(self):
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            clients = list(executor.map(lambda index: s3.get_s3_client(), range(8)))
+        self.assertTrue(all(client is clients[0] for client in clients))
+
+    def test_client_is_created_again_in_another_process(self):
+        client = s3.get_s3_client()
+        with mock.patch('backend.media.s3.os.getpid', return_value=os.getpid() + 1):
+            self.assertIsNot(s3.get_s3_client(), client)
+
+    def test_fork_resets_the_client_and_the_metadata(self):
+        s3.get_s3_client()
+        s3._s3_metadata['media-files/a.png'] = (float('inf'), 1)
+        pid = os.fork()
+        if pid == 0:
+            os._exit(0 if s3._s3_client is None and not s3._s3_metadata else 1)
+        self.assertEqual(os.waitpid(pid, 0)[1], 0)
+        self.assertIsNotNone(s3._s3_client)
+
+
+class S3MetadataTests(S3StubMixin, TestCase):
+    def setUp(self):
+        super(S3MetadataTests, self).setUp()
+        reset_counters(prefix='s3.metadata')
+
+    def test_head_is_cached_until_invalidated(self):
+        self.stubber.add_response('head_object', {'ContentLength': 10}, {'Bucket': 'test-bucket', 'Key': 'media-files/a.png'})
+        self.stubber.add_client_error('head_object', service_error_code='404', http_status_code=404, expected_params={'Bucket': 'test-bucket', 'Key': 'media-files/b.png'})
+        self.assertEqual(s3.head_s3_object(bucket_name='test-bucket', key='media-files/a.png'), 10)
+        self.assertEqual(s3.head_s3_object(bucket_name='test-bucket', key='media-files/a.png'), 10)
+        self.assertIsNone(s3.head_s3_object(bucket_name='test-bucket', key='media-files/b.png'))
+        self.assertIsNone(s3.head_s3_object(bucket_name='test-bucket', key='media-files/b.png'))
+        self.assertEqual((get_counter(name='s3.metadata.miss'), get_counter(name='s3.metadata.hit'), ), (2, 2, ))
+        s3.invalidate_s3_metadata(prefix='media-files/a')
+        self.stubber.add_response('head_object', {'ContentLength': 20}, {'Bucket': 'test-bucket', 'Key': 'media-files/a.png'})
+        self.assertEqual(s3.head_s3_object(bucket_name='test-bucket', key='media-files/a.png'), 20)
+        self.assertIsNone(s3.head_s3_object(bucket_name='test-bucket', key='media-files/b.png'))
+        self.stubber.assert_no_pending_responses()
+
+    def test_head_is_read_again_once_expired(self):
+        self.stubber.add_response('head_object', {'ContentLength': 10}, {'Bucket': 'test-bucket', 'Key': 'media-files/a.png'})
+        self.stubber.add_response('head_object', {'ContentLength': 20}, {'Bucket': 'test-bucket', 'Key': 'media-files/a.png'})
+        with mock.patch('backend.media.s3.time.monotonic', return_value=100.0):
+            self.assertEqual(s3.head_s3_object(bucket_name='test-bucket', key='media-files/a.png'), 10)
+        with mock.patch('backend.media.s3.time.monotonic', return_value=100.0 + s3.S3_METADATA_CACHE_TIMEOUT):
+            self.assertEqual(s3.head_s3_object(bucket_name='test-bucket', key='media-files/a.png'), 20)
+        self.stubber.assert_no_pending_responses()
+
+    def test_other_errors_are_raised(self):
+        self.stubber.add_client_error('head_object', service_error_code='403', http_status_code=403)
+        with self.assertRaises(ClientError):
+            s3.head_s3_object(bucket_name='test-bucket', key='media-files/a.png')
+        self.assertNotIn('media-files/a.png', s3._s3_metadata)
+
+
+class S3DeleteTests(S3StubMixin, TestCase):
+    def test_pages_are_deleted_in_batches(self):
+        self.stubber.add_response('list_objects_v2', {
+            'Contents': [{'Key': 'media-files/profiles/1/a.png'}, {'Key': 'media-files/profiles/1/b.png'}],
+            'IsTruncated': True,
+            'NextContinuationToken': 'next',
+        }, {'Bucket': 'test-bucket', 'Prefix': 'media-files/profiles/1/', 'MaxKeys': 2})
+        self.stubber.add_response('delete_objects', {}, {
+            'Bucket': 'test-bucket',
+            'Delete': {'Objects': [{'Key': 'media-files/profiles/1/a.png'}, {'Key': 'media-files/profiles/1/b.png'}], 'Quiet': True},
+        })
+        self.stubber.add_response('list_objects_v2', {
+            'Contents': [{'Key': 'media-files/profiles/1/c.png'}],
+            'IsTruncated': False,
+        }, {'Bucket': 'test-bucket', 'Prefix': 'media-files/profiles/1/', 'MaxKeys': 2, 'ContinuationToken': 'next'})
+        self.stubber.add_response('delete_objects', {
+            'Errors': [{'Key': 'media-files/profiles/1/c.png', 'Code': 'AccessDenied', 'Message': 'Access Denied'}],
+        }, {
+            'Bucket': 'test-bucket',
+            'Delete': {'Objects': [{'Key': 'media-files/profiles/1/c.png'}], 'Quiet': True},
+        })
+        s3._s3_metadata['media-files/profiles/1/a.png'] = (float('inf'), 1)
+        with mock.patch('backend.media.s3.S3_DELETE_BATCH_SIZE', 2):
+            errors = s3.delete_s3_prefix(bucket_name='test-bucket', prefix='media-files/profiles/1/')
+        self.assertEqual(errors, [{'Key': 'media-files/profiles/1/c.png', 'Code': 'AccessDenied', 'Message': 'Access Denied'}])
+        self.assertNotIn('media-files/profiles/1/a.png', s3._s3_metadata)
+        self.stubber.assert_no_pending_responses()
+
+    def test_empty_prefix_deletes_nothing(self):
+        self.stubber.add_response('list_objects_v2', {'IsTruncated': False})
+        self.assertEqual(s3.delete_s3_prefix(bucket_name='test-bucket', prefix='media-files/profiles/1/'), [])
+        self.stubber.assert_no_pending_responses()
+
+
+class JobTests(TestCase):
+    def setUp(self):
+        job_calls.clear()
+
+    def test_job_is_claimed_once(self):
+        job = enqueue_job(name='backend.media.tests.record_job', value=1)
+        rival_job_ids = []
+
+        def read_then_claimed_by_a_rival(job_ids):
+            job_ids = [job_id for job_id in job_ids]
+            if not rival_job_ids:
+                rival_job_ids.append(None)
+                rival_job_ids[0] = claim_jobs(limit=10)
+            return job_ids
+
+        with mock.patch('backend.media.models.list', side_effect=read_then_claimed_by_a_rival, create=True):
+            self.assertEqual(claim_jobs(limit=10), [])
+        self.assertEqual(rival_job_ids, [[job.pk]])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, ), (JOB_STATUS_RUNNING, 1, ))
+        self.assertEqual(run_job(job_id=job.pk), JOB_STATUS_DONE)
+        self.assertEqual(job_calls, [1])
+        self.assertEqual(claim_jobs(limit=10), [])
+
+    def test_failed_job_is_retried_with_backoff(self):
+        job = enqueue_job(name='backend.media.tests.fail_job')
+        for attempt in range(1, JOB_MAX_ATTEMPTS + 1):
+            JobModel.objects.filter(pk=job.pk).update(run_at=timezone.now())
+            self.assertEqual(claim_jobs(limit=10), [job.pk])
+            before = timezone.now()
+            status = run_job(job_id=job.pk)
+            job.refresh_from_db()
+            self.assertEqual(job.attempts, attempt)
+            self.assertIn('The job failed.', job.error)
+            if attempt < JOB_MAX_ATTEMPTS:
+                self.assertEqual(status, JOB_STATUS_PENDING)
+                self.assertGreaterEqual(job.run_at, before + timedelta(seconds=JOB_RETRY_DELAY * 2 ** (attempt - 1)))
+                self.assertEqual(claim_jobs(limit=10), [])
+        self.assertEqual(status, JOB_STATUS_FAILED)
+        JobModel.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        self.assertEqual(claim_jobs(limit=10), [])
+
+    def test_jobs_of_a_dead_worker_are_released(self):
+        stale = enqueue_job(name='backend.media.tests.record_job', value='stale')
+        running = enqueue_job(name='backend.media.tests.record_job', value='running')
+        self.assertEqual(claim_jobs(limit=10), [stale.pk, running.pk])
+        JobModel.objects.filter(pk=stale.pk).update(updated_at=timezone.now() - timedelta(seconds=JOB_RUNNING_TIMEOUT + 1))
+        self.assertEqual(release_stale_jobs(), 1)
+        self.assertEqual(claim_jobs(limit=10), [stale.pk])
+        self.assertEqual(JobModel.objects.get(pk=stale.pk).attempts, 2)
+
+
+class BackfillMediaMetadataTests(TemporaryMediaMixin, TestCase):
+    def test_rows_without_metadata_are_filled(self):
+        content = create_test_png(color='red', size=(3, 2))
+        image = create_test_image(user=create_test_user(username='backfill'), title='backfill', content=content)
+        ImageModel.objects.filter(pk=image.pk).update(image_width=None, image_height=None, image_size=None, image_mime_type='', image_sha256='')
+        output = StringIO()
+        call_command('backfill_media_metadata', workers=2, stdout=output)
+        image.refresh_from_db()
+        self.assertEqual((image.image_width, image.image_height, image.image_size, image.image_mime_type, image.image_sha256, ), (3, 2, len(content), 'image/png', hashlib.sha256(content).hexdigest(), ))
+        self.assertIn('1 row(s) updated, 0 file(s) missing or unreadable', output.getvalue())
@@ -0,0 +1,85 @@
+"""Direct uploads: the client sends the file to the storage with a presigned POST, and the app only checks the stored file afterwards."""
+from io import BytesIO
+
+from django.conf import settings
+from django.core import signing
+from django.core.files.images import get_image_dimensions
+from django.core.files.storage import default_storage
+from django.urls import reverse
+
+from .handlers import (
+    IMAGE_HEADER_MAX_SIZE,
+    get_image_header_dimensions,
+)
+from .metadata import get_image_header_mime_type
+from .s3 import (
+    get_s3_client,
+    head_s3_object,
+    invalidate_s3_metadata,
+)
+
+UPLOAD_EXPIRES = 900  # seconds.
+UPLOAD_CONTENT_TYPE_PREFIX = 'image/'
+UPLOAD_HEAD_SIZE = IMAGE_HEADER_MAX_SIZE
+UPLOAD_SIGNING_SALT = 'backend.media.uploads'
+
+
+def get_upload_key(name):
+    return '{location}/{name}'.format(location=settings.MEDIAFILES_LOCATION, name=name)
+
+
+def create_presigned_post(name, max_size):
+    # The storage checks the size and the content type, the file is the last field of the form.
+    if settings.LOCAL is True:
+        policy = signing.dumps({'key': name, 'max_size': max_size, 'content_type': UPLOAD_CONTENT_TYPE_PREFIX}, salt=UPLOAD_SIGNING_SALT)
+        return {'url': reverse('media-upload'), 'fields': {'key': name, 'policy': policy}}
+    else:
+        presigned_post = get_s3_client().generate_presigned_post(
+            Bucket=settings.AWS_STORAGE_BUCKET_NAME,
+            Key=get_upload_key(name=name),
+            Conditions=[
+                ['content-length-range', 1, max_size],
+                ['starts-with', '$Content-Type', UPLOAD_CONTENT_TYPE_PREFIX],
+            ],
+            ExpiresIn=UPLOAD_EXPIRES,
+        )
+        invalidate_s3_metadata(prefix=get_upload_key(name=name))
+        return presigned_post
+
+
+def load_local_policy(policy):
+    # The policy of a local presigned POST, or None when it is forged or expired.
+    try:
+        return signing.loads(policy, salt=UPLOAD_SIGNING_SALT, max_age=UPLOAD_EXPIRES)
+    except signing.BadSignature:
+        return None
+
+
+def get_upload_size(name):
+    # The size of the uploaded file, or None while nothing has been uploaded.
+    if settings.LOCAL is True:
+        return default_storage.size(name) if default_storage.exists(name) else None
+    else:
+        return head_s3_object(bucket_name=settings.AWS_STORAGE_BUCKET_NAME, key=get_upload_key(name=name))
+
+
+def read_upload_head(name, size=UPLOAD_HEAD_SIZE):
+    if settings.LOCAL is True:
+        with default_storage.open(name, 'rb') as file:
+            return file.read(size)
+    else:
+        response = get_s3_client().get_object(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=get_upload_key(name=name), Range='bytes=0-{end}'.format(end=size - 1))
+        return response['Body'].read()
+
+
+def read_upload_header(name):
+    # The dimensions are None when it is not an image header.
+    head = read_upload_head(name=name)
+    width, height = get_image_header_dimensions(head=head) or get_image_dimensions(BytesIO(head))
+    return {'width': width, 'height': height, 'mime_type': get_image_header_mime_type(head=head) or ''}
+
+
+def delete_presigned_upload(name):
+    default_storage.delete(name)
+    if settings.LOCAL is not True:
+        invalidate_s3_metadata(prefix=get_upload_key(name=name))
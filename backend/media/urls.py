@@ -0,0 +1,12 @@
+from django.urls import path
+
+from .views import (
+    UploadView,
+    UploadDetailView,
+)
+
+app_name = 'media'
+urlpatterns = [
+    path(route='uploads/', view=UploadView.as_view(), name='uploads'),
+    path(route='uploads/<int:pk>/', view=UploadDetailView.as_view(), name='upload'),
+]
@@ -0,0 +1,192 @@
+import base64
+import binascii
+import logging
+import os
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.files.storage import default_storage
+from django.http import (
+    HttpResponse,
+    HttpResponseBadRequest,
+    HttpResponseForbidden,
+)
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils.decorators import method_decorator
+from django.utils.http import http_date
+from django.utils.text import get_valid_filename
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.exceptions import (
+    NotFound,
+    ParseError,
+    ValidationError,
+)
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.status import (
+    HTTP_201_CREATED,
+    HTTP_204_NO_CONTENT,
+    HTTP_409_CONFLICT,
+    HTTP_412_PRECONDITION_FAILED,
+    HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+    HTTP_500_INTERNAL_SERVER_ERROR,
+)
+from rest_framework.views import APIView
+
+from .models import (
+    UploadConflict,
+    UploadModel,
+    append_upload,
+    create_upload,
+    delete_upload,
+    finish_upload,
+)
+from .uploads import load_local_policy
+
+TUS_VERSION = '1.0.0'
+TUS_EXTENSIONS = 'creation,expiration,termination'
+
+logger = logging.getLogger(__name__)
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class LocalUploadView(View):
+    # Stands in for the S3 presigned POST in the local mode.
+    def post(self, request, *args, **kwargs):
+        policy = load_local_policy(policy=request.POST.get('policy', ''))
+        if policy is None:
+            return HttpResponseForbidden('Invalid or expired policy.')
+        file = request.FILES.get('file')
+        if file is None or request.POST.get('key') != policy['key']:
+            return HttpResponseBadRequest('Expected the key of the policy and a file.')
+        if not 1 <= file.size <= policy['max_size']:
+            return HttpResponseBadRequest('The file must hold 1 to {max_size} bytes.'.format(max_size=policy['max_size']))
+        if not request.POST.get('Content-Type', '').startswith(policy['content_type']):
+            return HttpResponseBadRequest('The content type must start with "{content_type}".'.format(content_type=policy['content_type']))
+        # Like S3, a second upload under the same key replaces the first one.
+        if default_storage.exists(policy['key']):
+            default_storage.delete(policy['key'])
+        default_storage.save(policy['key'], file)
+        return HttpResponse(status=204)
+
+
+def parse_upload_metadata(value):
+    # The "Upload-Metadata" header of tus: comma separated "key base64(value)" pairs.
+    metadata = {}
+    for pair in value.split(','):
+        parts = pair.strip().split(' ')
+        if not parts[0]:
+            continue
+        try:
+            metadata[parts[0]] = base64.b64decode(parts[1], validate=True).decode('utf-8') if len(parts) > 1 else ''
+        except (binascii.Error, UnicodeDecodeError):
+            raise ParseError('Invalid "Upload-Metadata" header.')
+    return metadata
+
+
+def get_upload_int_header(request, name):
+    try:
+        value = int(request.headers.get(name, ''))
+    except ValueError:
+        raise ParseError('Expected the integer "{name}" header.'.format(name=name))
+    if value < 0:
+        raise ParseError('Expected the integer "{name}" header.'.format(name=name))
+    return value
+
+
+class UploadVersionUnsupported(ParseError):
+    status_code = HTTP_412_PRECONDITION_FAILED
+    default_detail = 'Unsupported version of the tus protocol, expected {version}.'.format(version=TUS_VERSION)
+
+
+class TusMixin:
+    # The core protocol of tus 1.0 (https://tus.io/protocols/resumable-upload), with its creation, expiration and termination extensions.
+    permission_classes = [IsAuthenticated, ]
+
+    def initial(self, request, *args, **kwargs):
+        super(TusMixin, self).initial(request, *args, **kwargs)
+        if request.method != 'OPTIONS' and request.headers.get('Tus-Resumable', TUS_VERSION) != TUS_VERSION:
+            raise UploadVersionUnsupported()
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super(TusMixin, self).finalize_response(request, response, *args, **kwargs)
+        response['Tus-Resumable'] = TUS_VERSION
+        return response
+
+    def options(self, request, *args, **kwargs):
+        response = Response(status=HTTP_204_NO_CONTENT)
+        response['Tus-Version'] = TUS_VERSION
+        response['Tus-Extension'] = TUS_EXTENSIONS
+        return response
+
+    def get_upload_headers(self, upload):
+        return {
+            'Upload-Offset': str(upload.offset),
+            'Upload-Length': str(upload.length),
+            'Upload-Expires': http_date(upload.get_expires_at().timestamp()),
+            'Cache-Control': 'no-store',
+        }
+
+
+class UploadView(TusMixin, APIView):
+    def post(self, request, *args, **kwargs):
+        length = get_upload_int_header(request=request, name='Upload-Length')
+        metadata = parse_upload_metadata(value=request.headers.get('Upload-Metadata', ''))
+        arguments = {}
+        if metadata.get('pk'):
+            if not metadata['pk'].isdigit():
+                raise ParseError('Expected an integer "pk" in the "Upload-Metadata" header.')
+            arguments['pk'] = int(metadata['pk'])
+        try:
+            upload = create_upload(
+                target=metadata.get('target', ''),
+                arguments=arguments,
+                user=request.user,
+                filename=get_valid_filename(os.path.basename(metadata.get('filename', ''))) or 'upload',
+                length=length,
+            )
+        except DjangoValidationError as e:
+            raise ValidationError({'file': e.messages})
+        response = Response(status=HTTP_201_CREATED, headers=self.get_upload_headers(upload=upload))
+        response['Location'] = request.build_absolute_uri(reverse('media:upload', kwargs={'pk': upload.pk}))
+        return response
+
+
+class UploadDetailView(TusMixin, APIView):
+    # HEAD answers the offset to resume from, PATCH appends a chunk at that offset, DELETE cancels the upload.
+    def get_upload(self):
+        return get_object_or_404(UploadModel.objects.all(), pk=self.kwargs['pk'], user__id=self.request.user.id)
+
+    def head(self, request, *args, **kwargs):
+        return Response(status=HTTP_204_NO_CONTENT, headers=self.get_upload_headers(upload=self.get_upload()))
+
+    def patch(self, request, *args, **kwargs):
+        if request.content_type != 'application/offset+octet-stream':
+            return Response(data={'detail': 'Expected the "application/offset+octet-stream" content type.'}, status=HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+        upload = self.get_upload()
+        offset = get_upload_int_header(request=request, name='Upload-Offset')
+        try:
+            append_upload(upload=upload, offset=offset, stream=request.stream)
+        except UploadConflict as e:
+            return Response(data={'detail': str(e)}, status=HTTP_409_CONFLICT, headers=self.get_upload_headers(upload=upload))
+        except DjangoValidationError as e:
+            raise ValidationError({'file': e.messages})
+        except FileNotFoundError:
+            # The partial file was deleted with its expired upload.
+            raise NotFound('Upload not found.')
+        except OSError:
+            # The client resumes from the offset of a HEAD request once the storage is back.
+            logger.exception('The chunk of the upload {pk} could not be written.'.format(pk=upload.pk))
+            return Response(data={'detail': 'The chunk could not be written.'}, status=HTTP_500_INTERNAL_SERVER_ERROR)
+        headers = self.get_upload_headers(upload=upload)
+        if upload.offset == upload.length:
+            try:
+                finish_upload(upload=upload)
+            except DjangoValidationError as e:
+                raise ValidationError({'file': e.messages})
+        return Response(status=HTTP_204_NO_CONTENT, headers=headers)
+
+    def delete(self, request, *args, **kwargs):
+        delete_upload(upload=self.get_upload())
+        return Response(status=HTTP_204_NO_CONTENT)
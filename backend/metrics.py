@@ -0,0 +1,26 @@
+"""Process-wide counters for cache hits, storage round trips and skipped work."""
+import threading
+
+_counters_lock = threading.Lock()
+_counters = {}
+
+
+def increment_counter(name, value=1):
+    with _counters_lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def get_counter(name):
+    with _counters_lock:
+        return _counters.get(name, 0)
+
+
+def get_counters(prefix=''):
+    with _counters_lock:
+        return {name: value for name, value in sorted(_counters.items()) if name.startswith(prefix)}
+
+
+def reset_counters(prefix=''):
+    with _counters_lock:
+        for name in [name for name in _counters if name.startswith(prefix)]:
+            del _counters[name]
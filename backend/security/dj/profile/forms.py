@@ -8,6 +8,10 @@ from django.forms import (
     PasswordInput,
 )
 
+from ....media.handlers import (
+    get_upload_error,
+    get_upload_sha256,
+)
 from .._utils_.forms.helpers import password_validators_help_text_html
 from ...models import ProfileModel
 
@@ -136,6 +140,16 @@ class AvatarForm(ModelForm):
         self.request = kwargs.pop('request')
         super(AvatarForm, self).__init__(*args, **kwargs)
 
+    def clean_avatar(self):
+        error = get_upload_error(request=self.request, field_name='avatar')
+        if error:
+            raise ValidationError(message=error)
+        avatar = self.cleaned_data.get('avatar')
+        sha256 = get_upload_sha256(request=self.request, field_name='avatar')
+        if avatar and sha256:
+            avatar.upload_sha256 = sha256
+        return avatar
+
 
 class LogoutForm(Form):
     def __init__(self, *args, **kwargs):
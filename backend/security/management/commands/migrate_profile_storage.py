@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+from django.db.models import CharField
+from django.db.models.functions import Cast
+
+from ...models import (
+    ProfileModel,
+    PROFILE_AVATAR_CREATE_DERIVATIVES_JOB,
+    enqueue_job,
+    exists_path,
+    move_folder_path,
+    profile_user_folder_name,
+)
+
+
+class Command(BaseCommand):
+    help = 'Moves the storage folders of the profiles still keyed by username to the folders keyed by user id.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only lists the folders that would be moved.')
+
+    def handle(self, *args, **options):
+        moved = 0
+        failed = 0
+        profiles = ProfileModel.objects.exclude(user_folder_name=Cast('user_id', output_field=CharField())).order_by('pk')
+        for profile in profiles.iterator():
+            user_folder_path = profile.get_user_folder_path()
+            new_user_folder_path = profile.get_new_user_folder_path()
+            if user_folder_path == new_user_folder_path:
+                continue
+            self.stdout.write('{user_folder_path} -> {new_user_folder_path}'.format(user_folder_path=user_folder_path, new_user_folder_path=new_user_folder_path))
+            if options['dry_run']:
+                continue
+            errors = move_folder_path(path=user_folder_path, new_path=new_user_folder_path) if exists_path(path=user_folder_path) else []
+            if errors:
+                failed += 1
+                for error in errors:
+                    self.stderr.write('  {key}: {code} {message}'.format(key=error['Key'], code=error['Code'], message=error['Message']))
+                continue
+            avatar_name = profile.get_new_avatar_file_upload_to() if profile.avatar else ''
+            # A queryset update sends no signal, so the profile is not saved (and its storage not checked) once more.
+            ProfileModel.objects.filter(pk=profile.pk).update(user_folder_name=profile_user_folder_name(user_id=profile.user_id), avatar=avatar_name)
+            if avatar_name and not profile.avatar_derivatives_ready:
+                enqueue_job(name=PROFILE_AVATAR_CREATE_DERIVATIVES_JOB, profile_id=profile.pk, avatar_name=avatar_name)
+            moved += 1
+        self.stdout.write('Moved {moved} folder(s), {failed} failed.'.format(moved=moved, failed=failed))
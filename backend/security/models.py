@@ -1,6 +1,8 @@
+import logging
 import os
 import shutil
-import boto3
+import sys
+from concurrent.futures import ThreadPoolExecutor
 from botocore.exceptions import ClientError
 from django.conf import settings
 from django.contrib.auth.models import (
@@ -21,88 +23,147 @@ from django.db.models import (
     ImageField,
     ManyToManyField,
     OneToOneField,
+    PositiveIntegerField,
     CASCADE,
 )
 from django.utils import timezone
 
-MEDIA_FOLDER_PATH = settings.MEDIA_ROOT if settings.LOCAL is True else settings.MEDIAFILES_LOCATION + '/'
-
-
-def get_s3_resource():
-    s3_resource = boto3.resource(
-        service_name='s3',
-        aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-        aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-    )
-    return s3_resource
+from ..counters import CounterFieldsMixin
+from ..metrics import increment_counter
+from ..tracking import TrackedFieldsMixin
+from ..media.derivatives import (
+    DERIVATIVE_THUMBNAIL,
+    DERIVATIVE_MEDIUM,
+    create_derivatives,
+    delete_derivatives,
+    get_derivative_url,
+)
+from ..media.handlers import register_image_upload_limits
+from ..media.metadata import (
+    get_empty_image_metadata,
+    get_image_metadata_fields,
+    get_stored_image_metadata,
+    read_image_metadata,
+)
+from ..media.models import enqueue_job
+from ..media.s3 import (
+    delete_s3_prefix,
+    get_s3_client,
+    head_s3_object,
+    invalidate_s3_metadata,
+)
 
+MEDIA_FOLDER_PATH = settings.MEDIA_ROOT if settings.LOCAL is True else settings.MEDIAFILES_LOCATION + '/'
 
-def get_s3_client(s3_resource):
-    s3_client = s3_resource.meta.client
-    return s3_client
+logger = logging.getLogger(__name__)
 
 
-def get_s3_bucket(s3_resource):
-    s3_bucket = s3_resource.Bucket(name=settings.AWS_STORAGE_BUCKET_NAME)
-    return s3_bucket
+def get_s3_bucket_name():
+    return settings.AWS_STORAGE_BUCKET_NAME
 
 
 def exists_path(path):
     if settings.LOCAL is True:
         return os.path.exists(path=path)
     else:
-        s3_bucket = get_s3_bucket(s3_resource=get_s3_resource())
         try:
-            s3_bucket.Object(key=path).get()
-        except ClientError as e:
-            if e.response['Error']['Code'] == 'NoSuchKey':
-                # The object does not exist.
-                return False
-            else:
-                # Something else has gone wrong.
-                raise Exception('Something else has gone wrong')
-        else:
-            return True
+            return head_s3_object(bucket_name=get_s3_bucket_name(), key=path) is not None
+        except ClientError:
+            # Something else has gone wrong.
+            raise Exception('Something else has gone wrong')
+
+
+def get_path_size(path):
+    if settings.LOCAL is True:
+        return os.path.getsize(path) if os.path.isfile(path) else None
+    else:
+        return head_s3_object(bucket_name=get_s3_bucket_name(), key=path)
 
 
 def create_folder_path(path):
     if settings.LOCAL is True:
         os.mkdir(path=path)
     else:
-        s3_resource = get_s3_resource()
-        s3_client = get_s3_client(s3_resource=s3_resource)
-        s3_bucket = get_s3_bucket(s3_resource=s3_resource)
-        s3_client.put_object(Bucket=s3_bucket.name, Key=path)
+        get_s3_client().put_object(Bucket=get_s3_bucket_name(), Key=path)
+        invalidate_s3_metadata(prefix=path)
+
+
+def delete_local_path(path):
+    # Returns the paths that could not be removed, as [{'Key': ..., 'Code': ..., 'Message': ...}, ...], like delete_s3_prefix.
+    errors = []
+
+    def onerror(function, error_path, exc_info):
+        errors.append({'Key': error_path, 'Code': exc_info[0].__name__, 'Message': str(exc_info[1])})
+
+    if os.path.isdir(path):
+        shutil.rmtree(path=path, onerror=onerror)
+    else:
+        try:
+            os.remove(path=path)
+        except OSError:
+            onerror(function=os.remove, error_path=path, exc_info=sys.exc_info())
+    return errors
+
+
+def log_delete_errors(path, errors):
+    # The save goes on, the leftovers are logged.
+    for error in errors or []:
+        logger.error('Could not delete %s while deleting %s: %s %s', error['Key'], path, error['Code'], error['Message'])
+    return errors
 
 
 def delete_folder_path(path):
     if settings.LOCAL is True:
-        shutil.rmtree(path=path)
+        return delete_local_path(path=path)
     else:
-        s3_resource = get_s3_resource()
-        s3_bucket = get_s3_bucket(s3_resource=s3_resource)
-        for obj in s3_bucket.objects.filter(Prefix=path):
-            s3_resource.Object(bucket_name=s3_bucket.name, key=obj.key).delete()
+        return delete_s3_prefix(bucket_name=get_s3_bucket_name(), prefix=path)
 
 
 def delete_file_path(path):
     if settings.LOCAL is True:
-        os.remove(path=path)
+        return delete_local_path(path=path)
     else:
-        s3_resource = get_s3_resource()
-        s3_bucket = get_s3_bucket(s3_resource=s3_resource)
-        for obj in s3_bucket.objects.filter(Prefix=path):
-            s3_resource.Object(bucket_name=s3_bucket.name, key=obj.key).delete()
+        return delete_s3_prefix(bucket_name=get_s3_bucket_name(), prefix=path)
 
 
 def move_file_path(path, new_path):
     if settings.LOCAL is True:
         os.rename(path, new_path)
     else:
-        s3_resource = get_s3_resource()
-        s3_bucket = get_s3_bucket(s3_resource=s3_resource)
-        # The source in CopySource=source had to be a full path from the bucket root to the actual file instead of a dictionary of bucket name and key.
-        s3_resource.Object(bucket_name=s3_bucket.name, key=new_path).copy_from(CopySource=s3_bucket.name + '/' + path)
+        s3_client = get_s3_client()
+        s3_client.copy_object(Bucket=get_s3_bucket_name(), Key=new_path, CopySource={'Bucket': get_s3_bucket_name(), 'Key': path})
+        s3_client.delete_object(Bucket=get_s3_bucket_name(), Key=path)
+        invalidate_s3_metadata(prefix=path)
+        invalidate_s3_metadata(prefix=new_path)
+
+
+def move_folder_path(path, new_path):
+    # Returns the objects that could not be moved, like delete_folder_path.
+    if settings.LOCAL is True:
+        if os.path.exists(path=new_path):
+            shutil.rmtree(path=new_path)
+        os.rename(path, new_path)
+        return []
+    else:
+        s3_client = get_s3_client()
+        keys = []
+        for page in s3_client.get_paginator('list_objects_v2').paginate(Bucket=get_s3_bucket_name(), Prefix=path):
+            keys.extend(obj['Key'] for obj in page.get('Contents', []))
+
+        def copy_key(key):
+            try:
+                s3_client.copy_object(Bucket=get_s3_bucket_name(), Key=new_path + key[len(path):], CopySource={'Bucket': get_s3_bucket_name(), 'Key': key})
+            except ClientError as e:
+                return {'Key': key, 'Code': e.response['Error']['Code'], 'Message': e.response['Error']['Message']}
+            return None
+
+        with ThreadPoolExecutor(max_workers=settings.AWS_S3_MAX_POOL_CONNECTIONS) as executor:
+            errors = [error for error in executor.map(copy_key, keys) if error is not None]
+        invalidate_s3_metadata(prefix=new_path)
+        if errors:
+            # The source is kept whole, so the move can be run again.
+            return errors
+        return delete_folder_path(path=path)
 
 
 class UserManager(AuthUserManager):
@@ -213,30 +274,66 @@ PROFILE_AVATAR_FILE_EXT = 'png'
 PROFILE_AVATAR_MAX_WIDTH = 960
 PROFILE_AVATAR_MAX_HEIGHT = 960
 PROFILE_AVATAR_MAX_SIZE = 102400 // 1024  # 1048576bytes==1mb, 102400bytes==100kb
+register_image_upload_limits(field_name='avatar', max_size=PROFILE_AVATAR_MAX_SIZE, max_width=PROFILE_AVATAR_MAX_WIDTH, max_height=PROFILE_AVATAR_MAX_HEIGHT)
+
+
+def profile_user_folder_name(user_id):
+    # The folder of a user is keyed by its id, which never changes, so renaming a user never touches the storage.
+    return '{user_id}'.format(user_id=user_id)
 
 
 def profile_avatar_file_upload_to(instance, filename):
     file_upload_to = instance.get_avatar_file_upload_to()
     file_path = instance.get_avatar_file_path()
     if exists_path(path=file_path):
-        delete_file_path(path=file_path)
+        log_delete_errors(path=file_path, errors=delete_file_path(path=file_path))
     return file_upload_to
 
 
 def profile_avatar_validate_size(avatar):
-    size = avatar.size // 1024
+    size = get_stored_image_metadata(file=avatar, name='size')
+    size = (avatar.size if size is None else size) // 1024
     if size > PROFILE_AVATAR_MAX_SIZE:
         raise ValidationError('Maximum file size that can be uploaded is {max_size} KB.'.format(max_size=PROFILE_AVATAR_MAX_SIZE))
 
 
 def profile_avatar_validate_dimension(avatar):
-    width = avatar.width
-    height = avatar.height
+    width = get_stored_image_metadata(file=avatar, name='width')
+    height = get_stored_image_metadata(file=avatar, name='height')
+    if width is None or height is None:
+        width = avatar.width
+        height = avatar.height
     if width > PROFILE_AVATAR_MAX_WIDTH or height > PROFILE_AVATAR_MAX_HEIGHT:
         raise ValidationError('Dimensions are larger than what is allowed: {max_width}x{max_height} pixels.'.format(max_width=PROFILE_AVATAR_MAX_WIDTH, max_height=PROFILE_AVATAR_MAX_HEIGHT))
 
 
-class ProfileModel(Model):
+def profile_avatar_upload_check(user, arguments):
+    # Called when a resumable upload of the avatar of the user starts, returns the maximum size of the file.
+    return PROFILE_AVATAR_MAX_SIZE * 1024
+
+
+def profile_avatar_upload_finish(user, arguments, file):
+    # Called with the complete file of a resumable upload, which goes through the validators of the avatar field like a form upload.
+    profile_avatar_validate_size(file)
+    profile_avatar_validate_dimension(file)
+    profile = ProfileModel.objects.get(user__id=user.id)
+    profile.avatar = file
+    profile.save()
+
+
+def profile_avatar_create_derivatives_job(profile_id, avatar_name):
+    # An avatar uploaded or moved since has its own job.
+    profile = ProfileModel.objects.filter(pk=profile_id, avatar=avatar_name).first()
+    if profile is None:
+        return
+    metadata = create_derivatives(field_file=profile.avatar)
+    ProfileModel.objects.filter(pk=profile_id, avatar=avatar_name).update(avatar_derivatives_ready=True, **get_image_metadata_fields(prefix='avatar', metadata=metadata))
+
+
+PROFILE_AVATAR_CREATE_DERIVATIVES_JOB = 'backend.security.models.profile_avatar_create_derivatives_job'
+
+
+class ProfileModel(CounterFieldsMixin, TrackedFieldsMixin, Model):
     user = OneToOneField(
         to=UserModel,
         on_delete=CASCADE,
@@ -258,6 +355,66 @@ class ProfileModel(Model):
         ],
         help_text='Maximum file size that can be uploaded is {max_size} KB. Maximum dimensions: {max_width}x{max_height} pixels.'.format(max_size=PROFILE_AVATAR_MAX_SIZE, max_width=PROFILE_AVATAR_MAX_WIDTH, max_height=PROFILE_AVATAR_MAX_HEIGHT),
     )
+    avatar_derivatives_ready = BooleanField(
+        verbose_name='avatar derivatives ready',
+        default=False,
+        null=False,
+        blank=False,
+        help_text='Designates whether the thumbnail and medium derivatives of the avatar have been created.',
+    )
+    avatar_width = PositiveIntegerField(
+        verbose_name='avatar width',
+        null=True,
+        blank=True,
+        default=None,
+        help_text='Width of the avatar in pixels, stored when the avatar is uploaded.',
+    )
+    avatar_height = PositiveIntegerField(
+        verbose_name='avatar height',
+        null=True,
+        blank=True,
+        default=None,
+        help_text='Height of the avatar in pixels, stored when the avatar is uploaded.',
+    )
+    avatar_size = PositiveIntegerField(
+        verbose_name='avatar size',
+        null=True,
+        blank=True,
+        default=None,
+        help_text='Size of the avatar in bytes, stored when the avatar is uploaded.',
+    )
+    avatar_mime_type = CharField(
+        verbose_name='avatar MIME type',
+        max_length=64,
+        null=False,
+        blank=True,
+        default='',
+    )
+    avatar_sha256 = CharField(
+        verbose_name='avatar SHA-256',
+        max_length=64,
+        null=False,
+        blank=True,
+        default='',
+        help_text='SHA-256 of the content of the avatar, in hex.',
+    )
+    album_count = PositiveIntegerField(
+        verbose_name='album count',
+        default=0,
+        null=False,
+        blank=False,
+        help_text='Number of albums of the user, kept by the dashboard.',
+    )
+    image_count = PositiveIntegerField(
+        verbose_name='image count',
+        default=0,
+        null=False,
+        blank=False,
+        help_text='Number of images of the user, kept by the dashboard.',
+    )
+
+    tracked_fields = ('user_folder_name', 'avatar', )
+    counter_fields = ('album_count', 'image_count', )
 
     class Meta:
         db_table = 'mobelux_security_profile'
@@ -278,7 +435,7 @@ class ProfileModel(Model):
     def get_new_user_folder_upload_to(self):
         return '{profiles_folder_name}{new_user_folder_name}'.format(
             profiles_folder_name=PROFILES_FOLDER_NAME + '/',
-            new_user_folder_name=self.user.username + '/',
+            new_user_folder_name=profile_user_folder_name(user_id=self.user_id) + '/',
         )
 
     def get_avatar_file_upload_to(self):
@@ -307,11 +464,27 @@ class ProfileModel(Model):
     def get_new_avatar_file_path(self):
         return MEDIA_FOLDER_PATH + self.get_new_avatar_file_upload_to()
 
+    def get_avatar_thumbnail_url(self):
+        if not self.avatar_derivatives_ready:
+            return self.avatar.url if self.avatar else None
+        return get_derivative_url(field_file=self.avatar, derivative=DERIVATIVE_THUMBNAIL)
+
+    def get_avatar_medium_url(self):
+        if not self.avatar_derivatives_ready:
+            return self.avatar.url if self.avatar else None
+        return get_derivative_url(field_file=self.avatar, derivative=DERIVATIVE_MEDIUM)
+
     def signal_profilemodel_pre_save(self):
+        # Only a new profile, a new or cleared avatar, or a folder still keyed by username needs the storage.
+        if not self.has_changed() and self.user_folder_name == profile_user_folder_name(user_id=self.user_id):
+            increment_counter(name='security.profile.storage_skipped')
+            self.avatar_derivatives_pending = False
+            return
         user_folder_path = self.get_user_folder_path()
         new_user_folder_path = self.get_new_user_folder_path()
         avatar_file_path = self.get_avatar_file_path()
         new_avatar_file_path = self.get_new_avatar_file_path()
+        avatar_name = self.avatar.name if self.avatar else None
         if not exists_path(path=user_folder_path):
             create_folder_path(path=user_folder_path)
         if user_folder_path == new_user_folder_path:
@@ -319,22 +492,41 @@ class ProfileModel(Model):
                 if self.avatar:
                     self.avatar.name = self.get_avatar_file_upload_to()
                 else:
-                    delete_file_path(path=avatar_file_path)
+                    log_delete_errors(path=avatar_file_path, errors=delete_file_path(path=avatar_file_path))
+                    delete_derivatives(storage=self.avatar.storage, name=self.get_avatar_file_upload_to())
         else:
             if exists_path(path=new_user_folder_path):
-                delete_folder_path(path=new_user_folder_path)
+                log_delete_errors(path=new_user_folder_path, errors=delete_folder_path(path=new_user_folder_path))
             create_folder_path(path=new_user_folder_path)
             if exists_path(path=avatar_file_path):
                 if self.avatar:
                     move_file_path(path=avatar_file_path, new_path=new_avatar_file_path)
                     self.avatar.name = self.get_new_avatar_file_upload_to()
                 else:
-                    delete_file_path(path=avatar_file_path)
+                    log_delete_errors(path=avatar_file_path, errors=delete_file_path(path=avatar_file_path))
             else:
                 if self.avatar:
                     self.avatar.name = None
-            delete_folder_path(path=user_folder_path)
-            self.user_folder_name = self.user.username
+            log_delete_errors(path=user_folder_path, errors=delete_folder_path(path=user_folder_path))
+            self.user_folder_name = profile_user_folder_name(user_id=self.user_id)
+        # A moved avatar needs new derivatives, the old ones are gone with its old folder.
+        self.avatar_derivatives_pending = bool(self.avatar) and (not self.avatar._committed or self.avatar.name != avatar_name)
+        if self.avatar_derivatives_pending or not self.avatar:
+            self.avatar_derivatives_ready = False
+        # A moved avatar keeps its metadata, only a new upload is read.
+        if self.avatar and not self.avatar._committed:
+            self.set_avatar_metadata(metadata=read_image_metadata(file=self.avatar, sha256=getattr(self.avatar.file, 'upload_sha256', None)))
+        elif not self.avatar:
+            self.set_avatar_metadata(metadata=get_empty_image_metadata())
+
+    def set_avatar_metadata(self, metadata):
+        for name, value in get_image_metadata_fields(prefix='avatar', metadata=metadata).items():
+            setattr(self, name, value)
+
+    def signal_profilemodel_post_save(self):
+        if getattr(self, 'avatar_derivatives_pending', False):
+            enqueue_job(name=PROFILE_AVATAR_CREATE_DERIVATIVES_JOB, profile_id=self.pk, avatar_name=self.avatar.name)
+        self.avatar_derivatives_pending = False
 
 
 class UserGroupModel(Model):
@@ -4,17 +4,28 @@ from django.db.models.signals import (
     pre_save,
 )
 from django.dispatch import receiver
-from .models import ProfileModel
+
+from ..metrics import increment_counter
+from .models import (
+    ProfileModel,
+    profile_user_folder_name,
+)
 
 
 @receiver(signal=post_save, sender=get_user_model())
 def signal_usermodel_post_save(sender, instance, created, **kwargs):
     if created or not hasattr(instance, 'profile'):
-        ProfileModel(user=instance, user_folder_name=instance.username).save()
+        ProfileModel(user=instance, user_folder_name=profile_user_folder_name(user_id=instance.pk)).save()
     else:
-        instance.profile.save()
+        # The profile folders are keyed by user id, so logins, password changes and renames leave the profile as it is.
+        increment_counter(name='security.profile.save_skipped')
 
 
 @receiver(signal=pre_save, sender=ProfileModel)
 def signal_profilemodel_pre_save(sender, instance, **kwargs):
     instance.signal_profilemodel_pre_save()
+
+
+@receiver(signal=post_save, sender=ProfileModel)
+def signal_profilemodel_post_save(sender, instance, **kwargs):
+    instance.signal_profilemodel_post_save()
@@ -1,3 +1,132 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from ..testing import (
+    S3StubMixin,
+    TemporaryMediaMixin,
+    create_test_png,
+    create_test_user,
+)
+from .models import (
+    ProfileModel,
+    create_folder_path,
+    delete_file_path,
+    delete_local_path,
+    exists_path,
+    move_file_path,
+    move_folder_path,
+    profile_user_folder_name,
+)
+
+
+class ProfileStorageTests(TemporaryMediaMixin, TestCase):
+    def test_delete_errors_of_a_save_are_logged(self):
+        user = create_test_user(username='storage')
+        ProfileModel.objects.filter(user=user).update(user_folder_name='storage')
+        profile = ProfileModel.objects.get(user=user)
+        errors = [{'Key': 'profiles/storage/avatar.png', 'Code': 'AccessDenied', 'Message': 'Access Denied'}]
+        with mock.patch('backend.security.models.delete_local_path', side_effect=lambda path: delete_local_path(path=path) or errors):
+            with self.assertLogs('backend.security.models', level='ERROR') as logs:
+                profile.save()
+        self.assertTrue(any('profiles/storage/avatar.png' in output and 'AccessDenied' in output for output in logs.output))
+
+
+class UserSaveTests(TemporaryMediaMixin, TestCase):
+    def test_rename_writes_the_user_only(self):
+        user = create_test_user(username='before')
+        user = get_user_model().objects.get(pk=user.pk)
+        user.username = 'after'
+        with CaptureQueriesContext(connection) as queries:
+            user.save()
+        self.assertEqual([query['sql'].split(' ')[0] for query in queries.captured_queries if not query['sql'].startswith('SELECT')], ['UPDATE'])
+        self.assertEqual(ProfileModel.objects.get(user=user).user_folder_name, profile_user_folder_name(user_id=user.pk))
+
+
+class TrackedFieldsTests(TemporaryMediaMixin, TestCase):
+    def setUp(self):
+        super(TrackedFieldsTests, self).setUp()
+        self.user = create_test_user(username='tracked')
+
+    def test_deferred_field_is_changed(self):
+        profile = ProfileModel.objects.defer('avatar').get(user=self.user)
+        self.assertFalse(profile.is_tracked(name='avatar'))
+        self.assertTrue(profile.has_changed('avatar'))
+        self.assertFalse(profile.has_changed('user_folder_name'))
+
+    def test_uncommitted_file_is_changed(self):
+        profile = ProfileModel.objects.get(user=self.user)
+        self.assertFalse(profile.has_changed())
+        profile.avatar = ContentFile(create_test_png(color='red'), name='avatar.png')
+        self.assertTrue(profile.has_changed('avatar'))
+        self.assertFalse(profile.has_changed('user_folder_name'))
+
+    def test_save_resets_the_tracked_values(self):
+        profile = ProfileModel.objects.get(user=self.user)
+        profile.avatar = ContentFile(create_test_png(color='red'), name='avatar.png')
+        profile.save()
+        self.assertFalse(profile.has_changed())
+        self.assertEqual(profile.get_tracked_value(name='avatar'), profile.avatar.name)
+        self.assertTrue(profile.avatar.name)
+
+
+class S3ProfileStorageTests(S3StubMixin, TestCase):
+    def head(self, key, exists):
+        if exists:
+            self.stubber.add_response('head_object', {'ContentLength': 0}, {'Bucket': 'test-bucket', 'Key': key})
+        else:
+            self.stubber.add_client_error('head_object', service_error_code='404', http_status_code=404, expected_params={'Bucket': 'test-bucket', 'Key': key})
+
+    def test_writes_invalidate_the_cached_heads(self):
+        self.head(key='media-files/profiles/1/', exists=False)
+        self.assertFalse(exists_path(path='media-files/profiles/1/'))
+        self.assertFalse(exists_path(path='media-files/profiles/1/'))
+        self.stubber.add_response('put_object', {}, {'Bucket': 'test-bucket', 'Key': 'media-files/profiles/1/'})
+        create_folder_path(path='media-files/profiles/1/')
+        self.head(key='media-files/profiles/1/', exists=True)
+        self.assertTrue(exists_path(path='media-files/profiles/1/'))
+
+        self.head(key='media-files/profiles/1/avatar.png', exists=True)
+        self.head(key='media-files/profiles/2/avatar.png', exists=False)
+        self.assertTrue(exists_path(path='media-files/profiles/1/avatar.png'))
+        self.assertFalse(exists_path(path='media-files/profiles/2/avatar.png'))
+        self.stubber.add_response('copy_object', {}, {'Bucket': 'test-bucket', 'Key': 'media-files/profiles/2/avatar.png', 'CopySource': {'Bucket': 'test-bucket', 'Key': 'media-files/profiles/1/avatar.png'}})
+        self.stubber.add_response('delete_object', {}, {'Bucket': 'test-bucket', 'Key': 'media-files/profiles/1/avatar.png'})
+        move_file_path(path='media-files/profiles/1/avatar.png', new_path='media-files/profiles/2/avatar.png')
+        self.head(key='media-files/profiles/1/avatar.png', exists=False)
+        self.head(key='media-files/profiles/2/avatar.png', exists=True)
+        self.assertFalse(exists_path(path='media-files/profiles/1/avatar.png'))
+        self.assertTrue(exists_path(path='media-files/profiles/2/avatar.png'))
+
+        self.stubber.add_response('list_objects_v2', {'Contents': [{'Key': 'media-files/profiles/2/avatar.png'}], 'IsTruncated': False})
+        self.stubber.add_response('delete_objects', {})
+        self.assertEqual(delete_file_path(path='media-files/profiles/2/avatar.png'), [])
+        self.head(key='media-files/profiles/2/avatar.png', exists=False)
+        self.assertFalse(exists_path(path='media-files/profiles/2/avatar.png'))
+        self.stubber.assert_no_pending_responses()
+
+    def list_folder(self, keys):
+        self.stubber.add_response('list_objects_v2', {'Contents': [{'Key': key} for key in keys], 'IsTruncated': False}, {'Bucket': 'test-bucket', 'Prefix': 'media-files/profiles/old/'})
+
+    def copy(self, name):
+        return {'Bucket': 'test-bucket', 'Key': 'media-files/profiles/1/' + name, 'CopySource': {'Bucket': 'test-bucket', 'Key': 'media-files/profiles/old/' + name}}
+
+    def test_failed_folder_move_keeps_the_source(self):
+        self.list_folder(keys=['media-files/profiles/old/a.png', 'media-files/profiles/old/b.png'])
+        self.stubber.add_response('copy_object', {}, self.copy(name='a.png'))
+        self.stubber.add_client_error('copy_object', service_error_code='AccessDenied', service_message='Access Denied', http_status_code=403, expected_params=self.copy(name='b.png'))
+        errors = move_folder_path(path='media-files/profiles/old/', new_path='media-files/profiles/1/')
+        self.assertEqual(errors, [{'Key': 'media-files/profiles/old/b.png', 'Code': 'AccessDenied', 'Message': 'Access Denied'}])
+        self.stubber.assert_no_pending_responses()
 
-# Create your tests here.
+    def test_folder_move_deletes_the_source(self):
+        self.list_folder(keys=['media-files/profiles/old/a.png'])
+        self.stubber.add_response('copy_object', {}, self.copy(name='a.png'))
+        self.stubber.add_response('list_objects_v2', {'Contents': [{'Key': 'media-files/profiles/old/a.png'}], 'IsTruncated': False})
+        self.stubber.add_response('delete_objects', {}, {'Bucket': 'test-bucket', 'Delete': {'Objects': [{'Key': 'media-files/profiles/old/a.png'}], 'Quiet': True}})
+        self.assertEqual(move_folder_path(path='media-files/profiles/old/', new_path='media-files/profiles/1/'), [])
+        self.stubber.assert_no_pending_responses()
@@ -62,6 +62,7 @@ INSTALLED_APPS = [
     # Apps.
     'backend.security.apps.SecurityConfig',
     'backend.dashboard.apps.DashboardConfig',
+    'backend.media.apps.MediaConfig',
 ]
 
 # List of middleware to use.
@@ -102,6 +103,17 @@ else:
         }
     }
 
+# Cache.
+#   https://docs.djangoproject.com/en/3.1/topics/cache/
+# The local-memory backend is per process, a bumped generation is not seen by the other processes.
+# Use the file-based backend or a shared one when running several processes.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('DJANGO_SETTINGS_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('DJANGO_SETTINGS_CACHE_LOCATION', ''),
+    }
+}
+
 # A list containing the settings for all template engines to be used with Django.
 # Each item of the list is a dictionary containing the options for an individual engine.
 TEMPLATES = [
@@ -156,6 +168,10 @@ else:
     AWS_ACCESS_KEY_ID = os.getenv('DJANGO_SETTINGS_AWS_ACCESS_KEY_ID', '')
     AWS_SECRET_ACCESS_KEY = os.getenv('DJANGO_SETTINGS_AWS_SECRET_ACCESS_KEY', '')
     AWS_S3_CUSTOM_DOMAIN = '{aws_storage_bucket_name}.s3.amazonaws.com'.format(aws_storage_bucket_name=AWS_STORAGE_BUCKET_NAME)
+    # One connection per thread of the gthread workers (NumThreads in .ebextensions/django.config), which share the S3 client of their process.
+    AWS_S3_MAX_POOL_CONNECTIONS = int(os.getenv('DJANGO_SETTINGS_AWS_S3_MAX_POOL_CONNECTIONS', '15'))
+    # Endpoint of an S3 compatible service (a local stand-in, for example), None for AWS.
+    AWS_S3_ENDPOINT_URL = os.getenv('DJANGO_SETTINGS_AWS_S3_ENDPOINT_URL') or None
 
     STATICFILES_LOCATION = 'static-files'
     STATICFILES_STORAGE = 'backend.storages.StaticStorage'
@@ -165,6 +181,19 @@ else:
     DEFAULT_FILE_STORAGE = 'backend.storages.MediaStorage'
     MEDIA_URL = 'https://{aws_s3_custom_domain}/{mediafiles_location}/'.format(aws_s3_custom_domain=AWS_S3_CUSTOM_DOMAIN, mediafiles_location=MEDIAFILES_LOCATION)
 
+# Upload handlers.
+#   https://docs.djangoproject.com/en/3.1/ref/settings/#file-upload-handlers
+# The first one skips an image over the size or the dimensions allowed by its field while it is received, before it is kept in memory or in a temporary file.
+FILE_UPLOAD_HANDLERS = [
+    'backend.media.handlers.ImageUploadLimitHandler',
+    'django.core.files.uploadhandler.MemoryFileUploadHandler',
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+
+# Folder of the partial files of the resumable uploads, the chunks of an upload are appended to its file until it is complete.
+# Every process answering the uploads must see the same folder, a shared volume when running several instances.
+UPLOAD_SPOOL_ROOT = os.getenv('DJANGO_SETTINGS_UPLOAD_SPOOL_ROOT') or os.path.join(BASE_DIR, 'cdn', 'upload-spool')
+
 # The custom model as the default user model for the django project.
 AUTH_USER_MODEL = 'security.UserModel'
 # A list of authentication backend classes (as strings) to use when attempting to authenticate a user.
@@ -198,4 +227,7 @@ LOGOUT_REDIRECT_URL = 'index'
 
 # Django REST Framework (DRF).
 REST_FRAMEWORK = {
+    # The page size can be changed per request up to the max_page_size of the pagination class.
+    'DEFAULT_PAGINATION_CLASS': 'backend.dashboard.drf.paginations.KeysetPagination',
+    'PAGE_SIZE': int(os.getenv('DJANGO_SETTINGS_API_PAGE_SIZE', '50')),
 }
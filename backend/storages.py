@@ -1,7 +1,13 @@
 """Custom storage classes for static and media files."""
+import hashlib
+import time
+
 from django.conf import settings
+from django.core.cache import cache
 from storages.backends.s3boto3 import S3Boto3Storage
 
+from .metrics import increment_counter
+
 
 class StaticStorage(S3Boto3Storage):
     """Custom storage class for static files."""
@@ -12,8 +18,27 @@ class StaticStorage(S3Boto3Storage):
 
 
 class MediaStorage(S3Boto3Storage):
-    """Custom storage class for media files."""
+    """Custom storage class for media files, with presigned urls cached per expiry window."""
     custom_domain = None
     location = settings.MEDIAFILES_LOCATION
     file_overwrite = False
     default_acl = 'private'
+    # The urls signed in the same window are shared, so browsers can reuse their cached image responses.
+    url_cache_window = 3600
+    url_cache_margin = 300
+
+    def url(self, name, parameters=None, expire=None, http_method=None):
+        if parameters or expire is not None or http_method is not None:
+            return super(MediaStorage, self).url(name=name, parameters=parameters, expire=expire, http_method=http_method)
+        now = int(time.time())
+        window = now // self.url_cache_window
+        key = 'storages.media.url:{window}:{name}'.format(window=window, name=hashlib.sha1(name.encode('utf-8')).hexdigest())
+        url = cache.get(key)
+        if url is not None:
+            increment_counter(name='storages.media.url.hit')
+            return url
+        increment_counter(name='storages.media.url.miss')
+        window_end = (window + 1) * self.url_cache_window
+        url = super(MediaStorage, self).url(name=name, expire=window_end + self.url_cache_margin - now)
+        cache.set(key, url, timeout=window_end - now)
+        return url
@@ -0,0 +1,88 @@
+"""Helpers shared by the tests of the apps."""
+import os
+import shutil
+import tempfile
+from io import BytesIO
+from unittest import mock
+
+from botocore.stub import Stubber
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.test import override_settings
+from PIL import Image
+
+from .dashboard.models import ImageModel
+from .media.s3 import (
+    _reset_s3_client,
+    get_s3_client,
+)
+from .security.models import PROFILES_FOLDER_NAME
+
+# The S3 settings with fake credentials, the requests are answered by a botocore Stubber.
+S3_TEST_SETTINGS = {
+    'LOCAL': False,
+    'AWS_STORAGE_BUCKET_NAME': 'test-bucket',
+    'AWS_ACCESS_KEY_ID': 'test',
+    'AWS_SECRET_ACCESS_KEY': 'test',
+    'AWS_S3_REGION_NAME': 'us-east-1',
+    'AWS_S3_MAX_POOL_CONNECTIONS': 1,
+    'AWS_S3_ENDPOINT_URL': None,
+    'STATICFILES_LOCATION': 'static-files',
+    'MEDIAFILES_LOCATION': 'media-files',
+}
+
+
+def create_test_user(username):
+    """Creates a user and its profile, the password is the username."""
+    get_user_model().objects.create_user(username=username, password=username)
+    return get_user_model().objects.get(username=username)
+
+
+def create_test_png(color, size=(2, 2)):
+    """Returns the content of a PNG file filled with the color."""
+    output = BytesIO()
+    Image.new(mode='RGB', size=size, color=color).save(output, format='PNG')
+    return output.getvalue()
+
+
+def create_test_image(user, title, album=None, content=None):
+    """Creates an image of the user, with a file when its content is given."""
+    image = ImageModel(title=title, album=album, user=user)
+    if content is not None:
+        image.image = ContentFile(content, name='{title}.png'.format(title=title))
+    image.save()
+    return image
+
+
+class TemporaryMediaMixin:
+    """TestCase mixin that stores the media of every test in a temporary folder, the profile folders and the partial uploads included."""
+
+    def setUp(self):
+        super(TemporaryMediaMixin, self).setUp()
+        media_root = tempfile.mkdtemp() + '/'
+        self.addCleanup(shutil.rmtree, media_root, True)
+        media_settings = override_settings(MEDIA_ROOT=media_root, UPLOAD_SPOOL_ROOT=os.path.join(media_root, 'upload-spool'))
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        # The profile folders are created in the folder of the profiles, which the deployments create beforehand.
+        os.mkdir(os.path.join(media_root, PROFILES_FOLDER_NAME))
+        if settings.LOCAL is True:
+            media_folder_path = mock.patch('backend.security.models.MEDIA_FOLDER_PATH', media_root)
+            media_folder_path.start()
+            self.addCleanup(media_folder_path.stop)
+
+
+class S3StubMixin:
+    """TestCase mixin that runs the test with the S3 settings and a stubbed S3 client, self.stubber answers its requests."""
+
+    def setUp(self):
+        super(S3StubMixin, self).setUp()
+        s3_settings = override_settings(**S3_TEST_SETTINGS)
+        s3_settings.enable()
+        self.addCleanup(s3_settings.disable)
+        _reset_s3_client()
+        self.addCleanup(_reset_s3_client)
+        self.stubber = Stubber(get_s3_client())
+        self.stubber.activate()
+        self.addCleanup(self.stubber.deactivate)
@@ -0,0 +1,52 @@
+"""Tracking of the field values a model instance was loaded with, to skip the work of saves that change nothing relevant."""
+from django.db.models.fields.files import FieldFile
+
+
+class TrackedFieldsMixin:
+    """Model mixin that remembers the loaded values of tracked_fields, until the next save."""
+    tracked_fields = ()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(TrackedFieldsMixin, cls).from_db(db, field_names, values)
+        instance.reset_tracked_fields()
+        return instance
+
+    def save(self, *args, **kwargs):
+        super(TrackedFieldsMixin, self).save(*args, **kwargs)
+        # The post_save receivers have run inside the save and could still see what changed.
+        self.reset_tracked_fields()
+
+    def reset_tracked_fields(self):
+        self._tracked_values = {}
+        for name in self.tracked_fields:
+            attname = self._meta.get_field(name).attname
+            # A deferred field is not loaded just to be tracked, it is then reported as changed.
+            if attname in self.__dict__:
+                self._tracked_values[name] = self._get_tracked_value(name=name)
+
+    def _get_tracked_value(self, name):
+        value = getattr(self, self._meta.get_field(name).attname)
+        if isinstance(value, FieldFile):
+            return value.name or ''
+        return value
+
+    def get_tracked_value(self, name):
+        return getattr(self, '_tracked_values', {}).get(name)
+
+    def is_tracked(self, name):
+        return name in getattr(self, '_tracked_values', {})
+
+    def has_changed(self, *names):
+        if self._state.adding:
+            return True
+        tracked_values = getattr(self, '_tracked_values', {})
+        for name in names or self.tracked_fields:
+            if name not in tracked_values:
+                return True
+            value = getattr(self, self._meta.get_field(name).attname)
+            if isinstance(value, FieldFile) and not value._committed:
+                return True
+            if self._get_tracked_value(name=name) != tracked_values[name]:
+                return True
+        return False
@@ -6,7 +6,11 @@ from django.urls import (
     path,
 )
 
-from .views import IndexView
+from .media.views import LocalUploadView
+from .views import (
+    IndexView,
+    MetricsView,
+)
 
 urlpatterns = [
     path(route='', view=IndexView.as_view(), name='index'),
@@ -25,6 +29,8 @@ urlpatterns = [
             [
                 path(route='security/', view=include('backend.security.drf.urls')),
                 path(route='dashboard/', view=include('backend.dashboard.drf.urls')),
+                path(route='media/', view=include('backend.media.urls')),
+                path(route='metrics/', view=MetricsView.as_view(), name='metrics'),
             ]
         )
     ),
@@ -32,5 +38,6 @@ urlpatterns = [
 ]
 
 if settings.LOCAL is True:
+    urlpatterns += [path(route='media-upload/', view=LocalUploadView.as_view(), name='media-upload')]
     urlpatterns += static(prefix=settings.STATIC_URL, document_root=settings.STATIC_ROOT)
     urlpatterns += static(prefix=settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
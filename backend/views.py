@@ -1,7 +1,26 @@
 from django.views.generic.base import RedirectView
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.status import (
+    HTTP_200_OK
+)
+from rest_framework.views import APIView
+
+from .metrics import get_counters
 
 
 class IndexView(RedirectView):
     pattern_name = 'security.dj:profile:index'
     permanent = False
     query_string = True
+
+
+class MetricsView(APIView):
+    permission_classes = [IsAdminUser, ]
+
+    def get(self, request, *args, **kwargs):
+        # The counters belong to the worker process that answers the request.
+        data = {
+            'counters': get_counters(prefix=request.query_params.get('prefix', '')),
+        }
+        return Response(data=data, status=HTTP_200_OK)